@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Order analytics computed in the database.
+
+Reports aggregate with GROUP BY and window functions in a single query
+rather than loading orders and looping over them in Python, and cover whole
+days only, so a report can be cached until midnight (UTC).
+
+Time-in-status figures read status_intervals, which is derived from
+order_status_history with a LEAD() window per order and refreshed
+incrementally: only orders with history newer than the stored high-water
+mark are recomputed. rep_monthly_rollups likewise only recomputes the months
+touched by orders updated since its last run. Both run as background jobs
+(see jobs.py), or by hand with:
+
+    python3 analytics.py
+"""
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import case, delete, func, literal_column, or_, select
+from models import (db, Order, OrderStatusHistory, Store, Phone, RatePlan, User, StatusInterval,
+                    AnalyticsState, RepMonthlyRollup)
+from cache import reports
+from outbox import handler
+
+# Stages an order moves through on its way to activation
+FUNNEL_STAGES = ('New', 'Pending Activation', 'Activated')
+# Statuses an order is expected to leave; time spent in them is what gets flagged
+OPEN_STATUSES = ('New', 'Pending Activation')
+# Re-read history this far behind the last refresh, to catch rows whose
+# transaction committed after a later id had already been processed
+REFRESH_LOOKBACK = timedelta(minutes=10)
+REFRESH_BATCH = 500
+# Used as the stuck threshold until a status has history to take a p90 from
+DEFAULT_STUCK_AFTER = timedelta(hours=24)
+
+StatusDurations = namedtuple('StatusDurations', 'status count p50_hours p90_hours')
+Funnel = namedtuple('Funnel', 'orders pending activated lost')
+RepMonth = namedtuple('RepMonth', 'rank user_id name orders_created orders_activated device_revenue plan_revenue')
+StuckOrder = namedtuple('StuckOrder', 'order_id order_number store_location status entered_at hours threshold_hours')
+
+StorePerformance = namedtuple('StorePerformance', [
+    'store_id', 'name', 'city', 'province',
+    'orders', 'orders_per_day', 'activated', 'activation_rate',
+    'cancel_rate', 'return_rate', 'mean_hours_to_activate',
+    'orders_rank', 'activation_rank',
+])
+
+
+def epoch_seconds(column):
+    """SQL expression for a DateTime column as seconds since the epoch, per dialect"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return func.julianday(column) * 86400.0
+    if dialect in ('mysql', 'mariadb'):
+        return func.unix_timestamp(column)
+    return func.extract('epoch', column)
+
+
+def report_window(days):
+    """(start, end) covering the last `days` complete days, ending at midnight today (UTC)"""
+    end = datetime.combine(datetime.utcnow().date(), time.min)
+    return end - timedelta(days=days), end
+
+
+def _rate(part, whole):
+    return part / whole if whole else None
+
+
+def store_performance(days=30):
+    """
+    Ranked per-store metrics for orders created in the last `days` complete days.
+
+    Returns [StorePerformance] for every active store, best first by order
+    count. Time to activation runs from the order's 'New' history entry (or
+    created_at) to its first 'Activated' entry.
+    """
+    start, end = report_window(days)
+    key = ('store-performance', start, days)
+    cached = reports.get(key)
+    if cached is not None:
+        return cached
+
+    # First entry into New / Activated per order, from the status history
+    transitions = (
+        select(
+            OrderStatusHistory.order_id,
+            func.min(case((OrderStatusHistory.new_status == 'New', OrderStatusHistory.changed_at))).label('new_at'),
+            func.min(case((OrderStatusHistory.new_status == 'Activated', OrderStatusHistory.changed_at))).label('activated_at'),
+        )
+        .join(Order, Order.id == OrderStatusHistory.order_id)
+        .where(Order.created_at >= start, Order.created_at < end)
+        .group_by(OrderStatusHistory.order_id)
+        .subquery()
+    )
+    started_at = func.coalesce(transitions.c.new_at, Order.created_at)
+    time_to_activate = epoch_seconds(transitions.c.activated_at) - epoch_seconds(started_at)
+
+    order_count = func.count(Order.id)
+    activated = func.count(transitions.c.activated_at)
+    stmt = (
+        select(
+            Store.id, Store.name, Store.city, Store.province,
+            order_count.label('orders'),
+            activated.label('activated'),
+            func.sum(case((Order.status == 'Cancelled', 1), else_=0)).label('cancelled'),
+            func.sum(case((Order.status == 'Returned', 1), else_=0)).label('returned'),
+            func.avg(time_to_activate).label('mean_seconds'),
+            func.rank().over(order_by=order_count.desc()).label('orders_rank'),
+            # Stores without orders have no rate and tie for last
+            func.rank().over(
+                order_by=func.coalesce(activated * 1.0 / func.nullif(order_count, 0), -1).desc()
+            ).label('activation_rank'),
+        )
+        .select_from(Store)
+        .outerjoin(Order, (Order.store_id == Store.id)
+                   & (Order.created_at >= start) & (Order.created_at < end))
+        .outerjoin(transitions, transitions.c.order_id == Order.id)
+        .where(Store.is_active == True)
+        .group_by(Store.id, Store.name, Store.city, Store.province)
+        .order_by(literal_column('orders_rank'), Store.name)
+    )
+
+    result = []
+    for row in db.session.execute(stmt):
+        result.append(StorePerformance(
+            store_id=row.id, name=row.name, city=row.city, province=row.province,
+            orders=row.orders,
+            orders_per_day=row.orders / days,
+            activated=row.activated,
+            activation_rate=_rate(row.activated, row.orders),
+            cancel_rate=_rate(row.cancelled or 0, row.orders),
+            return_rate=_rate(row.returned or 0, row.orders),
+            mean_hours_to_activate=row.mean_seconds / 3600 if row.mean_seconds is not None else None,
+            orders_rank=row.orders_rank,
+            activation_rank=row.activation_rank,
+        ))
+    reports.set(key, result)
+    return result
+
+
+def _write_intervals(*criteria):
+    """
+    INSERT ... SELECT status history as intervals: each entry is closed by
+    the order's next entry (LEAD). Notes that leave the status unchanged
+    (e.g. carrier rejections) are skipped. Returns the number of intervals written.
+    """
+    history = OrderStatusHistory.__table__
+    window = dict(partition_by=history.c.order_id, order_by=(history.c.changed_at, history.c.id))
+    left_at = func.lead(history.c.changed_at, type_=history.c.changed_at.type).over(**window)
+    intervals = (
+        select(
+            history.c.id.label('history_id'),
+            history.c.order_id,
+            history.c.new_status.label('status'),
+            func.lead(history.c.new_status, type_=history.c.new_status.type).over(**window).label('next_status'),
+            history.c.changed_at.label('entered_at'),
+            left_at.label('left_at'),
+            (epoch_seconds(left_at) - epoch_seconds(history.c.changed_at)).label('seconds'),
+        )
+        .where(history.c.changed_at.isnot(None), history.c.old_status != history.c.new_status, *criteria)
+    )
+    table = StatusInterval.__table__
+    return db.session.execute(
+        table.insert().from_select([c.name for c in intervals.selected_columns], intervals)
+    ).rowcount
+
+
+def refresh_status_intervals():
+    """Bring status_intervals up to date with order_status_history; return the number of intervals written"""
+    state = db.session.get(AnalyticsState, 'status_intervals')
+    if state is None:
+        state = AnalyticsState(name='status_intervals', high_water=0)
+    started = datetime.utcnow()
+    history = OrderStatusHistory.__table__
+    high_water = db.session.execute(select(func.max(history.c.id))).scalar() or 0
+
+    if state.refreshed_at is None:
+        # First build: one pass over the whole history
+        db.session.execute(delete(StatusInterval))
+        written = _write_intervals()
+    else:
+        changed = or_(history.c.id > state.high_water,
+                      history.c.changed_at >= state.refreshed_at - REFRESH_LOOKBACK)
+        order_ids = db.session.execute(
+            select(history.c.order_id).where(changed).distinct().order_by(history.c.order_id)
+        ).scalars().all()
+        written = 0
+        for i in range(0, len(order_ids), REFRESH_BATCH):
+            batch = order_ids[i:i + REFRESH_BATCH]
+            # Recompute whole orders: a new entry closes the interval before it
+            db.session.execute(delete(StatusInterval).where(StatusInterval.order_id.in_(batch)))
+            written += _write_intervals(history.c.order_id.in_(batch))
+            db.session.commit()
+
+    # Rows committed later with lower ids are caught by REFRESH_LOOKBACK next time
+    state = db.session.merge(state)
+    state.high_water = max(high_water, state.high_water or 0)
+    state.refreshed_at = started
+    db.session.commit()
+    return written
+
+
+@handler('order.created', 'order.status_changed')
+def refresh_order_intervals(payload):
+    """Outbox handler: rebuild one order's intervals right after it changes"""
+    order_id = payload['order_id']
+    db.session.execute(delete(StatusInterval).where(StatusInterval.order_id == order_id))
+    _write_intervals(OrderStatusHistory.order_id == order_id)
+
+
+def status_intervals_refreshed_at():
+    """
+    When the status_intervals job last ran, or None before its first build.
+    Pages only read: the job and the outbox handler are the only writers, so
+    a page request never races them rewriting the same orders.
+    """
+    return db.session.query(AnalyticsState.refreshed_at).filter_by(name='status_intervals').scalar()
+
+
+def _percentile_seconds(status, start, count, fraction):
+    """Nearest-rank percentile of closed interval lengths, read straight off the (status, seconds) index"""
+    return db.session.execute(
+        select(StatusInterval.seconds)
+        .where(StatusInterval.status == status,
+               StatusInterval.seconds.isnot(None),
+               StatusInterval.entered_at >= start)
+        .order_by(StatusInterval.seconds)
+        .limit(1)
+        .offset(int(fraction * (count - 1)))
+    ).scalar()
+
+
+def time_in_status(days=90):
+    """[StatusDurations] with p50/p90 hours spent in each status, for intervals entered in the window"""
+    start, end = report_window(days)
+    key = ('time-in-status', start, days)
+    cached = reports.get(key)
+    if cached is not None:
+        return cached
+
+    counts = db.session.execute(
+        select(StatusInterval.status, func.count())
+        .where(StatusInterval.seconds.isnot(None), StatusInterval.entered_at >= start)
+        .group_by(StatusInterval.status)
+    ).all()
+    result = []
+    for status, count in sorted(counts, key=lambda c: _status_order(c[0])):
+        p50 = _percentile_seconds(status, start, count, 0.5)
+        p90 = _percentile_seconds(status, start, count, 0.9)
+        result.append(StatusDurations(status, count, p50 / 3600, p90 / 3600))
+    reports.set(key, result)
+    return result
+
+
+def _status_order(status):
+    return (FUNNEL_STAGES.index(status) if status in FUNNEL_STAGES else len(FUNNEL_STAGES), status)
+
+
+def activation_funnel(days=30):
+    """
+    Funnel for orders created in the window. An order counts as having
+    reached a stage if it reached that stage or a later one, so orders
+    activated without passing through Pending Activation still convert.
+    """
+    start, end = report_window(days)
+    key = ('funnel', start, days)
+    cached = reports.get(key)
+    if cached is not None:
+        return cached
+
+    def reached(*statuses):
+        return func.max(case((StatusInterval.status.in_(statuses), 1), else_=0))
+
+    per_order = (
+        select(
+            StatusInterval.order_id,
+            reached('Pending Activation', 'Activated').label('pending'),
+            reached('Activated').label('activated'),
+            reached('Cancelled', 'Returned').label('lost'),
+        )
+        .join(Order, Order.id == StatusInterval.order_id)
+        .where(Order.created_at >= start, Order.created_at < end)
+        .group_by(StatusInterval.order_id)
+        .subquery()
+    )
+    row = db.session.execute(
+        select(func.count(), func.sum(per_order.c.pending), func.sum(per_order.c.activated),
+               func.sum(per_order.c.lost))
+    ).one()
+    result = Funnel(row[0], row[1] or 0, row[2] or 0, row[3] or 0)
+    reports.set(key, result)
+    return result
+
+
+def stuck_orders(limit=50):
+    """
+    Orders sitting in an open status for longer than that status's p90,
+    longest first. Reads only open intervals through ix_status_intervals_open.
+    """
+    now = datetime.utcnow()
+    p90 = {d.status: timedelta(hours=d.p90_hours) for d in time_in_status()}
+    stuck = []
+    for status in OPEN_STATUSES:
+        threshold = max(p90.get(status, DEFAULT_STUCK_AFTER), timedelta(minutes=1))
+        rows = db.session.execute(
+            select(StatusInterval.order_id, StatusInterval.entered_at,
+                   Order.order_number, Order.store_location)
+            .join(Order, Order.id == StatusInterval.order_id)
+            .where(StatusInterval.status == status,
+                   StatusInterval.left_at.is_(None),
+                   StatusInterval.entered_at < now - threshold)
+            .order_by(StatusInterval.entered_at)
+            .limit(limit)
+        ).all()
+        stuck.extend(
+            StuckOrder(row.order_id, row.order_number, row.store_location, status, row.entered_at,
+                       (now - row.entered_at).total_seconds() / 3600, threshold.total_seconds() / 3600)
+            for row in rows
+        )
+    return sorted(stuck, key=lambda s: s.entered_at)[:limit]
+
+
+
+def month_start(value):
+    """First day of value's month, as a date"""
+    return date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _rollup_month(month):
+    """Recompute every rep's row for one month with two grouped queries"""
+    start = datetime.combine(month, time.min)
+    end = datetime.combine(next_month(month), time.min)
+    totals = {}
+
+    created = db.session.execute(
+        select(Order.user_id, func.count())
+        .where(Order.created_at >= start, Order.created_at < end)
+        .group_by(Order.user_id)
+    )
+    for user_id, count in created:
+        totals[user_id] = {'orders_created': count}
+
+    activated = db.session.execute(
+        select(Order.user_id, func.count(), func.sum(Phone.full_price), func.sum(RatePlan.monthly_price))
+        .join(Phone, Phone.id == Order.phone_id)
+        .join(RatePlan, RatePlan.id == Order.rate_plan_id)
+        .where(Order.activation_date >= start, Order.activation_date < end)
+        .group_by(Order.user_id)
+    )
+    for user_id, count, device, plan in activated:
+        totals.setdefault(user_id, {}).update(
+            orders_activated=count, device_revenue=device or 0, plan_revenue=plan or 0
+        )
+
+    db.session.execute(delete(RepMonthlyRollup).where(RepMonthlyRollup.month == month))
+    if totals:
+        now = datetime.utcnow()
+        db.session.execute(RepMonthlyRollup.__table__.insert(), [
+            {
+                'month': month, 'user_id': user_id, 'updated_at': now,
+                'orders_created': values.get('orders_created', 0),
+                'orders_activated': values.get('orders_activated', 0),
+                'device_revenue': values.get('device_revenue', 0),
+                'plan_revenue': values.get('plan_revenue', 0),
+            }
+            for user_id, values in totals.items()
+        ])
+    db.session.commit()
+
+
+def refresh_rep_rollups():
+    """Recompute the months touched by orders changed since the last run; return the months refreshed"""
+    state = db.session.get(AnalyticsState, 'rep_monthly_rollups')
+    if state is None:
+        state = AnalyticsState(name='rep_monthly_rollups', high_water=0)
+    started = datetime.utcnow()
+
+    if state.refreshed_at is None:
+        first = db.session.execute(select(func.min(Order.created_at))).scalar()
+        months = set()
+        if first is not None:
+            month = month_start(first)
+            while month <= month_start(started):
+                months.add(month)
+                month = next_month(month)
+    else:
+        # Orders bump updated_at on creation and on every status change
+        rows = db.session.execute(
+            select(Order.created_at, Order.activation_date)
+            .where(Order.updated_at >= state.refreshed_at - REFRESH_LOOKBACK)
+        )
+        months = {month_start(value) for row in rows for value in row if value is not None}
+
+    for month in sorted(months):
+        _rollup_month(month)
+
+    state = db.session.merge(state)
+    state.refreshed_at = started
+    db.session.commit()
+    return len(months)
+
+
+def rollup_months():
+    """Months with rollup rows, newest first"""
+    return db.session.execute(
+        select(RepMonthlyRollup.month).distinct().order_by(RepMonthlyRollup.month.desc())
+    ).scalars().all()
+
+
+def rep_leaderboard(month):
+    """[RepMonth] for one month from the rollup table, ranked by activations then revenue"""
+    names = dict(User.choices())
+    rows = db.session.execute(
+        select(RepMonthlyRollup)
+        .where(RepMonthlyRollup.month == month)
+        .order_by(RepMonthlyRollup.orders_activated.desc(),
+                  (RepMonthlyRollup.device_revenue + RepMonthlyRollup.plan_revenue).desc(),
+                  RepMonthlyRollup.orders_created.desc())
+    ).scalars().all()
+    return [
+        RepMonth(rank, row.user_id, names.get(row.user_id, f'User {row.user_id}'),
+                 row.orders_created, row.orders_activated, row.device_revenue, row.plan_revenue)
+        for rank, row in enumerate(rows, start=1)
+    ]
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        intervals = refresh_status_intervals()
+        months = refresh_rep_rollups()
+    print(f"✓ Wrote {intervals} status intervals and refreshed {months} monthly rollups")
@@ -1,6 +1,19 @@
+import hashlib
+import inspect
+import os
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import config
 from models import db
+from schema import upgrade_schema
+from sessions import init_sessions
+from auth import init_current_user, get_current_user
+from conditional import template_fingerprint
+from assets import init_assets
+from compression import CompressionMiddleware
+from fragments import init_fragment_cache
+from versions import ensure_versions
 from routes.auth import auth_bp
 from routes.orders import orders_bp
 from routes.customers import customers_bp
@@ -8,12 +21,45 @@ from routes.phones import phones_bp
 from routes.rate_plans import rate_plans_bp
 from routes.stores import stores_bp
 from routes.about import about_bp
+from routes.reports import reports_bp
+from routes.api import api_bp
+from routes.track import track_bp
 from routes.init import init_bp
 
+def configure_templates(app):
+    """Jinja settings shared by the app and the template precompiler (warmup.py)"""
+    # Drop the indentation and blank lines left by block tags from rendered HTML
+    app.jinja_env.trim_blocks = True
+    app.jinja_env.lstrip_blocks = True
+    init_fragment_cache(app)
+    
+    # Compiled templates are shared by all workers through the filesystem.
+    # Their file names carry a hash of the settings that shape compiled code,
+    # so a deploy that changes them never loads bytecode built under the old ones.
+    bytecode_dir = app.config['TEMPLATE_BYTECODE_DIR'] or os.path.join(app.instance_path, 'jinja_bytecode')
+    os.makedirs(bytecode_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+        bytecode_dir, f'__jinja2_{compile_fingerprint(app.jinja_env)}_%s.cache')
+
+def compile_fingerprint(env):
+    """Hash of the Jinja options and extension code that compiled templates depend on"""
+    digest = hashlib.sha1()
+    digest.update(repr((
+        env.trim_blocks, env.lstrip_blocks, env.keep_trailing_newline, env.newline_sequence,
+        env.block_start_string, env.block_end_string, env.variable_start_string,
+        env.variable_end_string, env.comment_start_string, env.comment_end_string,
+        env.line_statement_prefix, env.line_comment_prefix, env.optimized,
+    )).encode())
+    for name, extension in sorted(env.extensions.items()):
+        digest.update(name.encode())
+        digest.update(inspect.getsource(type(extension)).encode())
+    return digest.hexdigest()[:12]
+
 def create_app(config_name='default'):
     """Application factory pattern"""
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    configure_templates(app)
     
     # Initialize extensions
     db.init_app(app)
@@ -25,25 +71,51 @@ def create_app(config_name='default'):
     app.register_blueprint(phones_bp, url_prefix='/phones')
     app.register_blueprint(rate_plans_bp, url_prefix='/rate-plans')
     app.register_blueprint(stores_bp, url_prefix='/stores')
+    app.register_blueprint(reports_bp, url_prefix='/reports')
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+    app.register_blueprint(track_bp, url_prefix='/track')
     app.register_blueprint(about_bp, url_prefix='')
     app.register_blueprint(init_bp, url_prefix='')
     
-    # Create database tables
+    # Create database tables and bring older databases up to date
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+        ensure_versions()
+    
+    # Serve fingerprinted, precompressed static files when assets.py has been run
+    init_assets(app)
+    
+    # Changes whenever templates or assets change, so ETags from an older deploy never match
+    app.config['TEMPLATE_FINGERPRINT'] = template_fingerprint(app)
+    
+    # Keep sessions server-side so role changes and sign-outs apply immediately
+    init_sessions(app, db)
+    init_current_user(app)
+    
+    # Behind nginx, take the client address from X-Forwarded-For (rate limits are per address)
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+    
+    if app.config['COMPRESS_RESPONSES']:
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app,
+            min_size=app.config['COMPRESS_MIN_SIZE'],
+            gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+            brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'],
+        )
     
     # Root route redirects to orders
     @app.route('/')
     def index():
-        from flask import redirect, url_for, session
-        if 'user_id' in session:
+        from flask import redirect, url_for
+        if get_current_user() is not None:
             return redirect(url_for('orders.list_orders'))
         return redirect(url_for('auth.login'))
     
     return app
 
 if __name__ == '__main__':
-    import os
     env = os.environ.get('FLASK_ENV', 'development')
     app = create_app(env)
     # Use port 5001 to avoid conflict with macOS AirPlay Receiver on port 5000
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Static asset pipeline
+
+Copies every file in static/ to static/build/ under a content-hashed name
+(css/styles.css -> build/css/styles.3f2a9c1b7d4e.css), writes .gz and .br
+variants next to each copy, and records the mapping in
+static/build/manifest.json.
+
+With a manifest present, url_for('static', filename='css/styles.css')
+resolves to the fingerprinted file, which is served with far-future
+immutable caching and the precompressed variant matching Accept-Encoding.
+Without one (local development), plain static files are served as before.
+
+Usage:
+    python3 assets.py
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; only .gz variants are written without it
+    brotli = None
+
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'manifest.json'
+# Text formats worth precompressing; images and fonts are already compressed
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def build_assets(static_folder):
+    """Fingerprint and precompress everything in static_folder; return the manifest"""
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    if os.path.isdir(build_root):
+        shutil.rmtree(build_root)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != build_root)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            base, ext = os.path.splitext(logical)
+            fingerprinted = f'{BUILD_DIR}/{base}.{digest}{ext}'
+            target = os.path.join(static_folder, fingerprinted)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(content)
+
+            if ext.lower() in COMPRESSIBLE:
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(content, quality=11))
+
+            manifest[logical] = fingerprinted
+
+    with open(os.path.join(build_root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Return the asset manifest, or an empty dict if assets have not been built"""
+    path = os.path.join(static_folder, BUILD_DIR, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def init_assets(app):
+    """Resolve static URLs through the manifest and serve built assets precompressed"""
+    manifest = load_manifest(app.static_folder)
+    app.config['ASSET_MANIFEST'] = manifest
+    if not manifest:
+        return
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def static(filename):
+        if not filename.startswith(BUILD_DIR + '/'):
+            return app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accepted = request.accept_encodings
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[candidate] and os.path.exists(os.path.join(app.static_folder, filename + suffix)):
+                encoding = candidate
+                filename += suffix
+                break
+
+        response = send_from_directory(app.static_folder, filename, mimetype=mimetype,
+                                       max_age=IMMUTABLE_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+
+
+if __name__ == '__main__':
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    built = build_assets(static_folder)
+    print(f"✓ Built {len(built)} assets into static/{BUILD_DIR}/")
+    for logical, fingerprinted in sorted(built.items()):
+        print(f"  {logical} -> {fingerprinted}")
+    if brotli is None:
+        print("  (brotli not installed - wrote .gz variants only)")
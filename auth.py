@@ -1,28 +1,108 @@
 from functools import wraps
-from flask import session, redirect, url_for, flash
+from flask import session, redirect, url_for, flash, g, jsonify
+from werkzeug.local import LocalProxy
+from cache import current_users
+
+
+class CurrentUser:
+    """Read-only snapshot of the signed-in user, shared across requests until users.version changes"""
+
+    __slots__ = ('id', 'first_name', 'role', 'store_id', 'version')
+
+    def __init__(self, id, first_name, role, store_id, version):
+        self.id = id
+        self.first_name = first_name
+        self.role = role
+        self.store_id = store_id
+        self.version = version
+
+    def has_role(self, role):
+        """Admins pass every role check"""
+        return self.role == role or self.role == 'admin'
+
+    def __repr__(self):
+        return f'<CurrentUser {self.first_name}>'
+
+
+def _load_current_user():
+    """
+    Build the CurrentUser for this request.
+
+    The server-side session (sessions.py) already loaded the user's record,
+    so normally this runs no query; the snapshot is reused across requests
+    for as long as the user's version is unchanged.
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+
+    record = getattr(session, 'user', None)
+    if record is None:
+        # Session interface without a user record: fall back to the database
+        from models import User
+        user = User.query.get(user_id)
+        if user is None or not user.is_active:
+            return None
+        record = {'id': user.id, 'first_name': user.first_name, 'role': user.role,
+                  'store_id': user.store_id, 'version': user.version}
+
+    key = (record['id'], record['version'])
+    current = current_users.get(key)
+    if current is None:
+        current = CurrentUser(record['id'], record['first_name'], record['role'],
+                              record['store_id'], record['version'])
+        current_users.set(key, current)
+    return current
+
+
+def get_current_user():
+    """Return the signed-in CurrentUser (or None), loading it at most once per request"""
+    if 'current_user' not in g:
+        g.current_user = _load_current_user()
+    return g.current_user
+
+
+current_user = LocalProxy(get_current_user)
+
+
+def init_current_user(app):
+    """Expose current_user to every template"""
+    @app.context_processor
+    def inject_current_user():
+        return {'current_user': get_current_user()}
+
 
 def login_required(f):
     """Decorator to require login for routes"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if get_current_user() is None:
             flash('Please log in to access this page.', 'warning')
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
     return decorated_function
 
+def api_login_required(f):
+    """Like login_required, but answers 401 JSON instead of redirecting to the login page"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if get_current_user() is None:
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 def role_required(required_role):
     """Decorator to require specific role for routes"""
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if 'user_role' not in session:
+            user = get_current_user()
+            if user is None:
                 flash('Please log in to access this page.', 'warning')
                 return redirect(url_for('auth.login'))
-            if session['user_role'] != required_role and session['user_role'] != 'admin':
+            if not user.has_role(required_role):
                 flash('You do not have permission to access this page.', 'error')
                 return redirect(url_for('orders.list_orders'))
             return f(*args, **kwargs)
         return decorated_function
     return decorator
-
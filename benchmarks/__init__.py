@@ -0,0 +1,65 @@
+"""
+Benchmarks, run as python3 -m benchmarks.<name>
+
+Each script calls scratch_database() before importing the app, so it runs
+against a throwaway SQLite file (deleted on exit) and is safe to run
+anywhere; set BENCH_DATABASE_URL to run against an empty database of your
+own instead. seed_catalog() and order_row() build the store, device, plan
+and user most scripts need.
+"""
+import atexit
+import os
+import sys
+import tempfile
+from collections import namedtuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+Catalog = namedtuple('Catalog', 'store_id store_name phone_id plan_id user_id')
+
+
+def scratch_database():
+    """Point DATABASE_URL at a throwaway SQLite file; call before config.py is imported. Returns the URL."""
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if not url:
+        handle, path = tempfile.mkstemp(suffix='.db', prefix='bench-')
+        os.close(handle)
+        atexit.register(_remove, path)
+        url = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = url
+    return url
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def seed_catalog(name='Bench', role='admin', password='bench'):
+    """
+    One store, phone, rate plan and a user who can log in as (name,
+    password), committed; call in an app context. Returns their ids as a Catalog.
+    """
+    from models import db, Phone, RatePlan, Store, User
+
+    store = Store(name=f'{name} Store', city='Toronto', province='ON')
+    phone = Phone(brand='Acme', model='One', storage='128 GB', colour='Black', bell_sku='ACME1', full_price=100)
+    plan = RatePlan(name=f'{name} Plan', monthly_price=50, bell_plan_code=name.upper())
+    db.session.add_all([store, phone, plan])
+    db.session.flush()
+    user = User(first_name=name, role=role, store_id=store.id)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return Catalog(store.id, store.name, phone.id, plan.id, user.id)
+
+
+def order_row(catalog, order_number, customer_id, **values):
+    """Column values for a bulk Order insert using the catalog's store, phone, plan and user"""
+    return {
+        'version': 1, 'order_number': order_number, 'customer_id': customer_id, 'user_id': catalog.user_id,
+        'phone_id': catalog.phone_id, 'rate_plan_id': catalog.plan_id, 'store_id': catalog.store_id,
+        'store_location': catalog.store_name, 'status': 'New', **values,
+    }
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Carrier activation throughput at each concurrency level, plus breaker behaviour
+
+Usage:
+    python3 -m benchmarks.carrier_activation [--activations 200] [--latency-ms 50]
+
+Talks to a local carrier_mock.py server only; no database is needed.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from carrier import (ActivationRequest, CarrierError, CarrierUnavailable, CircuitBreaker,
+                     HttpCarrierClient, RateLimiter)
+from carrier_mock import start_mock_server
+
+
+def make_requests(count):
+    return [ActivationRequest(i, f'ORD-BENCH-{i:05d}', f'416555{i:04d}', 'SKU-BENCH', 'PLAN-BENCH')
+            for i in range(count)]
+
+
+def run(url, concurrency, activations, rate):
+    client = HttpCarrierClient(url, rate_limiter=RateLimiter(rate), max_concurrency=concurrency)
+    start = time.perf_counter()
+    results = client.activate_many(make_requests(activations))
+    elapsed = time.perf_counter() - start
+    failed = sum(isinstance(r, CarrierError) for r in results)
+    return elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--activations', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--rate', type=float, default=1000, help='rate limit, requests per second')
+    args = parser.parse_args()
+
+    server = start_mock_server(latency=args.latency_ms / 1000)
+    print(f"{args.activations} activations, {args.latency_ms:.0f} ms carrier latency\n")
+    print(f"{'concurrency':>11}  {'seconds':>8}  {'per sec':>8}  {'failed':>6}")
+    for concurrency in (1, 4, 8, 16):
+        elapsed, failed = run(server.url, concurrency, args.activations, args.rate)
+        print(f"{concurrency:>11}  {elapsed:>8.2f}  {args.activations / elapsed:>8.0f}  {failed:>6}")
+    server.shutdown()
+
+    # Carrier outage: the breaker should stop sending after a handful of errors
+    down = start_mock_server(latency=args.latency_ms / 1000, fail_rate=1.0)
+    client = HttpCarrierClient(down.url, rate_limiter=RateLimiter(args.rate),
+                               breaker=CircuitBreaker(failures=5, reset_after=30), max_concurrency=8)
+    start = time.perf_counter()
+    results = client.activate_many(make_requests(args.activations))
+    elapsed = time.perf_counter() - start
+    short_circuited = sum(isinstance(r, CarrierUnavailable) for r in results)
+    print(f"\nOutage: {down.requests_seen} requests reached the carrier, "
+          f"{short_circuited} short-circuited, {elapsed:.2f} s, breaker {client.breaker.state}")
+    down.shutdown()
+
+
+if __name__ == '__main__':
+    main()
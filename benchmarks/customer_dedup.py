@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Customer dedup at scale: synthetic customers with known duplicates mixed in
+(reformatted or mistyped phones, email case, misspelled names), then a scan
+and a merge
+
+Usage:
+    python3 -m benchmarks.customer_dedup [--customers 500000] [--duplicate-rate 0.02]
+
+Reports time per stage, candidate pairs against the n^2/2 of comparing
+every pair, and precision/recall against the duplicates planted.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+from benchmarks import order_row, scratch_database, seed_catalog
+
+scratch_database()  # before config.py is imported
+
+from sqlalchemy import select
+from app import create_app
+from dedup import candidate_pairs, find_duplicates, load_records, merge_customers, score
+from models import db, Customer, CustomerDuplicate, Order
+
+SYLLABLES = ['an', 'ber', 'ca', 'dor', 'el', 'fi', 'gan', 'ho', 'is', 'jo', 'ka', 'lin', 'mar', 'no',
+             'ol', 'pe', 'qui', 'ra', 'son', 'ta', 'ul', 'vi', 'wen', 'xa', 'yo', 'zel']
+
+
+def make_names(rng, count, parts):
+    names = set()
+    while len(names) < count:
+        names.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.choice(parts))).capitalize())
+    return sorted(names)
+
+
+def vary(rng, customer):
+    """A second record for the same person, entered differently"""
+    first, last, phone, email, postal = customer
+    digits = re.sub(r'\D', '', phone)[-10:]
+    change = rng.choice(('format', 'typo', 'email', 'name'))
+    if change == 'format':
+        phone = f'+1 ({digits[:3]}) {digits[3:6]} {digits[6:]}'
+    elif change == 'typo':
+        i = rng.randrange(3, 10)
+        phone = digits[:i] + str((int(digits[i]) + 1) % 10) + digits[i + 1:]
+    elif change == 'email' and email:
+        email = email.upper()
+        phone = digits
+    else:
+        i = rng.randrange(1, len(last))
+        last = last[:i] + last[i] + last[i:]  # doubled letter
+    return first, last, phone, email, postal
+
+
+def seed(count, duplicate_rate, rng):
+    """Rows to insert and the set of planted (original id, duplicate id) pairs"""
+    firsts = make_names(rng, 3000, (2, 3))
+    lasts = make_names(rng, 30000, (2, 3, 4))
+    rows, planted = [], set()
+    while len(rows) < count:
+        if rows and rng.random() < duplicate_rate:
+            original = rng.randrange(len(rows))
+            rows.append(vary(rng, rows[original]))
+            planted.add((original + 1, len(rows)))
+            continue
+        first, last = rng.choice(firsts), rng.choice(lasts)
+        phone = f'{rng.choice((416, 514, 604, 613, 647))}-{rng.randrange(200, 1000)}-{rng.randrange(10000):04d}'
+        email = f'{first}.{last}{rng.randrange(100)}@example.com'.lower() if rng.random() < 0.7 else None
+        postal = f'{rng.choice("HKLMV")}{rng.randrange(10)}{rng.choice("ABCEGHJ")} {rng.randrange(10)}A{rng.randrange(10)}'
+        rows.append((first, last, phone, email, postal))
+    return rows, planted
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<28} {time.perf_counter() - start:7.2f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--customers', type=int, default=500000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    parser.add_argument('--orders-to-merge', type=int, default=500)
+    args = parser.parse_args()
+    rng = random.Random(48)
+
+    app = create_app()
+    rows, planted = seed(args.customers, args.duplicate_rate, rng)
+    with app.app_context():
+        def insert():
+            for i in range(0, len(rows), 50000):
+                db.session.execute(Customer.__table__.insert(), [
+                    {'id': i + n + 1, 'first_name': first, 'last_name': last, 'phone_number': phone,
+                     'email': email, 'postal_code': postal}
+                    for n, (first, last, phone, email, postal) in enumerate(rows[i:i + 50000])
+                ])
+            db.session.commit()
+        print(f"{args.customers} customers, {len(planted)} planted duplicates\n")
+        timed('insert customers', insert)
+
+        # The stages of find_duplicates, timed separately
+        records = timed('load and normalize', load_records)
+        pairs, skipped = timed('block', candidate_pairs, records)
+        timed('score candidate pairs', lambda: [score(records[a], records[b], app.config['DEDUP_MIN_SCORE'])
+                                                 for a, b in pairs])
+        compared, found = timed('full scan (find_duplicates)', find_duplicates)
+        all_pairs = args.customers * (args.customers - 1) // 2
+        print(f"\n{compared} candidate pairs ({compared / all_pairs:.6%} of {all_pairs}), "
+              f"{skipped} oversized blocks skipped")
+
+        found_pairs = set(db.session.execute(select(CustomerDuplicate.customer_id,
+                                                    CustomerDuplicate.duplicate_id)).all())
+        hits = len(found_pairs & planted)
+        print(f"{found} flagged: recall {hits / len(planted):.1%}, precision {hits / max(found, 1):.1%}")
+
+        # Merge a duplicate that has a pile of orders
+        keep_id, merge_id = sorted(planted)[0]
+        catalog = seed_catalog('Dedup', role='manager')
+        db.session.execute(Order.__table__.insert(), [
+            order_row(catalog, f'CEL-DEDUP-{i:06d}', merge_id) for i in range(args.orders_to_merge)
+        ])
+        db.session.commit()
+        moved = timed(f'merge ({args.orders_to_merge} orders)', merge_customers, keep_id, [merge_id])
+        left = Order.query.filter_by(customer_id=merge_id).count()
+
+    if moved != args.orders_to_merge or left:
+        sys.exit(f"\nFAIL: merge moved {moved} orders, {left} left behind")
+    print("\nMerge moved every order in one transaction")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Customer page for a customer with a long order history: the old page
+(every order with .all(), then a lazy load per row for phone, plan, store
+and rep) against the summary query plus an eager-loaded first page
+
+Usage:
+    python3 -m benchmarks.customer_detail [--orders 2000] [--requests 20]
+
+Reports SQL statements and time per request, and follows the "Load more"
+links to check that every order is reachable.
+"""
+import argparse
+import re
+import sys
+import time
+
+from benchmarks import scratch_database
+
+scratch_database()  # before config.py is imported
+
+from flask import render_template_string
+from sqlalchemy import event
+from app import create_app
+from models import db, Customer, Order, Phone, RatePlan, Store, User
+
+# The rows the old page rendered, one lazy load per relationship per order
+OLD_ROWS = """{% for order in orders %}{{ order.order_number }} {{ order.phone.display_name }}
+{{ order.rate_plan.name }} {{ order.store.name }} {{ order.user.first_name }}{% endfor %}"""
+
+
+def seed(count):
+    """One customer with `count` orders spread over 20 phones, plans, stores and reps; returns the customer id"""
+    stores = [Store(name=f'Store {i}', city='Toronto', province='ON') for i in range(20)]
+    phones = [Phone(brand='Acme', model=f'Model {i}', storage='128 GB', colour='Black', bell_sku=f'ACME{i}',
+                    full_price=100 + i) for i in range(20)]
+    plans = [RatePlan(name=f'Plan {i}', monthly_price=40 + i, bell_plan_code=f'PLAN{i}') for i in range(20)]
+    customer = Customer(first_name='Loyal', last_name='Customer', phone_number='416-555-0100')
+    db.session.add_all(stores + phones + plans + [customer])
+    db.session.flush()
+    users = [User(first_name=f'rep{i}', role='rep', store_id=stores[i].id) for i in range(20)]
+    for user in users:
+        user.set_password('x')
+    db.session.add_all(users)
+    db.session.flush()
+    db.session.execute(Order.__table__.insert(), [
+        {'version': 1, 'order_number': f'CEL-LOYAL-{i:06d}', 'customer_id': customer.id,
+         'user_id': users[i % 20].id, 'phone_id': phones[i % 20].id, 'rate_plan_id': plans[i % 20].id,
+         'store_id': stores[i % 20].id, 'store_location': stores[i % 20].name,
+         'status': Order.STATUSES[i % len(Order.STATUSES)]}
+        for i in range(count)
+    ])
+    db.session.commit()
+    return customer.id, users[0].id
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    statements = []
+    with app.app_context():
+        customer_id, user_id = seed(args.orders)
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    def old_page():
+        with app.test_request_context():
+            orders = Order.query.filter_by(customer_id=customer_id).order_by(Order.created_at.desc()).all()
+            render_template_string(OLD_ROWS, orders=orders)
+            db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    def new_page():
+        response = client.get(f'/customers/{customer_id}')
+        assert response.status_code == 200, response.status_code
+
+    results = {}
+    for label, page in (('all orders + lazy loads', old_page), ('summary + first page', new_page)):
+        statements.clear()
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            page()
+        elapsed = (time.perf_counter() - start) / args.requests
+        results[label] = len(statements) / args.requests
+        print(f"{label:<24} {results[label]:7.1f} queries  {elapsed * 1000:8.1f} ms per page")
+
+    # Walk the "Load more" links to the end
+    response = client.get(f'/customers/{customer_id}')
+    seen = len(re.findall(r'CEL-LOYAL-', response.get_data(as_text=True)))
+    next_url = re.search(r'data-load-more="([^"]*/orders[^"]*)"', response.get_data(as_text=True))
+    next_url = next_url.group(1).replace('&amp;', '&') if next_url else ''
+    pages = 1
+    while next_url:
+        response = client.get(next_url)
+        seen += len(re.findall(r'CEL-LOYAL-', response.get_data(as_text=True)))
+        next_url = response.headers['X-Next-Page']
+        pages += 1
+
+    print(f"\n{seen} orders reached over {pages} pages")
+    if seen != args.orders or results['summary + first page'] >= results['all orders + lazy loads']:
+        sys.exit("FAIL: not every order was reachable, or the new page ran more queries")
+
+
+if __name__ == '__main__':
+    main()
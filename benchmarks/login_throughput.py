@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Login throughput benchmark for each password hashing cost setting
+
+Usage:
+    python3 -m benchmarks.login_throughput [--logins 40] [--threads 8]
+
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import scratch_database
+
+scratch_database()  # before config.py is imported
+
+from app import create_app
+from models import db, User
+import passwords
+
+SETTINGS = [
+    ('pbkdf2 100k', {'PASSWORD_HASH_METHOD': 'pbkdf2', 'PASSWORD_PBKDF2_ITERATIONS': 100000}),
+    ('pbkdf2 300k', {'PASSWORD_HASH_METHOD': 'pbkdf2', 'PASSWORD_PBKDF2_ITERATIONS': 300000}),
+    ('pbkdf2 600k', {'PASSWORD_HASH_METHOD': 'pbkdf2', 'PASSWORD_PBKDF2_ITERATIONS': 600000}),
+    ('scrypt N=2^14', {'PASSWORD_HASH_METHOD': 'scrypt', 'PASSWORD_SCRYPT_N': 16384}),
+    ('scrypt N=2^15', {'PASSWORD_HASH_METHOD': 'scrypt', 'PASSWORD_SCRYPT_N': 32768}),
+    ('scrypt N=2^16', {'PASSWORD_HASH_METHOD': 'scrypt', 'PASSWORD_SCRYPT_N': 65536}),
+    ('argon2 t=2 m=19MiB', {'PASSWORD_HASH_METHOD': 'argon2', 'PASSWORD_ARGON2_TIME_COST': 2,
+                            'PASSWORD_ARGON2_MEMORY_COST': 19456}),
+    ('argon2 t=3 m=64MiB', {'PASSWORD_HASH_METHOD': 'argon2', 'PASSWORD_ARGON2_TIME_COST': 3,
+                            'PASSWORD_ARGON2_MEMORY_COST': 65536}),
+]
+
+
+def run_setting(label, overrides, logins, threads):
+    """Time `logins` POST /login requests spread over `threads` threads"""
+    app = create_app()
+    app.config.update(overrides)
+
+    with app.app_context():
+        User.query.delete()
+        user = User(first_name='Bench', role='rep')
+        user.set_password('cellcom')
+        db.session.add(user)
+        db.session.commit()
+
+    def do_login(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/login', data={'first_name': 'Bench', 'password': 'cellcom'})
+        assert response.status_code == 302, response.status_code
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(do_login, range(logins)))
+    elapsed = time.perf_counter() - start
+
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{label:<22} {logins / elapsed:>10.1f} {p50:>10.1f} {p95:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{args.logins} logins, {args.threads} client threads\n")
+    print(f"{'setting':<22} {'logins/s':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for label, overrides in SETTINGS:
+        if overrides['PASSWORD_HASH_METHOD'] == 'argon2' and passwords.PasswordHasher is None:
+            print(f"{label:<22} {'skipped (argon2-cffi not installed)':>32}")
+            continue
+        run_setting(label, overrides, args.logins, args.threads)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Page weight and latency benchmark for Jinja trimming and response compression
+
+Usage:
+    python3 -m benchmarks.page_weight [--customers 2000] [--orders 5000] [--requests 10]
+
+Seeds a throwaway SQLite database with the real store/phone/plan catalogs
+plus synthetic customers and orders, then renders the heaviest pages with
+trimming off/on and with identity, gzip and brotli encoding. Timings are
+for warm requests (template and fragment caches filled by a first request).
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import scratch_database
+
+scratch_database()  # before config.py is imported
+
+from app import create_app
+from models import db, Customer, Order, User, Phone, RatePlan, Store
+import compression
+import seed.seed_stores as seed_stores
+import seed.seed_users as seed_users
+import seed.seed_phones as seed_phones
+import seed.seed_rate_plans as seed_rate_plans
+
+PAGES = ['/orders', '/orders/new']
+STATUSES = ['New', 'Pending Activation', 'Activated', 'Cancelled', 'Returned']
+
+
+def seed_large_dataset(app, customer_count, order_count):
+    """Load the real catalogs plus synthetic customers and orders"""
+    seed_stores.seed_stores()
+    seed_users.seed_users()
+    seed_phones.seed_phones()
+    seed_rate_plans.seed_rate_plans()
+
+    with app.app_context():
+        rng = random.Random(42)
+        db.session.bulk_insert_mappings(Customer, [
+            {'first_name': f'Customer{i}', 'last_name': f'Test{i % 500}',
+             'phone_number': f'514-555-{i:04d}', 'email': f'customer{i}@example.com'}
+            for i in range(customer_count)
+        ])
+        customer_ids = [c for (c,) in db.session.query(Customer.id)]
+        user_ids = [u for (u,) in db.session.query(User.id)]
+        phone_ids = [p for (p,) in db.session.query(Phone.id)]
+        plan_ids = [p for (p,) in db.session.query(RatePlan.id)]
+        stores = db.session.query(Store.id, Store.name, Store.city, Store.province).all()
+        now = datetime.utcnow()
+        orders = []
+        for i in range(order_count):
+            store = rng.choice(stores)
+            created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            orders.append({
+                'order_number': f'CEL-BENCH-{i:06d}',
+                'customer_id': rng.choice(customer_ids),
+                'user_id': rng.choice(user_ids),
+                'phone_id': rng.choice(phone_ids),
+                'rate_plan_id': rng.choice(plan_ids),
+                'store_id': store.id,
+                'store_location': f'{store.name} - {store.city}, {store.province}',
+                'status': rng.choice(STATUSES),
+                'created_at': created,
+                'updated_at': created,
+            })
+        db.session.bulk_insert_mappings(Order, orders)
+        db.session.commit()
+
+
+def measure(client, path, encoding, requests):
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    client.get(path, headers=headers)  # warm template cache
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return len(response.data), sum(timings) / len(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=10)
+    args = parser.parse_args()
+
+    app = create_app()
+    print(f"Seeding {args.customers} customers and {args.orders} orders...")
+    seed_large_dataset(app, args.customers, args.orders)
+
+    client = app.test_client()
+    client.post('/login', data={'first_name': 'Anthony', 'password': 'cellcom'})
+    client.get('/orders')  # consume the welcome flash
+
+    modes = [
+        ('untrimmed, identity', False, None),
+        ('trimmed, identity', True, None),
+        ('trimmed, gzip', True, 'gzip'),
+    ]
+    if compression.brotli is not None:
+        modes.append(('trimmed, brotli', True, 'br'))
+
+    print(f"\n{'page':<12} {'mode':<22} {'bytes':>10} {'mean ms':>10}")
+    for path in PAGES:
+        for label, trimmed, encoding in modes:
+            app.jinja_env.trim_blocks = trimmed
+            app.jinja_env.lstrip_blocks = trimmed
+            # Compiled templates keep the whitespace settings they were built with;
+            # recompile from source rather than reload the shared bytecode
+            app.jinja_env.bytecode_cache = None
+            app.jinja_env.cache.clear()
+            app.jinja_env.fragment_cache.clear()
+            size, latency = measure(client, path, encoding, args.requests)
+            print(f"{path:<12} {label:<22} {size:>10,} {latency:>10.1f}")
+
+
+
+if __name__ == '__main__':
+    main()
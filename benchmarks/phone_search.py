@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Customer phone search: the old ILIKE '%...%' scan against the E.164 index,
+plus the chunked backfill that fills phone_e164 for existing rows
+
+Usage:
+    python3 -m benchmarks.phone_search [--customers 500000] [--searches 200]
+
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks import scratch_database
+
+scratch_database()  # before config.py is imported
+
+from sqlalchemy import text
+from app import create_app
+from models import db, Customer
+from schema import _backfill_customer_phones
+
+FORMATS = ('{a}-{b}-{c}', '({a}) {b}-{c}', '{a}.{b}.{c}', '+1 {a} {b} {c}', '{a}{b}{c}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--customers', type=int, default=500000)
+    parser.add_argument('--searches', type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(49)
+
+    app = create_app()
+    numbers = [(rng.choice((416, 514, 604, 613, 647)), rng.randrange(200, 1000), rng.randrange(10000))
+               for _ in range(args.customers)]
+    with app.app_context():
+        # Inserted without phone_e164, like rows from before the column existed
+        for i in range(0, args.customers, 50000):
+            db.session.execute(Customer.__table__.insert(), [
+                {'first_name': 'Customer', 'last_name': str(i + n),
+                 'phone_number': rng.choice(FORMATS).format(a=a, b=b, c=f'{c:04d}')}
+                for n, (a, b, c) in enumerate(numbers[i:i + 50000])
+            ])
+        db.session.commit()
+
+        start = time.perf_counter()
+        filled = _backfill_customer_phones()
+        print(f"Backfilled {filled} of {args.customers} customers in {time.perf_counter() - start:.2f} s\n")
+
+        searches = [rng.choice(numbers) for _ in range(args.searches)]
+        start = time.perf_counter()
+        for a, b, c in searches:
+            typed = f'{a}-{b}-{c:04d}'
+            Customer.query.filter(Customer.phone_number.ilike(f'%{typed}%')).all()
+        ilike = (time.perf_counter() - start) / len(searches)
+
+        start = time.perf_counter()
+        found = 0
+        for a, b, c in searches:
+            found += bool(Customer.find_by_phone(f'({a}) {b} {c:04d}'))
+        exact = (time.perf_counter() - start) / len(searches)
+
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM customers WHERE phone_e164 = '+15145550101'"
+        )).all()
+
+    print(f"ILIKE '%...%' (misses other formats)  {ilike * 1000:8.2f} ms per search")
+    print(f"E.164 exact match                     {exact * 1000:8.2f} ms per search  "
+          f"({found}/{len(searches)} found in any format)")
+    print(f"\nQuery plan: {plan[0][-1]}")
+    if found != len(searches):
+        sys.exit("FAIL: a customer was not found by phone")
+
+
+if __name__ == '__main__':
+    main()
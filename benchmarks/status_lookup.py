@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Public status lookup under an SMS-campaign spike: many customers, each from
+their own address, refreshing /track for their order a few times
+
+Usage:
+    python3 -m benchmarks.status_lookup [--orders 20000] [--customers 2000] [--refreshes 5]
+
+Reports throughput, SQL statements per lookup, and fails if a lookup
+touched the orders table instead of order_status_lookup.
+"""
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import order_row, scratch_database, seed_catalog
+
+scratch_database()  # before config.py is imported
+
+from sqlalchemy import event
+from app import create_app
+from cache import status_lookups
+from models import db, Order, Customer
+from tracking import rebuild_status_lookup
+
+
+def seed(app, count):
+    """`count` orders, one customer each; returns [(order number, last 4 digits)]"""
+    with app.app_context():
+        catalog = seed_catalog('Spike', role='rep')
+        db.session.execute(Customer.__table__.insert(), [
+            {'id': i, 'first_name': 'Customer', 'last_name': str(i), 'phone_number': f'416-555-{i % 10000:04d}'}
+            for i in range(1, count + 1)
+        ])
+        statuses = Order.STATUSES
+        db.session.execute(Order.__table__.insert(), [
+            order_row(catalog, f'CEL-SPIKE-{i:06d}', i, id=i, status=statuses[i % len(statuses)])
+            for i in range(1, count + 1)
+        ])
+        db.session.commit()
+        start = time.perf_counter()
+        written = rebuild_status_lookup()
+        print(f"Rebuilt {written} lookup rows in {time.perf_counter() - start:.2f} s")
+    return [(f'CEL-SPIKE-{i:06d}', f'{i % 10000:04d}') for i in range(1, count + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--customers', type=int, default=2000, help='customers who got the SMS')
+    parser.add_argument('--refreshes', type=int, default=5, help='lookups per customer')
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    app = create_app()
+    orders = seed(app, args.orders)
+    campaign = random.sample(range(len(orders)), args.customers)
+    lookups = [customer for customer in campaign for _ in range(args.refreshes)]
+    random.shuffle(lookups)
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: statements.append(statement))
+    client = app.test_client()
+
+    def look_up(customer):
+        order_number, digits = orders[customer]
+        response = client.post('/track', json={'order_number': order_number, 'last4': digits},
+                               environ_base={'REMOTE_ADDR': f'10.{customer // 65536}.{customer // 256 % 256}.{customer % 256}'})
+        return response.status_code
+
+    for label in ('cold cache', 'warm cache'):
+        if label == 'cold cache':
+            status_lookups.clear()
+        statements.clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            codes = list(pool.map(look_up, lookups))
+        elapsed = time.perf_counter() - start
+        found = codes.count(200)
+        print(f"{label:<10}  {len(lookups)} lookups  {len(lookups) / elapsed:7.0f}/s  "
+              f"{len(statements) / len(lookups):.2f} queries each  {found} found  "
+              f"{len(codes) - found} other")
+
+    touched_orders = [s for s in statements if ' orders' in s.replace('order_status_lookup', '')]
+    if touched_orders or found != len(lookups):
+        sys.exit(f"\nFAIL: {len(touched_orders)} queries read orders; {len(lookups) - found} lookups not found")
+    print("\nNo lookup read the orders table")
+
+
+if __name__ == '__main__':
+    main()
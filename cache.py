@@ -0,0 +1,98 @@
+"""
+In-process caches shared by the routes.
+
+Each gunicorn worker has its own copy, so anything cached here must be safe
+to serve slightly stale for at most its TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a time-to-live"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Cache a value, evicting the least recently used entry when full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def incr(self, key, ttl=None):
+        """Add one to a counter and return it; a missing or expired counter restarts at 1 with a new TTL"""
+        now = time.monotonic()
+        with self._lock:
+            count, expires_at = self._data.get(key, (0, 0))
+            if expires_at < now:
+                count, expires_at = 0, now + (self.ttl if ttl is None else ttl)
+            self._data[key] = (count + 1, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return count + 1
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Login names that recently matched no user (see routes/auth.py). Creating a
+# user only clears the entry in the worker that handled the request, so other
+# workers may refuse a brand-new user for up to LOGIN_NEGATIVE_CACHE_TTL.
+unknown_login_names = TTLCache(maxsize=10000, ttl=30)
+
+# (id, first_name) rows for user dropdowns (see User.choices)
+user_choices = TTLCache(maxsize=1, ttl=60)
+
+# Rendered template fragments from {% cache %} (see fragments.py)
+fragment_cache = TTLCache(maxsize=20000, ttl=300)
+
+# Analytics reports keyed on (report, window start, ...) (see analytics.py)
+reports = TTLCache(maxsize=64, ttl=24 * 3600)
+
+# CurrentUser snapshots keyed on (user id, users.version) (see auth.py)
+current_users = TTLCache(maxsize=1024, ttl=3600)
+
+# Public order status lookup rows keyed on order number (see tracking.py)
+status_lookups = TTLCache(maxsize=50000, ttl=30)
+
+# Per-address request counters for the public status lookup (see tracking.py)
+status_lookup_clients = TTLCache(maxsize=100000, ttl=60)
+
+# Wrong-digit counters per order number, kept apart from the per-address
+# counters so rotating addresses can't evict them and reset the lockout
+status_lookup_failures = TTLCache(maxsize=100000, ttl=3600)
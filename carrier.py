@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Carrier (Bell) activation client
+
+Moving an order to Pending Activation queues a 'carrier.activate' outbox
+event (see outbox.py). Its handler submits the activation through the
+configured CarrierClient and records the outcome in order_status_history:
+accepted orders move to Activated, rejections are noted on the order. Timeouts
+and server errors raise, so the outbox retries them with backoff.
+
+HttpCarrierClient keeps a pooled keep-alive requests.Session. Every client
+shares a token-bucket rate limit and a circuit breaker, so a struggling
+carrier API gets a fast failure instead of more traffic. activate_many()
+submits a batch concurrently on a thread pool under both.
+
+Set CARRIER_API_URL to enable submissions; carrier_mock.py serves a local
+stand-in API for development. To submit every order already waiting in
+Pending Activation:
+
+    python3 carrier.py --pending
+"""
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import select
+from models import db, Order, OrderConflict, OrderStatusHistory, Customer, Phone, RatePlan
+from outbox import handler
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # requests is optional; only needed when CARRIER_API_URL is set
+    requests = None
+
+ActivationRequest = namedtuple('ActivationRequest', 'order_id order_number msisdn device_sku plan_code')
+# status is 'activated' or 'rejected'
+ActivationResult = namedtuple('ActivationResult', 'order_id status reference message')
+
+
+class CarrierError(Exception):
+    """The carrier could not be reached or failed; safe to retry"""
+
+
+class CarrierUnavailable(CarrierError):
+    """The circuit breaker is open; no request was sent"""
+
+
+class RateLimiter:
+    """Thread-safe token bucket: `rate` requests per second, bursts up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive errors and rejects calls for
+    `reset_after` seconds, then lets a single trial call through
+    (half-open); its success closes the breaker again.
+    """
+
+    def __init__(self, failures=5, reset_after=30):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_after:
+                return 'half-open'
+            return 'open'
+
+    def call(self, func, *args):
+        with self._lock:
+            if self._opened_at is not None:
+                if time.monotonic() - self._opened_at < self.reset_after or self._trial_running:
+                    raise CarrierUnavailable('Carrier circuit breaker is open')
+                self._trial_running = True
+        try:
+            result = func(*args)
+        except CarrierError:
+            with self._lock:
+                self._trial_running = False
+                self._consecutive += 1
+                if self._opened_at is not None or self._consecutive >= self.failures:
+                    self._opened_at = time.monotonic()
+            raise
+        except BaseException:
+            # Not a carrier failure (a bug, an interrupt): don't count it, but
+            # free the trial slot so the next call can try again
+            with self._lock:
+                self._trial_running = False
+            raise
+        with self._lock:
+            self._trial_running = False
+            self._consecutive = 0
+            self._opened_at = None
+        return result
+
+
+class CarrierClient:
+    """Interface for submitting activations; subclasses implement _activate()"""
+
+    def __init__(self, rate_limiter=None, breaker=None, max_concurrency=8):
+        self.rate_limiter = rate_limiter or RateLimiter(10)
+        self.breaker = breaker or CircuitBreaker()
+        self.max_concurrency = max_concurrency
+
+    def _activate(self, request):
+        raise NotImplementedError
+
+    def activate(self, request):
+        """Submit one activation; returns ActivationResult or raises CarrierError"""
+        self.rate_limiter.acquire()
+        return self.breaker.call(self._activate, request)
+
+    def activate_many(self, requests_):
+        """Submit a batch concurrently; returns an ActivationResult or CarrierError per request, in order"""
+        def submit(request):
+            try:
+                return self.activate(request)
+            except CarrierError as e:
+                return e
+
+        if len(requests_) <= 1:
+            return [submit(r) for r in requests_]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(requests_))) as pool:
+            return list(pool.map(submit, requests_))
+
+
+class HttpCarrierClient(CarrierClient):
+    """JSON-over-HTTP carrier API through a pooled keep-alive session"""
+
+    def __init__(self, base_url, api_key=None, timeout=10, **kwargs):
+        if requests is None:
+            raise RuntimeError('The requests package is required when CARRIER_API_URL is set')
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        # One connection per concurrent submission, reused across requests
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Accept'] = 'application/json'
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+    def _activate(self, request):
+        try:
+            response = self.session.post(
+                f'{self.base_url}/v1/activations',
+                json={
+                    'order_number': request.order_number,
+                    'msisdn': request.msisdn,
+                    'device_sku': request.device_sku,
+                    'plan_code': request.plan_code,
+                },
+                # The carrier treats a repeated key as the same activation
+                headers={'Idempotency-Key': request.order_number},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            raise CarrierError(f'Carrier request failed: {e}') from e
+
+        if response.status_code in (400, 409, 422):
+            body = _json_object(response) if response.content else {}
+            return ActivationResult(request.order_id, 'rejected', None,
+                                    body.get('message') or f'HTTP {response.status_code}')
+        if response.status_code >= 300:
+            raise CarrierError(f'Carrier returned HTTP {response.status_code}')
+        body = _json_object(response)
+        return ActivationResult(request.order_id, 'activated', body.get('reference'), body.get('message'))
+
+
+def _json_object(response):
+    """The response body as a JSON object; CarrierError for HTML, empty or non-object bodies"""
+    try:
+        body = response.json()
+    except ValueError as e:
+        raise CarrierError('invalid carrier response') from e
+    if not isinstance(body, dict):
+        raise CarrierError('invalid carrier response')
+    return body
+
+
+def get_client():
+    """The app's carrier client, or None if CARRIER_API_URL is not set"""
+    app = current_app._get_current_object()
+    if 'carrier' not in app.extensions:
+        config = app.config
+        client = None
+        if config['CARRIER_API_URL']:
+            client = HttpCarrierClient(
+                config['CARRIER_API_URL'],
+                api_key=config['CARRIER_API_KEY'],
+                timeout=config['CARRIER_TIMEOUT_SECONDS'],
+                rate_limiter=RateLimiter(config['CARRIER_RATE_PER_SECOND']),
+                breaker=CircuitBreaker(config['CARRIER_BREAKER_FAILURES'], config['CARRIER_BREAKER_RESET_SECONDS']),
+                max_concurrency=config['CARRIER_MAX_CONCURRENCY'],
+            )
+        app.extensions['carrier'] = client
+    return app.extensions['carrier']
+
+
+def build_requests(order_ids):
+    """ActivationRequests for the given orders, in one query"""
+    rows = db.session.execute(
+        select(Order.id, Order.order_number, Customer.phone_number, Phone.bell_sku, RatePlan.bell_plan_code)
+        .join(Customer, Customer.id == Order.customer_id)
+        .join(Phone, Phone.id == Order.phone_id)
+        .join(RatePlan, RatePlan.id == Order.rate_plan_id)
+        .where(Order.id.in_(order_ids))
+        .order_by(Order.id)
+    ).all()
+    return [ActivationRequest(*row) for row in rows]
+
+
+def record_result(result, user_id):
+    """Write a carrier result to the order's status history"""
+    order = db.session.get(Order, result.order_id)
+    if order is None:
+        return
+    for _attempt in range(3):
+        if result.status != 'activated' or order.status != 'Pending Activation':
+            break
+        try:
+            order.update_status('Activated', user_id, f'Activated by carrier (ref {result.reference})')
+            return
+        except OrderConflict as e:
+            # Edited while the request was in flight; look at it again rather than lose the result
+            current_app.logger.info('Order %s changed while recording its activation', order.order_number)
+            order = e.order
+    # Rejected, or the order moved on while the request was in flight: note it without a status change
+    if result.status == 'activated':
+        comment = f'Carrier activated (ref {result.reference}) while order was {order.status}'
+    else:
+        comment = f'Carrier rejected activation: {result.message}'
+    db.session.add(OrderStatusHistory(order_id=order.id, old_status=order.status, new_status=order.status,
+                                      changed_by_user_id=user_id, comment=comment))
+    db.session.commit()
+
+
+def submit_activations(order_ids, user_id):
+    """
+    Submit activations for the given orders in concurrent batches and record
+    the results. Returns (activated, rejected, failed) counts; failures are
+    left in Pending Activation to be retried.
+    """
+    client = get_client()
+    if client is None:
+        return 0, 0, 0
+    batch_size = current_app.config['CARRIER_BATCH_SIZE']
+    counts = {'activated': 0, 'rejected': 0, 'failed': 0}
+    for i in range(0, len(order_ids), batch_size):
+        batch = build_requests(order_ids[i:i + batch_size])
+        for result in client.activate_many(batch):
+            if isinstance(result, CarrierError):
+                counts['failed'] += 1
+                current_app.logger.warning('Carrier activation failed: %s', result)
+                continue
+            record_result(result, user_id)
+            counts[result.status] += 1
+    return counts['activated'], counts['rejected'], counts['failed']
+
+
+@handler('carrier.activate')
+def activate_order(payload):
+    """Outbox handler: submit one order; carrier errors raise so the event is retried"""
+    client = get_client()
+    if client is None:
+        return
+    order = db.session.get(Order, payload['order_id'])
+    if order is None or order.status != 'Pending Activation':
+        return
+    request = build_requests([order.id])[0]
+    # End the read transaction and return the connection to the pool while
+    # the carrier call is in flight; record_result() starts a fresh one
+    db.session.commit()
+    result = client.activate(request)
+    record_result(result, payload['user_id'])
+
+
+if __name__ == '__main__':
+    import logging
+    from app import create_app
+    from models import User
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if '--pending' not in sys.argv:
+        sys.exit(__doc__)
+    app = create_app()
+    with app.app_context():
+        if get_client() is None:
+            sys.exit('CARRIER_API_URL is not set')
+        admin = User.query.filter_by(role='admin').order_by(User.id).first()
+        if admin is None:
+            sys.exit('No admin user to record the activations as; create one first')
+        pending = db.session.execute(
+            select(Order.id).where(Order.status == 'Pending Activation').order_by(Order.id)
+        ).scalars().all()
+        activated, rejected, failed = submit_activations(pending, admin.id)
+    print(f"✓ {len(pending)} pending: {activated} activated, {rejected} rejected, {failed} failed")
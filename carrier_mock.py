@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the carrier activation API
+
+Serves POST /v1/activations the way HttpCarrierClient expects, over
+keep-alive HTTP/1.1, with configurable latency and failure rate:
+
+    200  {"reference": "...", "message": "..."}   activated
+    422  {"message": "..."}                       rejected (missing SKU or plan code)
+    503                                           simulated outage (--fail-rate)
+
+Repeating an Idempotency-Key returns the original reference. Use it for
+development and benchmarks, never in production:
+
+    python3 carrier_mock.py [--port 8765] [--latency-ms 50] [--fail-rate 0.1]
+    CARRIER_API_URL=http://127.0.0.1:8765 python3 outbox.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockCarrierHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections open between requests
+    wbufsize = -1  # send headers and body in one write; flushed after each request
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        if self.path != '/v1/activations':
+            return self._reply(404, {'message': 'Not found'})
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests_seen += 1
+        if random.random() < server.fail_rate:
+            return self._reply(503)
+        if not payload.get('device_sku') or not payload.get('plan_code'):
+            return self._reply(422, {'message': 'Device SKU and plan code are required'})
+
+        key = self.headers.get('Idempotency-Key') or uuid.uuid4().hex
+        with server.lock:
+            reference = server.activations.setdefault(key, f'BA-{uuid.uuid4().hex[:10].upper()}')
+        self._reply(200, {'reference': reference, 'message': f"Activated {payload.get('msisdn')}"})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def start_mock_server(host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0, quiet=True):
+    """Serve the mock API from a daemon thread; returns the server, with .url set"""
+    server = ThreadingHTTPServer((host, port), MockCarrierHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.quiet = quiet
+    server.lock = threading.Lock()
+    server.activations = {}
+    server.requests_seen = 0
+    server.url = f'http://{host}:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = start_mock_server(args.host, args.port, args.latency_ms / 1000, args.fail_rate, quiet=False)
+    print(f"✓ Mock carrier API on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
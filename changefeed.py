@@ -0,0 +1,151 @@
+"""
+Live order change feed.
+
+Order creates and status changes append a row to order_changes (see
+OrderChange.record) in the same transaction. Each web process runs one
+Broadcaster thread that polls the feed by seq and hands new changes to
+every open /orders/stream connection, so a thousand idle order boards cost
+one indexed query per poll instead of a thousand.
+
+Sequence numbers come from the primary key, so on databases with
+concurrent writers a lower seq can commit after a higher one is read. The
+feed never moves past such a gap until it fills or is older than
+GAP_GRACE (a rolled-back insert leaves one behind for good), so readers
+don't skip rows that were still in flight.
+"""
+import queue
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, select
+from models import db, OrderChange
+
+GAP_GRACE = timedelta(seconds=5)
+POLL_LIMIT = 500
+IDLE_POLL_SECONDS = 30  # keeps the position current while nobody is subscribed
+SUBSCRIBER_BUFFER = 1000
+
+
+def latest_seq():
+    """The highest seq written so far, or 0"""
+    return db.session.execute(select(func.max(OrderChange.seq))).scalar() or 0
+
+
+def oldest_seq():
+    """The lowest seq still kept, or None if the feed is empty"""
+    return db.session.execute(select(func.min(OrderChange.seq))).scalar()
+
+
+def changes_after(seq, upto=None, limit=POLL_LIMIT):
+    """
+    Changes with seq above `seq` (and at most `upto`), stopping at the first
+    recent gap; returns (changes, seq to resume after)
+    """
+    query = select(
+        OrderChange.seq, OrderChange.order_id, OrderChange.store_id, OrderChange.user_id,
+        OrderChange.status, OrderChange.kind, OrderChange.changed_at,
+    ).where(OrderChange.seq > seq)
+    if upto is not None:
+        query = query.where(OrderChange.seq <= upto)
+    rows = db.session.execute(query.order_by(OrderChange.seq).limit(limit)).all()
+
+    cutoff = datetime.utcnow() - GAP_GRACE
+    changes = []
+    for row in rows:
+        if upto is None and row.seq != seq + 1 and row.changed_at > cutoff:
+            break  # an earlier seq may still be committing
+        changes.append(row)
+        seq = row.seq
+    return changes, seq
+
+
+class Subscription:
+    """One stream's view of the broadcaster: a queue of change batches"""
+
+    def __init__(self, since):
+        self.since = since  # the broadcaster's position when subscribed
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.overflowed = False
+
+    def push(self, changes):
+        try:
+            self.queue.put_nowait(changes)
+        except queue.Full:
+            self.overflowed = True  # too slow; the stream tells the client to reload
+
+    def get(self, timeout):
+        """The next batch of changes, or [] after `timeout` seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+
+
+class Broadcaster:
+    """Polls order_changes every ORDER_STREAM_POLL_SECONDS and fans out new rows"""
+
+    def __init__(self, app):
+        self.app = app
+        self.poll = app.config['ORDER_STREAM_POLL_SECONDS']
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        with app.app_context():
+            self.seq = latest_seq()
+            db.session.remove()
+        threading.Thread(target=self._run, name='changefeed', daemon=True).start()
+
+    def subscribe(self):
+        with self.lock:
+            subscription = Subscription(self.seq)
+            self.subscribers.add(subscription)
+        self.wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    changes, seq = changes_after(self.seq)
+                    db.session.remove()
+            except Exception:
+                self.app.logger.exception('Order change feed poll failed')
+                changes, seq = [], self.seq
+            with self.lock:
+                self.seq = seq
+                if changes:
+                    for subscription in self.subscribers:
+                        subscription.push(changes)
+            if len(changes) < POLL_LIMIT:
+                self.wakeup.wait(self.poll if self.subscribers else IDLE_POLL_SECONDS)
+                self.wakeup.clear()
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    """This process's broadcaster, started on first use"""
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                _broadcaster = Broadcaster(current_app._get_current_object())
+    return _broadcaster
+
+
+def purge_changes(hours=None):
+    """Delete feed entries older than `hours` (ORDER_CHANGE_RETENTION_HOURS); return how many"""
+    hours = hours or current_app.config['ORDER_CHANGE_RETENTION_HOURS']
+    result = db.session.execute(
+        delete(OrderChange)
+        .where(OrderChange.changed_at < datetime.utcnow() - timedelta(hours=hours))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
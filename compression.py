@@ -0,0 +1,159 @@
+"""
+WSGI middleware that compresses responses on the fly.
+
+Used when the app is served without nginx in front (Railway, Procfile).
+Only responses whose content type is on the allowlist and whose body is at
+least `min_size` bytes are compressed. Brotli is preferred when the client
+accepts it and the brotli package is installed, otherwise gzip. The body is
+compressed as it streams, so large pages are never buffered in full.
+"""
+import zlib
+from itertools import chain
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+)
+
+
+class _GzipStream:
+    def __init__(self, level):
+        # wbits=31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """Compress allowlisted responses above a size threshold with brotli or gzip"""
+
+    def __init__(self, app, min_size=500, mimetypes=DEFAULT_MIMETYPES, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, environ):
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return None
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def __call__(self, environ, start_response):
+        encoding = self._choose_encoding(environ)
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        state = {}
+        written = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            state['status'], state['headers'], state['exc_info'] = status, headers, exc_info
+            # Legacy write() output is collected and sent ahead of the body
+            return written.append
+
+        body = self.app(environ, capture_start_response)
+        try:
+            return self._respond(encoding, state, written, body, start_response)
+        except BaseException:
+            if hasattr(body, 'close'):
+                body.close()
+            raise
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        if 'Content-Encoding' in headers:
+            return False
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        mimetype = headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if mimetype not in self.mimetypes:
+            return False
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def _respond(self, encoding, state, written, body, start_response):
+        headers = Headers(state['headers'])
+        if not self._should_compress(state['status'], headers):
+            start_response(state['status'], state['headers'], state['exc_info'])
+            return chain(written, body) if written else body
+
+        # Buffer until min_size is reached so small bodies of unknown length stay plain
+        iterator = chain(written, body)
+        buffered = []
+        size = 0
+        for chunk in iterator:
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= self.min_size:
+                break
+        else:
+            start_response(state['status'], state['headers'], state['exc_info'])
+            if hasattr(body, 'close'):
+                body.close()
+            return buffered
+
+        headers.remove('Content-Length')
+        headers['Content-Encoding'] = encoding
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+        # The compressed bytes differ from the identity body, so the ETag can only be weak
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}'
+        start_response(state['status'], headers.to_wsgi_list(), state['exc_info'])
+
+        stream = _BrotliStream(self.brotli_quality) if encoding == 'br' else _GzipStream(self.gzip_level)
+        return self._compress(stream, buffered, iterator, body)
+
+    @staticmethod
+    def _compress(stream, buffered, iterator, body):
+        try:
+            data = stream.compress(b''.join(buffered))
+            if data:
+                yield data
+            for chunk in iterator:
+                data = stream.compress(chunk)
+                if data:
+                    yield data
+            yield stream.flush()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
@@ -0,0 +1,89 @@
+"""
+Conditional GET support (ETag / Last-Modified).
+
+A page opts in with @conditional(validator). The validator receives the
+view's URL arguments and returns cheap state that changes whenever the page
+would - timestamps, counts and data_versions counters - without loading the
+objects the page renders. When the browser's copy still matches, the view
+is skipped and a 304 is returned.
+"""
+import hashlib
+import os
+from functools import wraps
+from flask import current_app, request, session, make_response
+from auth import get_current_user
+
+
+def template_fingerprint(app):
+    """Hash of every template file and the asset manifest, so a deploy that changes markup changes all ETags"""
+    digest = hashlib.sha1()
+    digest.update(repr(sorted(app.config.get('ASSET_MANIFEST', {}).items())).encode())
+    for root, _dirs, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def latest(*times):
+    """Most recent of the given datetimes, ignoring None"""
+    return max((t for t in times if t is not None), default=None)
+
+
+def _etag(parts):
+    user = get_current_user()
+    key = (
+        current_app.config.get('TEMPLATE_FINGERPRINT'),
+        request.full_path,
+        user.id if user else None,
+        user.version if user else None,
+        parts,
+    )
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def conditional(validator):
+    """
+    Decorator adding ETag/Last-Modified validation to a GET view.
+
+    `validator(**view_args)` returns (parts, last_modified) or None to skip
+    validation (e.g. the object does not exist and the view will 404).
+    last_modified (naive UTC) must cover everything in parts, since it alone
+    answers If-Modified-Since.
+    Place it below @login_required so anonymous requests are redirected first.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Pending flash messages are consumed by rendering, so always render
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return f(*args, **kwargs)
+
+            state = validator(**kwargs)
+            if state is None:
+                return f(*args, **kwargs)
+            parts, last_modified = state
+            etag = _etag(parts)
+
+            # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+            if request.if_none_match:
+                # Weak comparison: CompressionMiddleware weakens ETags it compresses
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(
+                    last_modified and since
+                    and last_modified.replace(microsecond=0) <= since.replace(tzinfo=None)
+                )
+
+            response = make_response('', 304) if not_modified else make_response(f(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                if last_modified:
+                    response.last_modified = last_modified
+                # Per-user pages: browsers may keep them but must revalidate each time
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            return response
+        return decorated_function
+    return decorator
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,6 +16,84 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///cellcom_orders.db'
     ADMIN_DEFAULT_PASSWORD = os.environ.get('ADMIN_DEFAULT_PASSWORD') or 'cellcom'
+    
+    # Password hashing (see passwords.py) - scrypt, pbkdf2 or argon2
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
+    PASSWORD_SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N') or 32768)
+    PASSWORD_SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R') or 8)
+    PASSWORD_SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P') or 1)
+    PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS') or 600000)
+    PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST') or 2)
+    PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST') or 19456)  # KiB
+    PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM') or 1)
+    # Max concurrent hash checks per worker process (0 = no limit)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    # Seconds an unknown login name is remembered per worker before the database is asked again (0 = off)
+    LOGIN_NEGATIVE_CACHE_TTL = int(os.environ.get('LOGIN_NEGATIVE_CACHE_TTL') or 30)
+    
+    # Server-side sessions (see sessions.py): 'sql' uses the app database, 'redis' a shared store
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'sql'
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL') or os.environ.get('REDIS_URL')
+    PERMANENT_SESSION_LIFETIME = timedelta(hours=int(os.environ.get('SESSION_LIFETIME_HOURS') or 12))
+    
+    # On-the-fly gzip/brotli (compression.py); set to 0 when nginx compresses instead
+    COMPRESS_RESPONSES = (os.environ.get('COMPRESS_RESPONSES') or '1') == '1'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 500)  # bytes
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL') or 6)
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY') or 4)
+    
+    # {% cache %} template fragments (fragments.py)
+    FRAGMENT_CACHE_ENABLED = (os.environ.get('FRAGMENT_CACHE_ENABLED') or '1') == '1'
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL') or 300)  # seconds
+    
+    # Hours an order may sit in a status before the SLA job (sla.py) raises an alert
+    ORDER_SLA_HOURS = {
+        'New': float(os.environ.get('ORDER_SLA_NEW_HOURS') or 24),
+        'Pending Activation': float(os.environ.get('ORDER_SLA_PENDING_HOURS') or 48),
+    }
+    
+    # Outbox worker (outbox.py)
+    OUTBOX_WORKER_THREADS = int(os.environ.get('OUTBOX_WORKER_THREADS') or 4)
+    OUTBOX_POLL_SECONDS = float(os.environ.get('OUTBOX_POLL_SECONDS') or 1)
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS') or 300)  # reclaimed after a worker dies
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS') or 8)  # then dead-lettered
+    OUTBOX_BACKOFF_SECONDS = float(os.environ.get('OUTBOX_BACKOFF_SECONDS') or 5)  # doubles per attempt
+    
+    # Carrier activation API (carrier.py); submissions are off while CARRIER_API_URL is unset
+    CARRIER_API_URL = os.environ.get('CARRIER_API_URL') or None
+    CARRIER_API_KEY = os.environ.get('CARRIER_API_KEY') or None
+    CARRIER_TIMEOUT_SECONDS = float(os.environ.get('CARRIER_TIMEOUT_SECONDS') or 10)
+    CARRIER_RATE_PER_SECOND = float(os.environ.get('CARRIER_RATE_PER_SECOND') or 10)
+    CARRIER_MAX_CONCURRENCY = int(os.environ.get('CARRIER_MAX_CONCURRENCY') or 8)  # also the connection pool size
+    CARRIER_BATCH_SIZE = int(os.environ.get('CARRIER_BATCH_SIZE') or 50)
+    CARRIER_BREAKER_FAILURES = int(os.environ.get('CARRIER_BREAKER_FAILURES') or 5)  # consecutive errors to open
+    CARRIER_BREAKER_RESET_SECONDS = float(os.environ.get('CARRIER_BREAKER_RESET_SECONDS') or 30)
+    
+    # Idempotency keys on order writes (idempotency.py)
+    IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS') or 24)  # replays work this long
+    IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS') or 5)  # for a duplicate in flight
+    
+    # Live order list (/orders/stream); enable once the gevent stream profile serves it (see gunicorn.conf.py)
+    ORDER_STREAM_ENABLED = (os.environ.get('ORDER_STREAM_ENABLED') or '0') == '1'
+    ORDER_STREAM_POLL_SECONDS = float(os.environ.get('ORDER_STREAM_POLL_SECONDS') or 1)
+    ORDER_STREAM_HEARTBEAT_SECONDS = float(os.environ.get('ORDER_STREAM_HEARTBEAT_SECONDS') or 15)
+    # Streams end after this long and the browser reconnects where it left off; keep below the worker timeout
+    ORDER_STREAM_MAX_SECONDS = float(os.environ.get('ORDER_STREAM_MAX_SECONDS') or 25)
+    ORDER_CHANGE_RETENTION_HOURS = int(os.environ.get('ORDER_CHANGE_RETENTION_HOURS') or 24)
+    
+    # Public order status lookup (/track, tracking.py)
+    STATUS_LOOKUP_CACHE_SECONDS = float(os.environ.get('STATUS_LOOKUP_CACHE_SECONDS') or 30)
+    STATUS_LOOKUP_PER_MINUTE = int(os.environ.get('STATUS_LOOKUP_PER_MINUTE') or 30)   # per client address and worker
+    STATUS_LOOKUP_FAILURES_PER_HOUR = int(os.environ.get('STATUS_LOOKUP_FAILURES_PER_HOUR') or 10)  # per order number
+    
+    # Customer pairs scoring at least this are listed as likely duplicates (dedup.py)
+    DEDUP_MIN_SCORE = float(os.environ.get('DEDUP_MIN_SCORE') or 0.6)
+    
+    # Reverse proxies in front of the app (nginx = 1); client addresses are read from X-Forwarded-For
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES') or 0)
+    
+    # Compiled Jinja templates shared by all workers (defaults to instance/jinja_bytecode)
+    TEMPLATE_BYTECODE_DIR = os.environ.get('TEMPLATE_BYTECODE_DIR')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
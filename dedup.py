@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Duplicate customer detection and merging.
+
+Nothing stops reps from creating the same customer twice, so a customer's
+orders end up spread across records. A scan groups customers by blocking
+keys (E.164 phone number, lowercased email, and the Soundex codes of the last and
+first names) and only compares customers that share a key, which keeps the
+work close to linear in the number of customers instead of comparing every
+pair. Blocks larger than MAX_BLOCK (a placeholder phone number, a very
+common name) are skipped, since pairs that share only such a key are noise.
+
+Each candidate pair is scored from 0 to 1; pairs scoring DEDUP_MIN_SCORE
+or more replace the contents of customer_duplicates for managers to review
+(/customers/duplicates). merge_customers() moves the duplicates' orders to
+the kept customer with one UPDATE (and one INSERT ... SELECT into the live
+order feed) and deletes them, in one transaction.
+
+Usage:
+    python3 dedup.py                     # scan and print the number of pairs found
+    python3 dedup.py --merge KEEP ID...  # merge customers ID... into KEEP
+"""
+import re
+import sys
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+from difflib import SequenceMatcher
+from flask import current_app
+from sqlalchemy import delete, literal, or_, select, update
+from models import db, Customer, CustomerDuplicate, Order, OrderChange, OutboxEvent, normalize_phone
+
+MAX_BLOCK = 100
+SCAN_BATCH = 5000
+INSERT_BATCH = 5000
+
+# Points each kind of evidence adds to a pair's score (capped at 1)
+WEIGHTS = {
+    'phone': 0.45,        # same E.164 phone number
+    'phone_typo': 0.25,   # one digit different or two swapped
+    'email': 0.35,        # same email address
+    'name': 0.35,         # times the name similarity (0-1)
+    'postal': 0.05,       # same postal code
+}
+
+_SOUNDEX_CODES = {letter: str(code) for code, letters in enumerate(
+    ('AEIOUYHW', 'BFPV', 'CGJKQSXZ', 'DT', 'L', 'MN', 'R')) for letter in letters}
+
+
+def soundex(name):
+    """American Soundex code of a name (e.g. Robert -> R163), or '' if it has no letters"""
+    letters = [c for c in _ascii(name).upper() if 'A' <= c <= 'Z']
+    if not letters:
+        return ''
+    code = letters[0]
+    previous = _SOUNDEX_CODES[letters[0]]
+    for letter in letters[1:]:
+        digit = _SOUNDEX_CODES[letter]
+        if digit != '0' and digit != previous:
+            code += digit
+        if letter not in 'HW':  # H and W don't separate letters with the same code
+            previous = digit
+    return (code + '000')[:4]
+
+
+def _ascii(text):
+    return unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+
+
+def comparable_name(first_name, last_name):
+    return ' '.join(re.sub(r'[^a-z ]', '', _ascii(f'{first_name} {last_name}').lower()).split())
+
+
+def email_key(email):
+    email = (email or '').strip().lower()
+    return email if '@' in email else None
+
+
+def _phone_typo(a, b):
+    """True if two digit strings differ in exactly one digit or one swap of neighbours"""
+    if len(a) != len(b):
+        return False
+    diff = [i for i in range(len(a)) if a[i] != b[i]]
+    return len(diff) == 1 or (len(diff) == 2 and diff[1] == diff[0] + 1
+                              and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+
+
+class Record:
+    """What scoring needs from a customer row, normalized once"""
+    __slots__ = ('id', 'name', 'phone', 'email', 'postal', 'name_key')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.name = comparable_name(row.first_name, row.last_name)
+        # Same E.164 form as the phone search; rows not backfilled yet are normalized here
+        self.phone = row.phone_e164 or normalize_phone(row.phone_number)
+        self.email = email_key(row.email)
+        self.postal = (row.postal_code or '').replace(' ', '').upper() or None
+        self.name_key = f'{soundex(row.last_name)}{soundex(row.first_name)}' if row.last_name else None
+
+    def blocking_keys(self):
+        if self.phone:
+            yield 'phone', self.phone
+        if self.email:
+            yield 'email', self.email
+        if self.name_key:
+            yield 'name', self.name_key
+
+
+def score(a, b, min_score=0.0):
+    """
+    (score 0-1, [reasons]) for two Records. Pairs that cannot reach
+    min_score even with identical names stop before the name comparison.
+    """
+    points = 0.0
+    reasons = []
+    if a.phone and a.phone == b.phone:
+        points += WEIGHTS['phone']
+        reasons.append('phone')
+    elif a.phone and b.phone and _phone_typo(a.phone, b.phone):
+        points += WEIGHTS['phone_typo']
+        reasons.append('phone_typo')
+    if a.email and a.email == b.email:
+        points += WEIGHTS['email']
+        reasons.append('email')
+    if points + WEIGHTS['name'] + WEIGHTS['postal'] < min_score:
+        return points, reasons
+    similarity = SequenceMatcher(None, a.name, b.name).ratio() if a.name and b.name else 0.0
+    if similarity >= 0.8:
+        reasons.append('name')
+    points += WEIGHTS['name'] * similarity
+    if a.postal and a.postal == b.postal:
+        points += WEIGHTS['postal']
+        reasons.append('postal')
+    return min(points, 1.0), reasons
+
+
+def candidate_pairs(records):
+    """(id, id) pairs sharing a blocking key, smaller id first; returns (pairs, blocks skipped)"""
+    blocks = defaultdict(list)
+    for record in records.values():
+        for key in record.blocking_keys():
+            blocks[key].append(record.id)
+    pairs = set()
+    skipped = 0
+    for ids in blocks.values():
+        if len(ids) > MAX_BLOCK:
+            skipped += 1
+            continue
+        for i, first in enumerate(ids):
+            for second in ids[i + 1:]:
+                pairs.add((first, second) if first < second else (second, first))
+    return pairs, skipped
+
+
+def load_records():
+    """Every customer as a Record, keyed by id, read in batches"""
+    query = select(Customer.id, Customer.first_name, Customer.last_name, Customer.phone_number,
+                   Customer.phone_e164, Customer.email, Customer.postal_code
+                   ).execution_options(yield_per=SCAN_BATCH)
+    return {row.id: Record(row) for row in db.session.execute(query)}
+
+
+def find_duplicates(min_score=None):
+    """Score every candidate pair and replace customer_duplicates; returns (pairs compared, duplicates found)"""
+    min_score = current_app.config['DEDUP_MIN_SCORE'] if min_score is None else min_score
+    records = load_records()
+    pairs, skipped = candidate_pairs(records)
+    if skipped:
+        current_app.logger.info('Customer dedup skipped %d blocks larger than %d', skipped, MAX_BLOCK)
+
+    found_at = datetime.utcnow()
+    found = []
+    for first, second in pairs:
+        points, reasons = score(records[first], records[second], min_score)
+        if points >= min_score:
+            found.append({'customer_id': first, 'duplicate_id': second, 'score': round(points, 3),
+                          'reasons': ','.join(reasons), 'found_at': found_at})
+
+    # One transaction, so the review page never sees a half-written scan
+    db.session.execute(delete(CustomerDuplicate))
+    for i in range(0, len(found), INSERT_BATCH):
+        db.session.execute(CustomerDuplicate.__table__.insert(), found[i:i + INSERT_BATCH])
+    db.session.commit()
+    return len(pairs), len(found)
+
+
+def scan_duplicates():
+    """Job entry point: rescan and return the number of duplicate pairs"""
+    return find_duplicates()[1]
+
+
+def merge_customers(keep_id, duplicate_ids):
+    """
+    Merge customers into keep_id in one transaction: their orders are moved
+    with a single UPDATE, blank contact fields on the kept customer are filled
+    from theirs, and they are deleted. Returns the number of orders moved.
+    """
+    duplicate_ids = sorted(set(duplicate_ids) - {keep_id})
+    if not duplicate_ids:
+        raise ValueError('Nothing to merge')
+    keep = db.session.get(Customer, keep_id)
+    duplicates = Customer.query.filter(Customer.id.in_(duplicate_ids)).order_by(Customer.id).all()
+    if keep is None or len(duplicates) != len(duplicate_ids):
+        raise ValueError('Customer not found; it may already have been merged')
+
+    for duplicate in duplicates:
+        for field in ('email', 'postal_code', 'preferred_store_id'):
+            if not getattr(keep, field) and getattr(duplicate, field):
+                setattr(keep, field, getattr(duplicate, field))
+        if duplicate.notes and duplicate.notes not in (keep.notes or ''):
+            keep.notes = f'{keep.notes}\n{duplicate.notes}' if keep.notes else duplicate.notes
+
+    now = datetime.utcnow()
+    # Feed entries for the live order lists, one per moved order, in this transaction
+    changes = (select(Order.id, Order.store_id, Order.user_id, Order.status, literal('customer'), literal(now))
+               .where(Order.customer_id.in_(duplicate_ids)))
+    db.session.execute(OrderChange.__table__.insert().from_select(
+        ['order_id', 'store_id', 'user_id', 'status', 'kind', 'changed_at'], changes))
+    moved = db.session.execute(
+        update(Order)
+        .where(Order.customer_id.in_(duplicate_ids))
+        .values(customer_id=keep_id, version=Order.version + 1, updated_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.execute(delete(CustomerDuplicate).where(or_(
+        CustomerDuplicate.customer_id.in_(duplicate_ids), CustomerDuplicate.duplicate_id.in_(duplicate_ids)
+    )))
+    for duplicate in duplicates:
+        db.session.delete(duplicate)
+    OutboxEvent.enqueue('customer.merged', customer_id=keep_id, merged_ids=duplicate_ids)
+    db.session.commit()
+    return moved
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        if '--merge' in sys.argv:
+            ids = [int(arg) for arg in sys.argv[sys.argv.index('--merge') + 1:]]
+            moved = merge_customers(ids[0], ids[1:])
+            print(f"✓ Merged {len(ids) - 1} customer(s) into {ids[0]}, moving {moved} order(s)")
+        else:
+            compared, found = find_duplicates()
+            print(f"✓ Compared {compared} candidate pairs, found {found} likely duplicates")
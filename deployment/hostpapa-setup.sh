@@ -27,9 +27,17 @@ pip install --upgrade pip
 echo "Installing dependencies..."
 pip install -r requirements.txt
 
+# Fingerprint and precompress static assets
+echo "Building static assets..."
+python3 assets.py
+
 # Create instance directory if it doesn't exist
 mkdir -p instance
 
+# Precompile templates into the shared bytecode cache (instance/jinja_bytecode)
+echo "Precompiling templates..."
+python3 warmup.py
+
 # Set permissions
 echo "Setting file permissions..."
 find . -type d -exec chmod 755 {} \;
@@ -0,0 +1,53 @@
+"""
+Jinja fragment caching.
+
+    {% cache ('order-row', order.id, order.updated_at, versions), 600 %}
+        ...markup...
+    {% endcache %}
+
+The key is any expression (tuples are joined into a string); the optional
+second argument is a TTL in seconds, defaulting to FRAGMENT_CACHE_TTL. Keys
+should include whatever the markup depends on - an id plus updated_at, or a
+data_versions counter - so a changed entity simply misses the cache. Any
+queries or lazy loads inside the block only run on a miss.
+"""
+from jinja2 import nodes
+from jinja2.ext import Extension
+from cache import fragment_cache
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=fragment_cache, fragment_cache_ttl=300, fragment_cache_enabled=True)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', args), [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key, ttl, caller):
+        env = self.environment
+        if not env.fragment_cache_enabled:
+            return caller()
+        if isinstance(key, (tuple, list)):
+            key = ':'.join(str(part) for part in key)
+        rendered = env.fragment_cache.get(key)
+        if rendered is None:
+            rendered = caller()
+            env.fragment_cache.set(key, rendered, ttl=ttl if ttl is not None else env.fragment_cache_ttl)
+        return rendered
+
+
+def init_fragment_cache(app):
+    """Enable {% cache %} in the app's templates"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache_ttl = app.config['FRAGMENT_CACHE_TTL']
+    app.jinja_env.fragment_cache_enabled = app.config['FRAGMENT_CACHE_ENABLED']
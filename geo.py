@@ -0,0 +1,300 @@
+"""
+Store geography: distances and a nearest-store spatial index.
+
+Active stores with coordinates are held in an in-memory KD-tree over 3D
+unit vectors, so nearest-N queries take well under a millisecond even for
+thousands of stores. Straight-line (chord) distance between unit vectors
+orders points exactly like great-circle distance, which is converted back
+to kilometres for display.
+
+Postal codes are located offline through the postal_areas table of FSA
+centroids (see seed/seed_postal_areas.py), falling back to the centroid of
+stores sharing the FSA. When NumPy is installed, scoring every store
+against a point is a single vectorized haversine pass.
+
+The index and the FSA lookup are rebuilt whenever their version in
+data_versions changes, so edits are picked up on the next lookup in every
+worker.
+"""
+import heapq
+import math
+import threading
+from collections import namedtuple
+from models import db, Store, PostalArea
+from versions import get_versions
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; distances fall back to a Python loop
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+
+StorePoint = namedtuple('StorePoint', 'id name city province postal_code latitude longitude')
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def haversine_km_many(lat, lon, lats, lons):
+    """Great-circle distances in kilometres from (lat, lon) to arrays of radians"""
+    lat, lon = math.radians(lat), math.radians(lon)
+    a = (np.sin((lats - lat) / 2) ** 2
+         + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _chord_to_km(chord_squared):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_squared) / 2))
+
+
+class StoreIndex:
+    """KD-tree of store locations supporting nearest-N queries"""
+
+    def __init__(self, points):
+        self.points = list(points)
+        self._vectors = [_unit_vector(p.latitude, p.longitude) for p in self.points]
+        self._by_id = {p.id: p for p in self.points}
+        self._root = self._build(list(range(len(self.points))), 0)
+        if np is not None:
+            self._lats = np.radians(np.array([p.latitude for p in self.points], dtype=float))
+            self._lons = np.radians(np.array([p.longitude for p in self.points], dtype=float))
+        # (fsa, postal_areas version) -> suggested store id
+        self.suggestions = {}
+
+    def _build(self, indices, depth):
+        """Node = (point index, split axis, left subtree, right subtree)"""
+        if not indices:
+            return None
+        axis = depth % 3
+        indices.sort(key=lambda i: self._vectors[i][axis])
+        mid = len(indices) // 2
+        return (indices[mid], axis,
+                self._build(indices[:mid], depth + 1),
+                self._build(indices[mid + 1:], depth + 1))
+
+    def get(self, store_id):
+        return self._by_id.get(store_id)
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, lat, lon, n=5):
+        """Return [(StorePoint, distance_km)] for the n stores closest to (lat, lon)"""
+        if n <= 0 or self._root is None:
+            return []
+        target = _unit_vector(lat, lon)
+        best = []  # max-heap of (-chord², index)
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            vector = self._vectors[index]
+            dist2 = sum((vector[k] - target[k]) ** 2 for k in range(3))
+            if len(best) < n:
+                heapq.heappush(best, (-dist2, index))
+            elif dist2 < -best[0][0]:
+                heapq.heapreplace(best, (-dist2, index))
+
+            diff = target[axis] - vector[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            # Only cross the splitting plane if it is closer than the current n-th best
+            if len(best) < n or diff * diff < -best[0][0]:
+                visit(far)
+
+        visit(self._root)
+        return [(self.points[i], _chord_to_km(-d)) for d, i in sorted(best, reverse=True)]
+
+    def scores(self, lat, lon):
+        """Distance in km from (lat, lon) to every indexed store, in self.points order"""
+        if np is not None:
+            return haversine_km_many(lat, lon, self._lats, self._lons)
+        return [haversine_km(lat, lon, p.latitude, p.longitude) for p in self.points]
+
+    def distances_from(self, lat, lon):
+        """Return {store_id: distance_km} for every indexed store"""
+        return dict(zip((p.id for p in self.points), map(float, self.scores(lat, lon))))
+
+    def closest(self, lat, lon):
+        """Return (StorePoint, distance_km) for the closest store, or None if empty"""
+        if not self.points:
+            return None
+        scores = self.scores(lat, lon)
+        if np is not None:
+            best = int(np.argmin(scores))
+        else:
+            best = min(range(len(scores)), key=scores.__getitem__)
+        return self.points[best], float(scores[best])
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_store_index():
+    """Return the store index, rebuilding it if stores changed since it was built"""
+    global _index, _index_version
+    version = get_versions('stores').get('stores')
+    if _index is None or version != _index_version:
+        with _index_lock:
+            if _index is None or version != _index_version:
+                rows = db.session.query(
+                    Store.id, Store.name, Store.city, Store.province, Store.postal_code,
+                    Store.latitude, Store.longitude
+                ).filter(
+                    Store.is_active == True,
+                    Store.latitude.isnot(None),
+                    Store.longitude.isnot(None)
+                ).all()
+                _index = StoreIndex(
+                    StorePoint(r.id, r.name, r.city, r.province, r.postal_code,
+                               float(r.latitude), float(r.longitude))
+                    for r in rows
+                )
+                _index_version = version
+    return _index
+
+
+_postal_areas = None
+_postal_areas_version = None
+
+
+def get_postal_areas():
+    """Return {fsa: (lat, lon)} from postal_areas, reloaded when the table changes"""
+    global _postal_areas, _postal_areas_version
+    version = get_versions('postal_areas').get('postal_areas')
+    if _postal_areas is None or version != _postal_areas_version:
+        with _index_lock:
+            if _postal_areas is None or version != _postal_areas_version:
+                rows = db.session.query(PostalArea.fsa, PostalArea.latitude, PostalArea.longitude).all()
+                _postal_areas = {r.fsa: (float(r.latitude), float(r.longitude)) for r in rows}
+                _postal_areas_version = version
+    return _postal_areas
+
+
+def normalize_postal_code(postal_code):
+    """'h2x 1y4' -> 'H2X1Y4'"""
+    return ''.join((postal_code or '').split()).upper()
+
+
+def locate_postal_code(postal_code):
+    """
+    Approximate (lat, lon) for a postal code, or None.
+
+    Looks up the forward sortation area (first three characters of the
+    postal code) in postal_areas; if it is not there, uses the centroid of
+    indexed stores in the same FSA.
+    """
+    fsa = normalize_postal_code(postal_code)[:3]
+    if len(fsa) != 3:
+        return None
+    centroid = get_postal_areas().get(fsa)
+    if centroid is not None:
+        return centroid
+    matches = [p for p in get_store_index().points
+               if normalize_postal_code(p.postal_code).startswith(fsa)]
+    if not matches:
+        return None
+    return (sum(p.latitude for p in matches) / len(matches),
+            sum(p.longitude for p in matches) / len(matches))
+
+
+def valid_coordinates(lat, lon):
+    """True for a finite latitude in -90..90 and longitude in -180..180 (NaN and inf fail)"""
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
+
+def parse_location(text):
+    """Turn 'lat,lng' or a postal code into (lat, lon), or None if unknown"""
+    text = (text or '').strip()
+    if ',' in text:
+        try:
+            lat, lon = (float(part) for part in text.split(',', 1))
+        except ValueError:
+            return None
+        if valid_coordinates(lat, lon):
+            return lat, lon
+        return None
+    return locate_postal_code(text)
+
+
+def nearest_stores(lat, lon, n=5):
+    """[(StorePoint, distance_km)] for the n active stores closest to (lat, lon)"""
+    return get_store_index().nearest(lat, lon, n)
+
+
+def sort_stores_by_distance(stores, origin_store_id):
+    """
+    Order stores for the picker by distance from origin_store_id.
+
+    City groups are kept together: cities are ordered by their closest
+    store, and stores within a city by distance. Stores without coordinates
+    go last. Returns stores unchanged if the origin has no coordinates.
+    """
+    index = get_store_index()
+    origin = index.get(origin_store_id) if origin_store_id else None
+    if origin is None:
+        return list(stores)
+
+    distances = index.distances_from(origin.latitude, origin.longitude)
+    stores = list(stores)
+    city_distance = {}
+    for store in stores:
+        key = (store.city, store.province)
+        city_distance[key] = min(city_distance.get(key, math.inf), distances.get(store.id, math.inf))
+    return sorted(stores, key=lambda s: (city_distance[(s.city, s.province)], s.city,
+                                         distances.get(s.id, math.inf), s.name))
+
+
+def _fsa(postal_code):
+    fsa = normalize_postal_code(postal_code)[:3]
+    return fsa if len(fsa) == 3 else None
+
+
+def _suggest(index, fsa):
+    # Memoized on the index, so it is dropped whenever stores or postal_areas change
+    key = (fsa, _postal_areas_version)
+    if key not in index.suggestions:
+        location = locate_postal_code(fsa)
+        closest = index.closest(*location) if location else None
+        index.suggestions[key] = closest[0].id if closest else None
+    return index.suggestions[key]
+
+
+def suggest_store(postal_code):
+    """Id of the active store closest to a postal code's FSA, or None if it can't be located"""
+    fsa = _fsa(postal_code)
+    if fsa is None:
+        return None
+    get_postal_areas()
+    return _suggest(get_store_index(), fsa)
+
+
+def default_stores_for(customers):
+    """
+    {customer id: store id} for the given customers: the preferred store,
+    else the store closest to their postal code. Customers with neither
+    are left out.
+    """
+    get_postal_areas()
+    index = get_store_index()
+    defaults = {}
+    for customer in customers:
+        fsa = _fsa(customer.postal_code)
+        store_id = customer.preferred_store_id or (_suggest(index, fsa) if fsa else None)
+        if store_id:
+            defaults[customer.id] = store_id
+    return defaults
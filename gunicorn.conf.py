@@ -0,0 +1,36 @@
+"""
+Gunicorn settings, loaded automatically from the working directory
+
+Command-line options (Procfile, railway.json, gunicorn.service) still
+take precedence over anything set here.
+
+GUNICORN_PROFILE=stream runs gevent workers for the live order list
+(/orders/stream): each idle Server-Sent Events connection is a greenlet
+rather than a whole sync worker, so one process holds thousands of them.
+Serve it on its own port and route /orders/stream to it (see
+deployment/nginx.conf.example and deployment/stream.service.example).
+"""
+import os
+
+if os.environ.get('GUNICORN_PROFILE') == 'stream':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('STREAM_WORKER_CONNECTIONS') or 2000)
+    # gevent workers keep answering the arbiter while streams are open, so streams can run long
+    os.environ.setdefault('ORDER_STREAM_MAX_SECONDS', '300')
+
+    def post_fork(server, worker):
+        """Make psycopg2 yield to other greenlets while waiting on PostgreSQL"""
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            return
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    """Warm templates, mappers and query caches before the worker takes traffic"""
+    from flask import Flask
+    from warmup import warm_up
+
+    if isinstance(worker.wsgi, Flask):
+        warm_up(worker.wsgi)
@@ -0,0 +1,154 @@
+"""
+Idempotency keys for write requests.
+
+A client that may retry a write sends a unique key with it, either as an
+Idempotency-Key header (API) or an idempotency_key form field (filled in by
+main.js on forms marked data-idempotent). The first request with a key
+claims it by inserting a row into idempotency_keys, runs, and stores its
+response there; retries with the same key get that response replayed
+instead of running again. Keys are scoped to the signed-in user.
+
+A retry that arrives while the original is still running waits up to
+IDEMPOTENCY_WAIT_SECONDS for it to finish. Reusing a key for a different
+request (method, path or body) is rejected. Responses of 500 and above are
+not stored, so the key can be retried. Rows expire after
+IDEMPOTENCY_TTL_HOURS and are purged by a background job.
+"""
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, flash, jsonify, make_response, redirect, request, url_for, Response
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+from auth import current_user
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 255
+# Response headers worth replaying; cookies and session headers are per request
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+WAIT_INTERVAL = 0.05
+
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data(cache=True))  # read before request.form so the body stays available
+    return digest.hexdigest()
+
+
+def _claim(user_id, key, request_hash):
+    """Insert the key; returns (True, None) if this request now owns it, else (False, existing row or None)"""
+    now = datetime.utcnow()
+    ttl = timedelta(hours=current_app.config['IDEMPOTENCY_TTL_HOURS'])
+    existing = None
+    for _ in range(2):
+        db.session.add(IdempotencyKey(user_id=user_id, key=key, request_hash=request_hash,
+                                      status='in_progress', created_at=now, expires_at=now + ttl))
+        try:
+            db.session.commit()
+            return True, None
+        except IntegrityError:
+            db.session.rollback()
+        existing = db.session.get(IdempotencyKey, (user_id, key), populate_existing=True)
+        if existing is not None and existing.expires_at > now:
+            return False, existing
+        if existing is not None:
+            # An expired key is free to reuse
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id,
+                                                            IdempotencyKey.key == key,
+                                                            IdempotencyKey.expires_at <= now))
+            db.session.commit()
+        # else the owner failed and freed the key just now; try once more
+    return False, existing
+
+
+def _wait_for(record):
+    """Poll an in-progress key until it finishes or IDEMPOTENCY_WAIT_SECONDS pass"""
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_SECONDS']
+    while record is not None and record.status == 'in_progress' and time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        db.session.rollback()  # end the read transaction so the next read sees new commits
+        record = db.session.get(IdempotencyKey, (record.user_id, record.key), populate_existing=True)
+    return record
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    for name, value in json.loads(record.response_headers or '{}').items():
+        response.headers[name] = value
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _reject(message, status):
+    if request.is_json or request.blueprint == 'api':
+        return jsonify({'error': message}), status
+    flash(message, 'error')
+    return redirect(request.referrer or url_for('orders.list_orders'))
+
+
+def _release(user_id, key, response=None):
+    """Store the response for replays, or free the key if there is nothing to store"""
+    where = (IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    if response is None or response.status_code >= 500:
+        db.session.execute(delete(IdempotencyKey).where(*where))
+    else:
+        headers = {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers}
+        db.session.execute(update(IdempotencyKey).where(*where).values(
+            status='done',
+            response_status=response.status_code,
+            response_headers=json.dumps(headers),
+            response_body=response.get_data(),
+        ))
+    db.session.commit()
+
+
+def idempotent(f):
+    """Run the decorated write view at most once per idempotency key; place after login checks"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method not in ('POST', 'PUT', 'PATCH', 'DELETE'):
+            return f(*args, **kwargs)
+        request_hash = _request_hash()
+        key = request.headers.get(HEADER) or request.form.get(FORM_FIELD)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _reject(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters', 400)
+
+        user_id = current_user.id
+        owned, existing = _claim(user_id, key, request_hash)
+        if not owned:
+            if existing is not None and existing.request_hash != request_hash:
+                return _reject(f'This {HEADER} was already used for a different request', 422)
+            existing = _wait_for(existing)
+            if existing is None:
+                return _reject('The original request did not complete; please try again', 409)
+            if existing.status != 'done':
+                return _reject('A request with this key is still in progress', 409)
+            return _replay(existing)
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _release(user_id, key)
+            raise
+        db.session.rollback()  # nothing the view left uncommitted belongs in the key's transaction
+        _release(user_id, key, response)
+        return response
+    return decorated_function
+
+
+def purge_expired():
+    """Delete keys past their TTL; return how many"""
+    result = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
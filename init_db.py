@@ -8,6 +8,7 @@ from app import create_app
 from models import db
 import seed.seed_users as seed_users
 import seed.seed_stores as seed_stores
+import seed.seed_postal_areas as seed_postal_areas
 import seed.seed_customers as seed_customers
 import seed.seed_phones as seed_phones
 import seed.seed_rate_plans as seed_rate_plans
@@ -26,6 +27,7 @@ def init_database():
         
         try:
             seed_stores.seed_stores()
+            seed_postal_areas.seed_postal_areas()
             seed_users.seed_users()
             seed_customers.seed_customers()
             seed_phones.seed_phones()
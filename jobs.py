@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Background jobs
+
+Each job is a function run in an app context every `interval` seconds by a
+single scheduler process running next to the web workers. Jobs are
+incremental and idempotent, so a missed or repeated run is harmless.
+
+Usage:
+    python3 jobs.py                # run the scheduler until stopped
+    python3 jobs.py --once         # run every job once (e.g. from cron)
+    python3 jobs.py rep_rollups    # run the named job(s) once
+"""
+import sys
+import time
+from collections import namedtuple
+from analytics import refresh_status_intervals, refresh_rep_rollups
+from sla import check_slas
+from outbox import purge_processed
+from changefeed import purge_changes
+from idempotency import purge_expired
+from tracking import rebuild_status_lookup
+from dedup import scan_duplicates
+
+Job = namedtuple('Job', 'name func interval')
+
+JOBS = [
+    Job('status_intervals', refresh_status_intervals, 60),
+    Job('rep_rollups', refresh_rep_rollups, 300),
+    Job('sla_alerts', check_slas, 60),
+    Job('outbox_purge', purge_processed, 3600),
+    Job('order_changes_purge', purge_changes, 3600),
+    Job('idempotency_purge', purge_expired, 3600),
+    Job('status_lookup', rebuild_status_lookup, 3600),
+    Job('customer_dedup', scan_duplicates, 24 * 3600),
+]
+
+
+def run_job(app, job):
+    """Run one job in its own app context; errors are logged, not raised"""
+    from models import db
+
+    start = time.perf_counter()
+    with app.app_context():
+        try:
+            result = job.func()
+            app.logger.info('Job %s: %s in %.0f ms', job.name, result, (time.perf_counter() - start) * 1000)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Job %s failed', job.name)
+
+
+def run_forever(app, jobs=JOBS):
+    """Run each job every job.interval seconds"""
+    next_run = {job.name: 0.0 for job in jobs}
+    while True:
+        for job in jobs:
+            if time.monotonic() >= next_run[job.name]:
+                run_job(app, job)
+                next_run[job.name] = time.monotonic() + job.interval
+        time.sleep(max(0.0, min(next_run.values()) - time.monotonic()))
+
+
+if __name__ == '__main__':
+    import logging
+    from app import create_app
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    app = create_app()
+    args = sys.argv[1:]
+    if not args:
+        run_forever(app)
+    else:
+        by_name = {job.name: job for job in JOBS}
+        unknown = [name for name in args if name != '--once' and name not in by_name]
+        if unknown:
+            sys.exit(f"Unknown job(s): {', '.join(unknown)}. Available: {', '.join(by_name)}")
+        for job in JOBS if args == ['--once'] else [by_name[name] for name in args if name != '--once']:
+            run_job(app, job)
@@ -1,37 +1,127 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.exc import StaleDataError
 from datetime import datetime
+import json
+import re
+import passwords
+from cache import unknown_login_names, user_choices
 
 db = SQLAlchemy()
 
+
+def normalize_name(name):
+    """Normalize a first name for case-insensitive login lookups"""
+    return (name or '').strip().casefold()
+
+
+def normalize_phone(number):
+    """
+    E.164 form of a phone number (+15145550101), or None if it doesn't look
+    like one. Ten-digit numbers are North American; other countries must be
+    written with a leading +. Extensions (x123, ext. 123) are dropped.
+    """
+    number = re.split(r'(?:x|ext\.?|#)', (number or '').strip().lower())[0]
+    digits = re.sub(r'\D', '', number)
+    if number.startswith('+'):
+        return f'+{digits}' if 8 <= len(digits) <= 15 and not digits.startswith('0') else None
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    if len(digits) == 10 and digits[0] not in '01':
+        return f'+1{digits}'
+    return None
+
+
 class User(db.Model):
     """User model for authentication"""
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(100), unique=True, nullable=False)
+    first_name_normalized = db.Column(db.String(100), unique=True, index=True, nullable=False)  # Login lookup key
     role = db.Column(db.String(20), nullable=False, default='rep')  # rep, manager, admin
     password_hash = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(255), nullable=True)
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=True)  # Store assignment
+    is_active = db.Column(db.Boolean, nullable=False, default=True)  # Inactive users are signed out on their next request
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on every update; keys the current-user cache
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     orders = db.relationship('Order', backref='user', lazy=True)
     status_changes = db.relationship('OrderStatusHistory', backref='user', lazy=True)
     
+    @validates('first_name')
+    def _sync_first_name_normalized(self, key, value):
+        """Keep the normalized login key in step with first_name"""
+        self.first_name_normalized = normalize_name(value)
+        unknown_login_names.delete(self.first_name_normalized)
+        return value
+    
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
     
     def check_password(self, password):
         """Check password against hash"""
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify_password_bounded(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """True if the stored hash predates the configured algorithm/cost"""
+        return passwords.needs_rehash(self.password_hash)
+    
+    @classmethod
+    def choices(cls):
+        """(id, first_name) rows for filter dropdowns, cached briefly across requests"""
+        rows = user_choices.get('all')
+        if rows is None:
+            rows = db.session.query(cls.id, cls.first_name).order_by(cls.first_name).all()
+            user_choices.set('all', rows)
+        return rows
     
     def __repr__(self):
         return f'<User {self.first_name}>'
 
 
+@event.listens_for(User, 'before_update')
+def _bump_user_version(mapper, connection, target):
+    target.version = (target.version or 0) + 1
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _clear_user_choices(mapper, connection, target):
+    user_choices.clear()
+
+
+class UserSession(db.Model):
+    """Server-side session (see sessions.py); user_id indexes a user's sessions"""
+    __tablename__ = 'user_sessions'
+    
+    sid = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserSession user={self.user_id}>'
+
+
+class DataVersion(db.Model):
+    """Change counter per reference table, bumped on every write (see versions.py)"""
+    __tablename__ = 'data_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)  # table name
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
+
+
 class Store(db.Model):
     """Store location model"""
     __tablename__ = 'stores'
@@ -82,7 +172,9 @@ class Customer(db.Model):
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=False)
     phone_number = db.Column(db.String(20), nullable=False)
+    phone_e164 = db.Column(db.String(16), nullable=True)  # phone_number normalized on write; None if unparseable
     email = db.Column(db.String(255), nullable=True)
+    postal_code = db.Column(db.String(10), nullable=True)  # Used to suggest the nearest store
     preferred_store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=True)
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -91,6 +183,27 @@ class Customer(db.Model):
     orders = db.relationship('Order', backref='customer', lazy=True)
     preferred_store_rel = db.relationship('Store', foreign_keys=[preferred_store_id], backref='preferred_customers')
     
+    __table_args__ = (
+        # Not unique: duplicate customers share numbers until merged (see dedup.py)
+        db.Index('ix_customers_phone_e164', 'phone_e164',
+                 sqlite_where=db.text('phone_e164 IS NOT NULL'),
+                 postgresql_where=db.text('phone_e164 IS NOT NULL')),
+    )
+    
+    @validates('phone_number')
+    def _sync_phone_e164(self, key, value):
+        """Keep the indexed E.164 number in step with phone_number"""
+        self.phone_e164 = normalize_phone(value)
+        return value
+    
+    @classmethod
+    def find_by_phone(cls, number):
+        """Customers whose phone matches `number` in any formatting: one index lookup"""
+        e164 = normalize_phone(number)
+        if e164 is None:
+            return []
+        return cls.query.filter(cls.phone_e164 == e164).order_by(cls.id).all()
+    
     def __repr__(self):
         return f'<Customer {self.first_name} {self.last_name}>'
     
@@ -99,6 +212,19 @@ class Customer(db.Model):
         return f"{self.first_name} {self.last_name}"
 
 
+class PostalArea(db.Model):
+    """Centroid of a Canadian forward sortation area (first 3 characters of a postal code)"""
+    __tablename__ = 'postal_areas'
+    
+    fsa = db.Column(db.String(3), primary_key=True)  # e.g. H2X
+    province = db.Column(db.String(10), nullable=True)
+    latitude = db.Column(db.Numeric(10, 7), nullable=False)
+    longitude = db.Column(db.Numeric(10, 7), nullable=False)
+    
+    def __repr__(self):
+        return f'<PostalArea {self.fsa}>'
+
+
 class Phone(db.Model):
     """Phone/Device model"""
     __tablename__ = 'phones'
@@ -146,11 +272,29 @@ class RatePlan(db.Model):
         return f'<RatePlan {self.name}>'
 
 
+class OrderConflict(Exception):
+    """An order changed since the caller read it; `order` holds its current state"""
+    
+    def __init__(self, order):
+        super().__init__(f'Order {order.order_number} was changed by someone else (now {order.status})')
+        self.order = order
+
+
 class Order(db.Model):
     """Order model"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_store_created', 'store_id', 'created_at'),
+        db.Index('ix_orders_updated', 'updated_at'),
+        db.Index('ix_orders_status_updated', 'status', 'updated_at'),
+        db.Index('ix_orders_customer', 'customer_id', 'id'),  # a customer's orders, newest first
+    )
+    
+    STATUSES = ('New', 'Pending Activation', 'Activated', 'Cancelled', 'Returned')
     
     id = db.Column(db.Integer, primary_key=True)
+    # Every ORM UPDATE matches on and increments this (optimistic locking), see update_status
+    version = db.Column(db.Integer, nullable=False, default=1)
     order_number = db.Column(db.String(50), unique=True, nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -159,7 +303,6 @@ class Order(db.Model):
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
     store_location = db.Column(db.String(255), nullable=True)  # Keep for backwards compatibility, can be derived from store
     status = db.Column(db.String(50), nullable=False, default='New')
-    # Valid statuses: New, Pending Activation, Activated, Cancelled, Returned
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     activation_date = db.Column(db.DateTime, nullable=True)
@@ -168,11 +311,62 @@ class Order(db.Model):
     # Relationships
     status_history = db.relationship('OrderStatusHistory', backref='order', lazy=True, order_by='OrderStatusHistory.changed_at')
     
+    __mapper_args__ = {'version_id_col': version}
+    
     def __repr__(self):
         return f'<Order {self.order_number}>'
     
-    def update_status(self, new_status, user_id, comment=None):
-        """Update order status and create history entry"""
+    @staticmethod
+    def next_order_number():
+        """Next order number in the CEL-YYYY-XXXX sequence"""
+        last_order = Order.query.order_by(Order.id.desc()).first()
+        next_num = 1
+        if last_order and last_order.order_number:
+            try:
+                next_num = int(last_order.order_number.split('-')[-1]) + 1
+            except (ValueError, IndexError):
+                pass
+        return f"CEL-{datetime.now().year}-{next_num:04d}"
+    
+    @classmethod
+    def create(cls, customer_id, phone_id, rate_plan_id, store, user_id, notes=''):
+        """Add a New order with its first history entry to the current transaction"""
+        order = cls(
+            order_number=cls.next_order_number(),
+            customer_id=customer_id,
+            user_id=user_id,
+            phone_id=phone_id,
+            rate_plan_id=rate_plan_id,
+            store_id=store.id,
+            store_location=store.display_name,  # Store display name for legacy compatibility
+            status='New',
+            notes=notes
+        )
+        db.session.add(order)
+        db.session.flush()  # Get order ID
+        
+        db.session.add(OrderStatusHistory(
+            order_id=order.id,
+            old_status='',
+            new_status='New',
+            changed_by_user_id=user_id,
+            comment='Order created'
+        ))
+        OutboxEvent.enqueue('order.created', order_id=order.id, user_id=user_id)
+        OrderChange.record(order, 'created')
+        return order
+    
+    def update_status(self, new_status, user_id, comment=None, expected_version=None):
+        """
+        Update order status and create history entry.
+        
+        Pass the version the user saw as expected_version. The UPDATE only
+        matches the version loaded here, so a change committed by anyone
+        else since (or since the user's read) raises OrderConflict instead
+        of recording a transition that never happened. No row is locked.
+        """
+        if expected_version is not None and expected_version != self.version:
+            raise OrderConflict(self)
         old_status = self.status
         self.status = new_status
         self.updated_at = datetime.utcnow()
@@ -190,7 +384,17 @@ class Order(db.Model):
             comment=comment
         )
         db.session.add(history)
-        db.session.commit()
+        # Side effects run in the outbox worker once this commits
+        OutboxEvent.enqueue('order.status_changed', order_id=self.id, old_status=old_status,
+                            new_status=new_status, user_id=user_id)
+        if new_status == 'Pending Activation':
+            OutboxEvent.enqueue('carrier.activate', order_id=self.id, user_id=user_id)
+        OrderChange.record(self, 'status')
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()  # expires self, so the conflict carries the current row
+            raise OrderConflict(self)
         
         return history
 
@@ -200,7 +404,7 @@ class OrderStatusHistory(db.Model):
     __tablename__ = 'order_status_history'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
     old_status = db.Column(db.String(50), nullable=False)
     new_status = db.Column(db.String(50), nullable=False)
     changed_by_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -210,3 +414,210 @@ class OrderStatusHistory(db.Model):
     def __repr__(self):
         return f'<OrderStatusHistory {self.old_status} -> {self.new_status}>'
 
+
+
+class StatusInterval(db.Model):
+    """
+    Time an order spent in one status, derived from order_status_history
+    (see analytics.py). left_at is NULL while the order is still in it.
+    """
+    __tablename__ = 'status_intervals'
+    __table_args__ = (
+        db.Index('ix_status_intervals_status_seconds', 'status', 'seconds'),
+        db.Index('ix_status_intervals_open', 'status', 'left_at', 'entered_at'),
+    )
+    
+    history_id = db.Column(db.Integer, db.ForeignKey('order_status_history.id'), primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    status = db.Column(db.String(50), nullable=False)
+    next_status = db.Column(db.String(50), nullable=True)
+    entered_at = db.Column(db.DateTime, nullable=False)
+    left_at = db.Column(db.DateTime, nullable=True)
+    seconds = db.Column(db.Float, nullable=True)
+    
+    def __repr__(self):
+        return f'<StatusInterval order={self.order_id} {self.status}>'
+
+
+class AnalyticsState(db.Model):
+    """High-water mark of an incremental job (see analytics.py and sla.py)"""
+    __tablename__ = 'analytics_state'
+    
+    name = db.Column(db.String(50), primary_key=True)  # derived table or job name
+    high_water = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<AnalyticsState {self.name}@{self.high_water}>'
+
+
+class RepMonthlyRollup(db.Model):
+    """Per-rep monthly sales totals, filled by a background job (see analytics.py)"""
+    __tablename__ = 'rep_monthly_rollups'
+    
+    month = db.Column(db.Date, primary_key=True)  # First day of the month (UTC)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    orders_created = db.Column(db.Integer, nullable=False, default=0)
+    orders_activated = db.Column(db.Integer, nullable=False, default=0)
+    device_revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)  # Phone.full_price of activations
+    plan_revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)  # RatePlan.monthly_price of activations
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RepMonthlyRollup {self.month} user={self.user_id}>'
+
+
+class OrderAlert(db.Model):
+    """
+    SLA breach raised by the SLA job (see sla.py). Order details are copied
+    in so the watchlist reads this table alone; resolved_at is set once the
+    order moves on.
+    """
+    __tablename__ = 'order_alerts'
+    __table_args__ = (
+        db.UniqueConstraint('order_id', 'status', 'status_since', name='uq_order_alerts_breach'),
+        db.Index('ix_order_alerts_open', 'resolved_at', 'status_since'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_number = db.Column(db.String(50), nullable=False)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    status = db.Column(db.String(50), nullable=False)
+    status_since = db.Column(db.DateTime, nullable=False)  # Order.updated_at when the breach was found
+    due_at = db.Column(db.DateTime, nullable=False)  # status_since + SLA
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<OrderAlert {self.order_number} {self.status}>'
+
+
+class OutboxEvent(db.Model):
+    """
+    Side effect to run after a commit, written in the same transaction as
+    the change that caused it (see outbox.py). Claimed by workers through
+    locked_by/locked_until; failed events are retried at available_at and
+    end up 'dead' after too many attempts.
+    """
+    __tablename__ = 'outbox_events'
+    __table_args__ = (
+        db.Index('ix_outbox_events_ready', 'status', 'available_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(100), nullable=False)  # e.g. order.status_changed
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    @classmethod
+    def enqueue(cls, topic, **payload):
+        """Add an event to the current transaction; it is only seen once that commits"""
+        event = cls(topic=topic, payload=json.dumps(payload, default=str))
+        db.session.add(event)
+        return event
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.topic} {self.status}>'
+
+
+class IdempotencyKey(db.Model):
+    """
+    Outcome of a write request sent with an idempotency key (see
+    idempotency.py), replayed when the same user retries with that key.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.Index('ix_idempotency_keys_expires', 'expires_at'),
+    )
+    
+    user_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of method, path and body
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, done
+    response_status = db.Column(db.Integer, nullable=True)
+    response_headers = db.Column(db.Text, nullable=True)  # JSON
+    response_body = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id}:{self.key} {self.status}>'
+
+
+class OrderChange(db.Model):
+    """
+    Change feed for live order lists (see changefeed.py): one row per order
+    created, status change or customer merge, numbered by a monotonically
+    increasing seq. Written in the same transaction as the change; pruned
+    after a day.
+    """
+    __tablename__ = 'order_changes'
+    __table_args__ = (
+        db.Index('ix_order_changes_changed_at', 'changed_at'),
+        {'sqlite_autoincrement': True},  # never reuse a seq, even after pruning
+    )
+    
+    seq = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    store_id = db.Column(db.Integer, nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(50), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # created, status, customer (moved by a merge)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    @classmethod
+    def record(cls, order, kind):
+        """Add a feed entry for the order's current state to the current transaction"""
+        change = cls(order_id=order.id, store_id=order.store_id, user_id=order.user_id,
+                     status=order.status, kind=kind)
+        db.session.add(change)
+        return change
+    
+    def __repr__(self):
+        return f'<OrderChange {self.seq} {self.kind} order {self.order_id}>'
+
+
+class OrderStatusLookup(db.Model):
+    """
+    What the public status page shows for an order (see tracking.py): one
+    narrow row per order, found by order number and checked against the last
+    four digits of the customer's phone. Rebuilt from orders, never edited.
+    """
+    __tablename__ = 'order_status_lookup'
+    
+    order_id = db.Column(db.Integer, primary_key=True)
+    order_number = db.Column(db.String(50), unique=True, nullable=False)
+    phone_last4 = db.Column(db.String(4), nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    store_name = db.Column(db.String(255), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<OrderStatusLookup {self.order_number} {self.status}>'
+
+
+class CustomerDuplicate(db.Model):
+    """
+    A pair of customers that look like the same person, found by dedup.py
+    (customer_id < duplicate_id). Replaced on every scan; merging removes
+    the pairs of the merged customers.
+    """
+    __tablename__ = 'customer_duplicates'
+    
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), primary_key=True)
+    duplicate_id = db.Column(db.Integer, db.ForeignKey('customers.id'), primary_key=True, index=True)
+    score = db.Column(db.Float, nullable=False, index=True)
+    reasons = db.Column(db.String(100), nullable=False)  # e.g. phone,name
+    found_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CustomerDuplicate {self.customer_id}~{self.duplicate_id} {self.score:.2f}>'
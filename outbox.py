@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Transactional outbox
+
+Request code records side effects instead of running them:
+
+    OutboxEvent.enqueue('order.status_changed', order_id=order.id, ...)
+    db.session.commit()
+
+The event row commits or rolls back with the change itself. A worker
+process claims ready events and runs the handlers registered for their
+topic on a thread pool, so slow work (notifications, carrier calls,
+report refreshes) never adds to request latency.
+
+Claiming uses SELECT ... FOR UPDATE SKIP LOCKED where the database
+supports it, and a conditional UPDATE of the lease columns on SQLite.
+Either way the claim is a lease: events held by a worker that dies are
+picked up again after OUTBOX_LEASE_SECONDS. Failed events are retried with
+exponential backoff and marked 'dead' after OUTBOX_MAX_ATTEMPTS.
+Delivery is at least once, so handlers must be idempotent.
+
+Usage:
+    python3 outbox.py                 # run the worker until stopped
+    python3 outbox.py --once          # process what is ready, then exit
+    python3 outbox.py --requeue-dead  # retry dead-lettered events
+"""
+import importlib
+import json
+import random
+import sys
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, update
+from models import db, OutboxEvent
+
+# Modules whose import registers handlers with @handler
+HANDLER_MODULES = ('analytics', 'carrier', 'tracking')
+MAX_BACKOFF = timedelta(hours=1)
+
+HANDLERS = {}
+
+Claimed = namedtuple('Claimed', 'id topic payload attempts token')
+
+
+def handler(*topics):
+    """Register the decorated function(payload) as a handler for the given topics"""
+    def decorator(f):
+        for topic in topics:
+            HANDLERS.setdefault(topic, []).append(f)
+        return f
+    return decorator
+
+
+def load_handlers():
+    for name in HANDLER_MODULES:
+        importlib.import_module(name)
+
+
+def _supports_skip_locked():
+    return db.engine.dialect.name in ('postgresql', 'mysql', 'mariadb')
+
+
+def claim(limit, lease):
+    """Lease up to `limit` ready events to this caller; return [Claimed]"""
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    ready = (
+        select(OutboxEvent.id)
+        .where(OutboxEvent.status == 'pending',
+               OutboxEvent.available_at <= now,
+               (OutboxEvent.locked_until.is_(None)) | (OutboxEvent.locked_until < now))
+        .order_by(OutboxEvent.id)
+        .limit(limit)
+    )
+    if _supports_skip_locked():
+        # Rows locked by another worker's claim are skipped, not waited on
+        ids = db.session.execute(ready.with_for_update(skip_locked=True)).scalars().all()
+        target = OutboxEvent.id.in_(ids) if ids else None
+    else:
+        # SQLite serializes writers, so this UPDATE claims atomically
+        target = OutboxEvent.id.in_(ready.scalar_subquery())
+    if target is not None:
+        db.session.execute(
+            update(OutboxEvent).where(target)
+            .values(locked_by=token, locked_until=now + lease)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    rows = db.session.execute(
+        select(OutboxEvent.id, OutboxEvent.topic, OutboxEvent.payload, OutboxEvent.attempts)
+        .where(OutboxEvent.locked_by == token)
+        .order_by(OutboxEvent.id)
+    ).all()
+    return [Claimed(row.id, row.topic, row.payload, row.attempts, token) for row in rows]
+
+
+def _release(event, **values):
+    """Update a claimed event, unless its lease was lost to another worker"""
+    result = db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id == event.id, OutboxEvent.locked_by == event.token)
+        .values(locked_by=None, locked_until=None, attempts=event.attempts + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def backoff(attempts, base):
+    """Delay before retry number `attempts`: base * 2^(attempts-1), jittered, capped"""
+    delay = timedelta(seconds=base * 2 ** (attempts - 1) * random.uniform(0.5, 1.5))
+    return min(delay, MAX_BACKOFF)
+
+
+def process(app, event):
+    """Run one claimed event's handler and record the outcome"""
+    with app.app_context():
+        try:
+            funcs = HANDLERS.get(event.topic)
+            if not funcs:
+                raise LookupError(f'No handler registered for {event.topic}')
+            # One transaction for all of a topic's handlers; a failure retries them all
+            payload = json.loads(event.payload)
+            for func in funcs:
+                func(payload)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            attempts = event.attempts + 1
+            error = f'{type(e).__name__}: {e}'[:2000]
+            if attempts >= app.config['OUTBOX_MAX_ATTEMPTS']:
+                app.logger.error('Outbox event %s (%s) dead after %d attempts: %s',
+                                 event.id, event.topic, attempts, error)
+                _release(event, status='dead', last_error=error)
+            else:
+                app.logger.warning('Outbox event %s (%s) failed, attempt %d: %s',
+                                   event.id, event.topic, attempts, error)
+                delay = backoff(attempts, app.config['OUTBOX_BACKOFF_SECONDS'])
+                _release(event, available_at=datetime.utcnow() + delay, last_error=error)
+            return False
+        if not _release(event, status='done', processed_at=datetime.utcnow(), last_error=None):
+            app.logger.warning('Outbox event %s lease expired before it finished', event.id)
+        return True
+
+
+def run_worker(app, once=False):
+    """Claim events as threads free up and run them on a pool"""
+    load_handlers()
+    threads = app.config['OUTBOX_WORKER_THREADS']
+    lease = timedelta(seconds=app.config['OUTBOX_LEASE_SECONDS'])
+    poll = app.config['OUTBOX_POLL_SECONDS']
+    processed = 0
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='outbox') as pool:
+        in_flight = set()
+        while True:
+            free = threads - len(in_flight)
+            events = []
+            if free:
+                with app.app_context():
+                    events = claim(free, lease)
+                in_flight.update(pool.submit(process, app, event) for event in events)
+
+            if in_flight:
+                done, in_flight = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+                processed += len(done)
+            elif once:
+                return processed
+            elif not events:
+                time.sleep(poll)
+
+
+def requeue_dead():
+    """Give dead-lettered events a fresh set of attempts; return how many"""
+    result = db.session.execute(
+        update(OutboxEvent).where(OutboxEvent.status == 'dead')
+        .values(status='pending', attempts=0, available_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def purge_processed(days=7):
+    """Delete events that finished more than `days` ago; dead events are kept"""
+    result = db.session.execute(
+        delete(OutboxEvent)
+        .where(OutboxEvent.status == 'done',
+               OutboxEvent.processed_at < datetime.utcnow() - timedelta(days=days))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+if __name__ == '__main__':
+    import logging
+    from app import create_app
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(threadName)s %(message)s')
+    app = create_app()
+    if '--requeue-dead' in sys.argv:
+        with app.app_context():
+            print(f"✓ Requeued {requeue_dead()} dead events")
+    elif '--once' in sys.argv:
+        print(f"✓ Processed {run_worker(app, once=True)} events")
+    else:
+        run_worker(app)
@@ -0,0 +1,113 @@
+"""
+Password hashing with configurable algorithm and cost.
+
+The algorithm and its parameters come from config.py (PASSWORD_HASH_*).
+Stored hashes carry their own parameters, so hashes created under an older
+setting keep verifying and are upgraded on the next successful login
+(see needs_rehash).
+"""
+import threading
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import Config
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:  # argon2-cffi is optional
+    PasswordHasher = None
+
+ARGON2_PREFIX = '$argon2'
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _setting(name):
+    """Read a PASSWORD_* setting from the app config, falling back to Config"""
+    if has_app_context():
+        return current_app.config.get(name, getattr(Config, name))
+    return getattr(Config, name)
+
+
+def _argon2_hasher():
+    if PasswordHasher is None:
+        raise RuntimeError('PASSWORD_HASH_METHOD is argon2 but argon2-cffi is not installed')
+    return PasswordHasher(
+        time_cost=_setting('PASSWORD_ARGON2_TIME_COST'),
+        memory_cost=_setting('PASSWORD_ARGON2_MEMORY_COST'),
+        parallelism=_setting('PASSWORD_ARGON2_PARALLELISM'),
+    )
+
+
+def method_string():
+    """Return the Werkzeug method string for the configured algorithm and cost"""
+    method = _setting('PASSWORD_HASH_METHOD').lower()
+    if method == 'scrypt':
+        return 'scrypt:{}:{}:{}'.format(
+            _setting('PASSWORD_SCRYPT_N'),
+            _setting('PASSWORD_SCRYPT_R'),
+            _setting('PASSWORD_SCRYPT_P'),
+        )
+    if method == 'pbkdf2':
+        return f"pbkdf2:sha256:{_setting('PASSWORD_PBKDF2_ITERATIONS')}"
+    if method == 'argon2':
+        return 'argon2'
+    raise ValueError(f'Unknown PASSWORD_HASH_METHOD: {method}')
+
+
+def hash_password(password):
+    """Hash a password with the configured algorithm and cost"""
+    method = method_string()
+    if method == 'argon2':
+        return _argon2_hasher().hash(password)
+    return generate_password_hash(password, method=method)
+
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash of any supported format"""
+    if not password_hash:
+        return False
+    if password_hash.startswith(ARGON2_PREFIX):
+        if PasswordHasher is None:
+            return False
+        try:
+            return PasswordHasher().verify(password_hash, password)
+        except (InvalidHashError, VerificationError):
+            return False
+    return check_password_hash(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Return True if a stored hash was made with different parameters than configured"""
+    method = method_string()
+    if method == 'argon2':
+        if not password_hash.startswith(ARGON2_PREFIX):
+            return True
+        return _argon2_hasher().check_needs_rehash(password_hash)
+    return password_hash.split('$', 1)[0] != method
+
+
+def _get_slots():
+    global _slots
+    if _slots is None:
+        with _slots_lock:
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(_setting('PASSWORD_HASH_WORKERS'))
+    return _slots
+
+
+def verify_password_bounded(password_hash, password):
+    """
+    Verify a password, with at most PASSWORD_HASH_WORKERS checks running at
+    once per process.
+
+    At shift change many logins arrive at once. This only limits how many
+    CPU-bound hash checks run concurrently, so they don't starve the other
+    request threads of CPU; a login waiting for a slot still holds its own
+    request thread. With PASSWORD_HASH_WORKERS=0 there is no limit.
+    """
+    if _setting('PASSWORD_HASH_WORKERS') <= 0:
+        return verify_password(password_hash, password)
+    with _get_slots():
+        return verify_password(password_hash, password)
@@ -0,0 +1,386 @@
+"""
+JSON API, version 1 (mounted at /api/v1)
+
+Authenticated with the same session cookie as the HTML pages; writes must
+be sent as application/json and may carry an Idempotency-Key header (see
+idempotency.py). Every list endpoint takes:
+
+    limit=50            page size (max 200)
+    cursor=...          the previous page's next_cursor
+    ids=1,2,3           fetch these rows instead of a page (max 100)
+    fields=id,status    only these fields; the SQL selects only their columns
+    fields[customers]=first_name,last_name   the same for included rows
+    include=customer    side-load related rows under "included", one query per type
+
+Responses are {"data": ..., "included": {...}, "next_cursor": ...}.
+
+Orders carry a version that every change increments. A status change sent
+with the version the client last read is refused with 409 and the order's
+current state if someone else changed it in between.
+"""
+import base64
+import json
+from decimal import Decimal
+from datetime import date, datetime
+from flask import Blueprint, Response, request, url_for
+from sqlalchemy import select
+from models import db, Order, OrderConflict, Customer, Phone, RatePlan, Store
+from auth import api_login_required, current_user
+from idempotency import idempotent
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library encoder is used without it
+    orjson = None
+
+api_bp = Blueprint('api', __name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_IDS = 100
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.isoformat() + '+00:00'  # stored as naive UTC; matches orjson's OPT_NAIVE_UTC
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def api_response(payload, status=200, headers=None):
+    if orjson is not None:
+        body = orjson.dumps(payload, default=_default, option=orjson.OPT_NAIVE_UTC)
+    else:
+        body = json.dumps(payload, default=_default, separators=(',', ':'))
+    return Response(body, status=status, headers=headers, mimetype='application/json')
+
+
+def api_error(message, status, **details):
+    return api_response({'error': message, **details}, status)
+
+
+class Resource:
+    """
+    An API collection: the fields it exposes (name -> column), the fields
+    returned when fields= is absent, related resources it can include, and
+    the query parameters it filters on.
+    """
+
+    def __init__(self, name, model, fields, default_fields=None, includes=None, filters=None, newest_first=False):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields or tuple(fields)
+        self.includes = includes or {}  # include name -> (foreign key field, Resource)
+        self.filters = filters or {}  # query parameter -> (column, type)
+        self.newest_first = newest_first
+
+    def select(self, names):
+        return select(*(self.fields[name].label(name) for name in names))
+
+    def rows(self, query):
+        return [row._asdict() for row in db.session.execute(query)]
+
+
+STORES = Resource('stores', Store, {
+    'id': Store.id, 'name': Store.name, 'street': Store.street, 'city': Store.city,
+    'province': Store.province, 'postal_code': Store.postal_code,
+    'latitude': Store.latitude, 'longitude': Store.longitude, 'is_active': Store.is_active,
+}, filters={'province': (Store.province, str), 'is_active': (Store.is_active, lambda v: v == '1')})
+
+CUSTOMERS = Resource('customers', Customer, {
+    'id': Customer.id, 'first_name': Customer.first_name, 'last_name': Customer.last_name,
+    'phone_number': Customer.phone_number, 'email': Customer.email, 'postal_code': Customer.postal_code,
+    'preferred_store_id': Customer.preferred_store_id, 'notes': Customer.notes, 'created_at': Customer.created_at,
+}, includes={'preferred_store': ('preferred_store_id', STORES)},
+   filters={'preferred_store_id': (Customer.preferred_store_id, int)})
+
+PHONES = Resource('phones', Phone, {
+    'id': Phone.id, 'brand': Phone.brand, 'model': Phone.model, 'storage': Phone.storage,
+    'colour': Phone.colour, 'bell_sku': Phone.bell_sku, 'full_price': Phone.full_price,
+    'is_featured': Phone.is_featured,
+}, filters={'brand': (Phone.brand, str)})
+
+RATE_PLANS = Resource('rate_plans', RatePlan, {
+    'id': RatePlan.id, 'name': RatePlan.name, 'monthly_price': RatePlan.monthly_price,
+    'data_gb': RatePlan.data_gb, 'unlimited_canada': RatePlan.unlimited_canada,
+    'unlimited_us': RatePlan.unlimited_us, 'roaming_notes': RatePlan.roaming_notes,
+    'bell_plan_code': RatePlan.bell_plan_code, 'segment': RatePlan.segment,
+}, filters={'segment': (RatePlan.segment, str)})
+
+ORDERS = Resource('orders', Order, {
+    'id': Order.id, 'version': Order.version, 'order_number': Order.order_number, 'status': Order.status,
+    'customer_id': Order.customer_id, 'phone_id': Order.phone_id, 'rate_plan_id': Order.rate_plan_id,
+    'store_id': Order.store_id, 'user_id': Order.user_id, 'notes': Order.notes,
+    'activation_date': Order.activation_date, 'created_at': Order.created_at, 'updated_at': Order.updated_at,
+}, includes={
+    'customer': ('customer_id', CUSTOMERS),
+    'phone': ('phone_id', PHONES),
+    'rate_plan': ('rate_plan_id', RATE_PLANS),
+    'store': ('store_id', STORES),
+}, filters={
+    'status': (Order.status, str),
+    'store_id': (Order.store_id, int),
+    'user_id': (Order.user_id, int),
+    'customer_id': (Order.customer_id, int),
+}, newest_first=True)
+
+
+class BadRequest(Exception):
+    pass
+
+
+@api_bp.errorhandler(BadRequest)
+def bad_request(e):
+    return api_error(str(e), 400)
+
+
+def _id_list(value, limit):
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise BadRequest('ids must be a comma-separated list of integers')
+    if len(ids) > limit:
+        raise BadRequest(f'At most {limit} ids per request')
+    return ids
+
+
+def _fields(resource, param='fields'):
+    """Field names requested for `resource` (id always included)"""
+    value = request.args.get(param)
+    if not value:
+        return list(resource.default_fields)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise BadRequest(f"Unknown {resource.name} field(s): {', '.join(unknown)}")
+    return ['id'] + [name for name in names if name != 'id']
+
+
+def _includes(resource):
+    value = request.args.get('include')
+    names = [name.strip() for name in value.split(',') if name.strip()] if value else []
+    unknown = [name for name in names if name not in resource.includes]
+    if unknown:
+        raise BadRequest(f"Unknown include(s): {', '.join(unknown)}. Available: {', '.join(resource.includes) or 'none'}")
+    return names
+
+
+def _encode_cursor(last_id):
+    return base64.urlsafe_b64encode(f'id:{last_id}'.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        _, value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split(':')
+        return int(value)
+    except ValueError:
+        raise BadRequest('Invalid cursor')
+
+
+def _fetch(resource, query_fn):
+    """Select the requested fields, narrowed by query_fn(select), and side-load includes; returns (rows, included)"""
+    names = _fields(resource)
+    includes = _includes(resource)
+    # Included rows are found through the foreign keys, so select those too
+    for include in includes:
+        key = resource.includes[include][0]
+        if key not in names:
+            names.append(key)
+    rows = resource.rows(query_fn(resource.select(names)))
+
+    included = {}
+    for include in includes:
+        key, related = resource.includes[include]
+        ids = sorted({row[key] for row in rows if row[key] is not None})
+        bucket = included.setdefault(related.name, [])
+        if ids:
+            related_names = _fields(related, f'fields[{related.name}]')
+            bucket.extend(related.rows(
+                related.select(related_names).where(related.fields['id'].in_(ids)).order_by(related.fields['id'])
+            ))
+    return rows, included
+
+
+def _list(resource):
+    """A page (or ids= batch) of `resource` as a response"""
+    id_column = resource.fields['id']
+    ids_param = request.args.get('ids')
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+
+    def query_fn(query):
+        if ids_param is not None:
+            return query.where(id_column.in_(_id_list(ids_param, MAX_IDS))).order_by(id_column)
+        for param, (column, convert) in resource.filters.items():
+            value = request.args.get(param)
+            if value is not None and value != '':
+                try:
+                    query = query.where(column == convert(value))
+                except ValueError:
+                    raise BadRequest(f'Invalid {param}')
+        cursor = request.args.get('cursor')
+        if cursor:
+            last_id = _decode_cursor(cursor)
+            query = query.where(id_column < last_id if resource.newest_first else id_column > last_id)
+        order = id_column.desc() if resource.newest_first else id_column
+        return query.order_by(order).limit(limit + 1)  # one extra row tells whether there is another page
+
+    rows, included = _fetch(resource, query_fn)
+    next_cursor = None
+    if ids_param is None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]['id'])
+    payload = {'data': rows, 'next_cursor': next_cursor}
+    if included:
+        payload['included'] = included
+    return api_response(payload)
+
+
+def _detail(resource, item_id):
+    rows, included = _fetch(resource, lambda query: query.where(resource.fields['id'] == item_id))
+    if not rows:
+        return api_error(f'{resource.model.__name__} {item_id} not found', 404)
+    payload = {'data': rows[0]}
+    if included:
+        payload['included'] = included
+    return api_response(payload)
+
+
+def _json_body():
+    if not request.is_json:
+        raise BadRequest('Send the request body as application/json')
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise BadRequest('The request body must be a JSON object')
+    return body
+
+
+# Orders
+
+@api_bp.route('/orders', methods=['GET'])
+@api_login_required
+def list_orders():
+    return _list(ORDERS)
+
+
+@api_bp.route('/orders/<int:order_id>', methods=['GET'])
+@api_login_required
+def get_order(order_id):
+    return _detail(ORDERS, order_id)
+
+
+@api_bp.route('/orders', methods=['POST'])
+@api_login_required
+@idempotent
+def create_order():
+    """Create a New order: {customer_id, phone_id, rate_plan_id, store_id, notes}"""
+    body = _json_body()
+    errors = {}
+    refs = {}
+    for field, model in (('customer_id', Customer), ('phone_id', Phone),
+                         ('rate_plan_id', RatePlan), ('store_id', Store)):
+        value = body.get(field)
+        if not isinstance(value, int) or isinstance(value, bool):
+            errors[field] = 'Required integer'
+        elif db.session.get(model, value) is None:
+            errors[field] = f'No {model.__name__} {value}'
+        else:
+            refs[field] = value
+    notes = body.get('notes') or ''
+    if not isinstance(notes, str):
+        errors['notes'] = 'Must be a string'
+    if errors:
+        return api_error('Invalid order', 422, fields=errors)
+
+    order = Order.create(
+        customer_id=refs['customer_id'],
+        phone_id=refs['phone_id'],
+        rate_plan_id=refs['rate_plan_id'],
+        store=db.session.get(Store, refs['store_id']),
+        user_id=current_user.id,
+        notes=notes,
+    )
+    db.session.commit()
+    response = _detail(ORDERS, order.id)
+    response.status_code = 201
+    response.headers['Location'] = url_for('api.get_order', order_id=order.id)
+    return response
+
+
+@api_bp.route('/orders/<int:order_id>/status', methods=['POST'])
+@api_login_required
+@idempotent
+def transition_order(order_id):
+    """Move an order to a new status: {status, comment, version}"""
+    body = _json_body()
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return api_error(f'Order {order_id} not found', 404)
+    new_status = body.get('status')
+    if new_status not in Order.STATUSES:
+        return api_error('Invalid status', 422, allowed=list(Order.STATUSES))
+    comment = body.get('comment') or ''
+    if not isinstance(comment, str):
+        return api_error('comment must be a string', 422)
+    version = body.get('version')
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        return api_error('version must be an integer', 422)
+    try:
+        order.update_status(new_status, current_user.id, comment, expected_version=version)
+    except OrderConflict as conflict:
+        rows, _ = _fetch(ORDERS, lambda query: query.where(Order.id == order_id))
+        return api_error(str(conflict), 409, current=rows[0])
+    return _detail(ORDERS, order_id)
+
+
+# Reference data
+
+@api_bp.route('/customers', methods=['GET'])
+@api_login_required
+def list_customers():
+    return _list(CUSTOMERS)
+
+
+@api_bp.route('/customers/<int:customer_id>', methods=['GET'])
+@api_login_required
+def get_customer(customer_id):
+    return _detail(CUSTOMERS, customer_id)
+
+
+@api_bp.route('/phones', methods=['GET'])
+@api_login_required
+def list_phones():
+    return _list(PHONES)
+
+
+@api_bp.route('/phones/<int:phone_id>', methods=['GET'])
+@api_login_required
+def get_phone(phone_id):
+    return _detail(PHONES, phone_id)
+
+
+@api_bp.route('/rate-plans', methods=['GET'])
+@api_login_required
+def list_rate_plans():
+    return _list(RATE_PLANS)
+
+
+@api_bp.route('/rate-plans/<int:rate_plan_id>', methods=['GET'])
+@api_login_required
+def get_rate_plan(rate_plan_id):
+    return _detail(RATE_PLANS, rate_plan_id)
+
+
+@api_bp.route('/stores', methods=['GET'])
+@api_login_required
+def list_stores():
+    return _list(STORES)
+
+
+@api_bp.route('/stores/<int:store_id>', methods=['GET'])
+@api_login_required
+def get_store(store_id):
+    return _detail(STORES, store_id)
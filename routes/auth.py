@@ -1,5 +1,6 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from models import db, User
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app
+from models import db, User, normalize_name
+from cache import unknown_login_names
 from auth import login_required
 
 auth_bp = Blueprint('auth', __name__)
@@ -15,28 +16,34 @@ def login():
             flash('Please enter both first name and password.', 'error')
             return render_template('login.html')
         
-        # Find user by first name (case-insensitive match)
-        # Try exact match first
-        user = User.query.filter_by(first_name=first_name).first()
+        # Find user by first name (case-insensitive) with one indexed lookup.
+        # Names that recently matched nobody are answered from the negative
+        # cache so a hammered login form doesn't reach the database.
+        login_key = normalize_name(first_name)
+        user = None
+        if login_key not in unknown_login_names:
+            user = User.query.filter_by(first_name_normalized=login_key).first()
+            if not user and current_app.config['LOGIN_NEGATIVE_CACHE_TTL'] > 0:
+                unknown_login_names.set(login_key, True,
+                                        ttl=current_app.config['LOGIN_NEGATIVE_CACHE_TTL'])
         
-        # If not found, try case-insensitive search
-        if not user:
-            user = User.query.filter(
-                db.func.lower(User.first_name) == db.func.lower(first_name)
-            ).first()
-        
-        if user and user.check_password(password):
+        # Password first, then the active flag, and one message for every
+        # failure, so the form doesn't reveal which names are deactivated
+        if user and user.check_password(password) and user.is_active:
+            # Upgrade hashes made under an older algorithm or cost setting
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
+            
+            # Fresh server-side session id for the signed-in user
+            session.clear()
+            session.regenerate()
+            current_app.session_interface.store.purge_expired()
             session['user_id'] = user.id
-            session['user_first_name'] = user.first_name
-            session['user_role'] = user.role
             flash(f'Welcome back, {user.first_name}!', 'success')
             return redirect(url_for('orders.list_orders'))
         else:
-            # Provide more helpful error message
-            if not user:
-                flash(f'User "{first_name}" not found. Please check the spelling.', 'error')
-            else:
-                flash('Invalid password. Password is case-sensitive.', 'error')
+            flash('Invalid first name or password. Password is case-sensitive.', 'error')
     
     return render_template('login.html')
 
@@ -1,6 +1,14 @@
-from flask import Blueprint, render_template, request
-from models import db, Customer, Order
-from auth import login_required
+from collections import namedtuple
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, g, make_response
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import aliased, joinedload
+from models import (db, Customer, CustomerDuplicate, Order, OrderStatusHistory, Phone, RatePlan, Store, User,
+                    normalize_phone)
+from auth import login_required, role_required
+from dedup import merge_customers
+from conditional import conditional, latest
+from versions import reference_state
+from geo import suggest_store, default_stores_for
 
 customers_bp = Blueprint('customers', __name__)
 
@@ -10,6 +18,11 @@ def list_customers():
     """List all customers with search"""
     search = request.args.get('search', '').strip()
     
+    # A full phone number in any format is one probe of the phone index, found or not
+    if normalize_phone(search):
+        customers = Customer.find_by_phone(search)
+        return render_template('customers/list.html', customers=customers, search=search)
+    
     query = Customer.query
     
     if search:
@@ -26,12 +39,152 @@ def list_customers():
     
     return render_template('customers/list.html', customers=customers, search=search)
 
+@customers_bp.route('/lookup', methods=['GET'])
+@login_required
+def lookup():
+    """Customers with exactly this phone number, for the new-order form"""
+    customers = Customer.find_by_phone(request.args.get('phone', ''))
+    default_stores = default_stores_for(customers)
+    return jsonify({'customers': [
+        {'id': customer.id, 'name': customer.full_name, 'phone_number': customer.phone_number,
+         'store_id': default_stores.get(customer.id)}
+        for customer in customers
+    ]})
+
+DUPLICATES_PER_PAGE = 50
+
+@customers_bp.route('/duplicates', methods=['GET'])
+@role_required('manager')
+def duplicates():
+    """Likely duplicate customers from the last dedup scan, best matches first"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    first, second = aliased(Customer), aliased(Customer)
+    pairs = db.session.query(CustomerDuplicate, first, second) \
+        .join(first, first.id == CustomerDuplicate.customer_id) \
+        .join(second, second.id == CustomerDuplicate.duplicate_id) \
+        .order_by(CustomerDuplicate.score.desc(), CustomerDuplicate.customer_id) \
+        .offset((page - 1) * DUPLICATES_PER_PAGE).limit(DUPLICATES_PER_PAGE + 1).all()
+    has_next = len(pairs) > DUPLICATES_PER_PAGE
+    pairs = pairs[:DUPLICATES_PER_PAGE]
+    
+    customer_ids = {c.id for _, a, b in pairs for c in (a, b)}
+    order_counts = dict(
+        db.session.query(Order.customer_id, db.func.count(Order.id))
+        .filter(Order.customer_id.in_(customer_ids)).group_by(Order.customer_id).all()
+    ) if customer_ids else {}
+    
+    return render_template('customers/duplicates.html', pairs=pairs, order_counts=order_counts,
+                         page=page, has_next=has_next)
+
+@customers_bp.route('/merge', methods=['POST'])
+@role_required('manager')
+def merge():
+    """Merge one customer into another, moving their orders"""
+    keep_id = request.form.get('keep_id', type=int)
+    merge_id = request.form.get('merge_id', type=int)
+    try:
+        moved = merge_customers(keep_id, [merge_id])
+        flash(f'Customers merged; {moved} order(s) moved.', 'success')
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+    return redirect(url_for('customers.duplicates', page=request.form.get('page', 1, type=int)))
+
+ORDERS_PER_PAGE = 10
+HISTORY_PER_PAGE = 20
+
+CustomerSummary = namedtuple('CustomerSummary', 'order_count open_count activated_count device_value plan_value '
+                                                'first_order_at last_activity_at')
+
+def customer_summary(customer_id):
+    """Order counters and lifetime value for a customer in one aggregate query (memoized per request)"""
+    summaries = g.setdefault('customer_summaries', {})
+    if customer_id not in summaries:
+        activated = Order.status == 'Activated'
+        row = db.session.execute(
+            select(
+                func.count(Order.id),
+                func.count(case((Order.status.in_(('New', 'Pending Activation')), 1))),
+                func.count(case((activated, 1))),
+                func.coalesce(func.sum(case((activated, Phone.full_price))), 0),
+                func.coalesce(func.sum(case((activated, RatePlan.monthly_price))), 0),
+                func.min(Order.created_at),
+                func.max(Order.updated_at),
+            )
+            .select_from(Order)
+            .join(Phone, Phone.id == Order.phone_id)
+            .join(RatePlan, RatePlan.id == Order.rate_plan_id)
+            .where(Order.customer_id == customer_id)
+        ).one()
+        summaries[customer_id] = CustomerSummary(*row)
+    return summaries[customer_id]
+
+def _customer_detail_state(customer_id):
+    """Validator for the customer page and its fragments: the order summary plus reference versions"""
+    summary = customer_summary(customer_id)
+    versions, reference_changed = reference_state('customers', 'phones', 'postal_areas', 'rate_plans', 'stores', 'users')
+    return (tuple(summary), versions), latest(summary.last_activity_at, reference_changed)
+
+def _orders_page(customer_id, before=None):
+    """A page of the customer's orders, newest first, with everything the rows show loaded in the same query"""
+    query = Order.query.filter(Order.customer_id == customer_id).options(
+        joinedload(Order.phone), joinedload(Order.rate_plan), joinedload(Order.store), joinedload(Order.user)
+    )
+    if before:
+        query = query.filter(Order.id < before)
+    orders = query.order_by(Order.id.desc()).limit(ORDERS_PER_PAGE + 1).all()
+    next_url = None
+    if len(orders) > ORDERS_PER_PAGE:
+        orders = orders[:ORDERS_PER_PAGE]
+        next_url = url_for('customers.customer_orders', customer_id=customer_id, before=orders[-1].id)
+    return orders, next_url
+
+def _fragment(template, next_url, **context):
+    """Rows for a 'Load more' button; the URL of the page after them goes in X-Next-Page"""
+    response = make_response(render_template(template, **context))
+    response.headers['X-Next-Page'] = next_url or ''
+    return response
+
 @customers_bp.route('/<int:customer_id>', methods=['GET'])
 @login_required
+@conditional(_customer_detail_state)
 def customer_detail(customer_id):
-    """Show customer details and their orders"""
+    """Customer 360: contact details, order summary and the latest orders; older orders and history load on demand"""
     customer = Customer.query.get_or_404(customer_id)
-    orders = Order.query.filter_by(customer_id=customer_id).order_by(Order.created_at.desc()).all()
+    summary = customer_summary(customer_id)
+    orders, next_url = _orders_page(customer_id)
+    suggested_store = None
+    if not customer.preferred_store_id and customer.postal_code:
+        suggested_id = suggest_store(customer.postal_code)
+        suggested_store = db.session.get(Store, suggested_id) if suggested_id else None
     
-    return render_template('customers/detail.html', customer=customer, orders=orders)
+    return render_template('customers/detail.html', customer=customer, summary=summary, orders=orders,
+                         next_orders_url=next_url, suggested_store=suggested_store)
+
+@customers_bp.route('/<int:customer_id>/orders', methods=['GET'])
+@login_required
+@conditional(_customer_detail_state)
+def customer_orders(customer_id):
+    """Fragment: the page of the customer's orders older than ?before=<order id>"""
+    orders, next_url = _orders_page(customer_id, before=request.args.get('before', type=int))
+    return _fragment('customers/_order_rows.html', next_url, orders=orders)
+
+@customers_bp.route('/<int:customer_id>/history', methods=['GET'])
+@login_required
+@conditional(_customer_detail_state)
+def customer_history(customer_id):
+    """Fragment: status changes across the customer's orders, newest first, older than ?before=<history id>"""
+    query = db.session.query(OrderStatusHistory, Order.order_number, User.first_name) \
+        .join(Order, Order.id == OrderStatusHistory.order_id) \
+        .join(User, User.id == OrderStatusHistory.changed_by_user_id) \
+        .filter(Order.customer_id == customer_id)
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(OrderStatusHistory.id < before)
+    entries = query.order_by(OrderStatusHistory.id.desc()).limit(HISTORY_PER_PAGE + 1).all()
+    next_url = None
+    if len(entries) > HISTORY_PER_PAGE:
+        entries = entries[:HISTORY_PER_PAGE]
+        next_url = url_for('customers.customer_history', customer_id=customer_id, before=entries[-1][0].id)
+    return _fragment('customers/_history_rows.html', next_url, entries=entries)
 
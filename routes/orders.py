@@ -1,6 +1,15 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
-from models import db, Order, Customer, Phone, RatePlan, User, Store
-from auth import login_required
+import json
+import time
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app,
+                   Response, stream_with_context, get_template_attribute)
+from models import db, Order, OrderConflict, OrderStatusHistory, Customer, Phone, RatePlan, User, Store
+from auth import login_required, current_user
+from conditional import conditional, latest
+from versions import reference_state, get_versions
+from geo import sort_stores_by_distance, default_stores_for
+from sla import open_alerts
+from idempotency import idempotent
+from changefeed import get_broadcaster, changes_after, latest_seq, oldest_seq
 from datetime import datetime
 
 orders_bp = Blueprint('orders', __name__)
@@ -14,6 +23,12 @@ def list_orders():
     owner_filter = request.args.get('owner', '')
     store_filter = request.args.get('store', '')
     
+    # Live updates resume from the feed position read before the list itself
+    stream_url = None
+    if current_app.config['ORDER_STREAM_ENABLED'] and (not store_filter or store_filter.isdigit()):
+        stream_url = url_for('orders.stream', since=latest_seq(), store=store_filter or None,
+                             owner=owner_filter or None)
+    
     # Build query
     query = Order.query
     
@@ -35,8 +50,11 @@ def list_orders():
     # Order by created date (newest first)
     orders = query.order_by(Order.created_at.desc()).all()
     
+    # Row fragments are cached per order; these versions cover the names shown in each row
+    versions = tuple(sorted(get_versions('customers', 'phones', 'rate_plans', 'stores', 'users').items()))
+    
     # Get all users for owner filter dropdown
-    users = User.query.all()
+    users = User.choices()
     
     # Get all stores for store filter dropdown
     stores = Store.query.filter_by(is_active=True).order_by(Store.city, Store.name).all()
@@ -50,12 +68,134 @@ def list_orders():
                          users=users,
                          stores=stores,
                          statuses=statuses,
+                         versions=versions,
+                         stream_url=stream_url,
                          current_status=status_filter,
                          current_owner=owner_filter,
                          current_store=store_filter)
 
+# Changes a stream will replay on (re)connect before asking the page to reload instead
+STREAM_CATCHUP_LIMIT = 500
+
+
+def _sse(event, data=None, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _order_events(changes):
+    """One 'order' event per changed order, with its freshly rendered row"""
+    latest_change = {change.order_id: change for change in changes}
+    orders = {order.id: order for order in Order.query.filter(Order.id.in_(latest_change)).all()}
+    versions = tuple(sorted(get_versions('customers', 'phones', 'rate_plans', 'stores', 'users').items()))
+    order_row = get_template_attribute('orders/_row.html', 'order_row')
+    events = []
+    for order_id, change in latest_change.items():
+        order = orders.get(order_id)
+        if order is not None:
+            events.append(_sse('order', {'id': order_id, 'kind': change.kind, 'status': order.status,
+                                         'html': str(order_row(order, versions)).strip()}, change.seq))
+    db.session.close()  # don't hold a pooled connection while the stream idles
+    return ''.join(events)
+
+
+@orders_bp.route('/stream', methods=['GET'])
+@login_required
+def stream():
+    """Server-Sent Events for the list page: rows created or changed, filtered by store and owner"""
+    config = current_app.config
+    if not config['ORDER_STREAM_ENABLED']:
+        return '', 204  # tells EventSource not to reconnect
+    store_id = request.args.get('store', type=int)
+    owner_id = request.args.get('owner', type=int)
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    
+    def matches(change):
+        return (store_id is None or change.store_id == store_id) and (owner_id is None or change.user_id == owner_id)
+    
+    def generate():
+        broadcaster = get_broadcaster()
+        subscription = broadcaster.subscribe()
+        try:
+            position = subscription.since if since is None else since
+            pending = []
+            if position < subscription.since:
+                # Replay what the client missed, up to where the broadcaster takes over
+                oldest = oldest_seq()
+                pending, _ = changes_after(position, upto=subscription.since, limit=STREAM_CATCHUP_LIMIT + 1)
+                if len(pending) > STREAM_CATCHUP_LIMIT or (oldest is not None and position < oldest - 1):
+                    yield _sse('reset')
+                    return
+            db.session.close()
+            
+            yield f"retry: {int(config['ORDER_STREAM_POLL_SECONDS'] * 1000) + 1000}\n\n"
+            deadline = time.monotonic() + config['ORDER_STREAM_MAX_SECONDS']
+            last_write = time.monotonic()
+            while time.monotonic() < deadline:
+                changes = [change for change in pending if change.seq > position and matches(change)]
+                if pending:
+                    position = max(position, pending[-1].seq)
+                if changes:
+                    yield _order_events(changes)
+                    last_write = time.monotonic()
+                elif time.monotonic() - last_write >= config['ORDER_STREAM_HEARTBEAT_SECONDS']:
+                    # Moves the browser's Last-Event-ID past filtered-out changes; also notices closed connections
+                    yield f'id: {position}\n: keep-alive\n\n'
+                    last_write = time.monotonic()
+                if subscription.overflowed:
+                    yield _sse('reset')
+                    return
+                pending = subscription.get(timeout=min(config['ORDER_STREAM_HEARTBEAT_SECONDS'],
+                                                       max(0.0, deadline - time.monotonic())))
+        finally:
+            broadcaster.unsubscribe(subscription)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@orders_bp.route('/watchlist', methods=['GET'])
+@login_required
+def watchlist():
+    """Orders past their status SLA, read from the alerts table"""
+    store_filter = request.args.get('store', type=int)
+    mine = request.args.get('mine') == '1'
+    
+    alerts = open_alerts(store_id=store_filter, user_id=current_user.id if mine else None)
+    
+    users = dict(User.choices())
+    store_ids = {alert.store_id for alert in alerts}
+    store_names = dict(db.session.query(Store.id, Store.name).filter(Store.id.in_(store_ids)).all()) if store_ids else {}
+    stores = Store.query.filter_by(is_active=True).order_by(Store.city, Store.name).all()
+    
+    return render_template('orders/watchlist.html',
+                         alerts=alerts,
+                         users=users,
+                         store_names=store_names,
+                         stores=stores,
+                         now=datetime.utcnow(),
+                         current_store=store_filter,
+                         mine=mine)
+
+def _order_detail_state(order_id):
+    """Validator for order_detail: order/history timestamps plus reference versions"""
+    row = db.session.query(
+        Order.updated_at,
+        db.func.max(OrderStatusHistory.changed_at),
+        db.func.count(OrderStatusHistory.id)
+    ).outerjoin(OrderStatusHistory, OrderStatusHistory.order_id == Order.id) \
+     .filter(Order.id == order_id).group_by(Order.id).first()
+    if row is None:
+        return None
+    versions, reference_changed = reference_state('customers', 'phones', 'rate_plans', 'stores', 'users')
+    return (tuple(row), versions), latest(row[0], row[1], reference_changed)
+
 @orders_bp.route('/<int:order_id>', methods=['GET'])
 @login_required
+@conditional(_order_detail_state)
 def order_detail(order_id):
     """Show order details"""
     order = Order.query.get_or_404(order_id)
@@ -66,24 +206,11 @@ def order_detail(order_id):
 
 @orders_bp.route('/new', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def new_order():
     """Create a new order"""
     if request.method == 'POST':
         try:
-            # Generate order number (CEL-YYYY-XXXX)
-            year = datetime.now().year
-            last_order = Order.query.order_by(Order.id.desc()).first()
-            if last_order and last_order.order_number:
-                try:
-                    last_num = int(last_order.order_number.split('-')[-1])
-                    next_num = last_num + 1
-                except (ValueError, IndexError):
-                    next_num = 1
-            else:
-                next_num = 1
-            
-            order_number = f"CEL-{year}-{next_num:04d}"
-            
             # Get store and set store_location from store data
             store_id = int(request.form['store_id'])
             store = Store.query.get(store_id)
@@ -91,35 +218,17 @@ def new_order():
                 flash('Invalid store selected.', 'error')
                 return redirect(url_for('orders.new_order'))
             
-            # Create order
-            order = Order(
-                order_number=order_number,
+            order = Order.create(
                 customer_id=int(request.form['customer_id']),
-                user_id=session['user_id'],
                 phone_id=int(request.form['phone_id']),
                 rate_plan_id=int(request.form['rate_plan_id']),
-                store_id=store_id,
-                store_location=store.display_name,  # Store display name for legacy compatibility
-                status='New',
+                store=store,
+                user_id=current_user.id,
                 notes=request.form.get('notes', '')
             )
-            
-            db.session.add(order)
-            db.session.flush()  # Get order ID
-            
-            # Create initial status history entry
-            from models import OrderStatusHistory
-            history = OrderStatusHistory(
-                order_id=order.id,
-                old_status='',
-                new_status='New',
-                changed_by_user_id=session['user_id'],
-                comment='Order created'
-            )
-            db.session.add(history)
             db.session.commit()
             
-            flash(f'Order {order_number} created successfully!', 'success')
+            flash(f'Order {order.order_number} created successfully!', 'success')
             return redirect(url_for('orders.order_detail', order_id=order.id))
             
         except Exception as e:
@@ -127,27 +236,51 @@ def new_order():
             flash(f'Error creating order: {str(e)}', 'error')
     
     # GET request - show form
-    customers = Customer.query.order_by(Customer.last_name, Customer.first_name).all()
+    # The option lists are cached as template fragments keyed on these versions;
+    # the queries below are passed unexecuted and only run on a cache miss.
+    versions = get_versions('customers', 'phones', 'postal_areas', 'rate_plans', 'stores')
+    customers = _customer_choices()
     # Order phones by brand, then model, with featured first
-    phones = Phone.query.order_by(Phone.brand, Phone.is_featured.desc(), Phone.model).all()
+    phones = Phone.query.order_by(Phone.brand, Phone.is_featured.desc(), Phone.model)
     # Order rate plans by price (lowest first)
-    rate_plans = RatePlan.query.order_by(RatePlan.monthly_price).all()
-    # Get all active stores, ordered by city and name
-    stores = Store.query.filter_by(is_active=True).order_by(Store.city, Store.name).all()
-    
-    # If user has a default store, select it
-    current_user = User.query.get(session['user_id'])
-    default_store_id = current_user.store_id if current_user and current_user.store_id else None
+    rate_plans = RatePlan.query.order_by(RatePlan.monthly_price)
+    # Coming from a customer page (or ?phone=): preselect the customer and their
+    # preferred (or nearest) store; otherwise default to the user's store
+    customer_id = request.args.get('customer_id', type=int)
+    customer = db.session.get(Customer, customer_id) if customer_id else None
+    if customer is None and request.args.get('phone'):
+        matches = Customer.find_by_phone(request.args['phone'])
+        customer = matches[0] if matches else None
+    default_store_id = current_user.store_id
+    if customer is not None:
+        default_store_id = default_stores_for([customer]).get(customer.id, default_store_id)
+    # Active stores, nearest to the user's store first (city groups kept together)
+    stores = _store_choices(default_store_id)
     
     return render_template('orders/new.html',
                          customers=customers,
                          phones=phones,
                          rate_plans=rate_plans,
                          stores=stores,
+                         versions=versions,
+                         customer_id=customer.id if customer else None,
                          default_store_id=default_store_id)
 
+def _customer_choices():
+    """Lazily yield (customer, default store id) options; runs only when the fragment cache misses"""
+    customers = Customer.query.order_by(Customer.last_name, Customer.first_name).all()
+    default_stores = default_stores_for(customers)
+    for customer in customers:
+        yield customer, default_stores.get(customer.id)
+
+def _store_choices(origin_store_id):
+    """Lazily yield the store picker options; runs only when the fragment cache misses"""
+    stores = Store.query.filter_by(is_active=True).order_by(Store.city, Store.name)
+    yield from sort_stores_by_distance(stores, origin_store_id)
+
 @orders_bp.route('/<int:order_id>/status', methods=['POST'])
 @login_required
+@idempotent
 def update_status(order_id):
     """Update order status"""
     order = Order.query.get_or_404(order_id)
@@ -158,14 +291,16 @@ def update_status(order_id):
         flash('Status is required.', 'error')
         return redirect(url_for('orders.order_detail', order_id=order_id))
     
-    valid_statuses = ['New', 'Pending Activation', 'Activated', 'Cancelled', 'Returned']
-    if new_status not in valid_statuses:
-        flash(f'Invalid status. Must be one of: {", ".join(valid_statuses)}', 'error')
+    if new_status not in Order.STATUSES:
+        flash(f'Invalid status. Must be one of: {", ".join(Order.STATUSES)}', 'error')
         return redirect(url_for('orders.order_detail', order_id=order_id))
     
     try:
-        order.update_status(new_status, session['user_id'], comment)
+        order.update_status(new_status, current_user.id, comment,
+                            expected_version=request.form.get('version', type=int))
         flash(f'Order status updated to {new_status}.', 'success')
+    except OrderConflict as conflict:
+        flash(f'{conflict}. Review the order and try again.', 'error')
     except Exception as e:
         flash(f'Error updating status: {str(e)}', 'error')
     
@@ -1,11 +1,19 @@
 from flask import Blueprint, render_template, request
 from models import db, Phone
 from auth import login_required
+from conditional import conditional
+from versions import reference_state
 
 phones_bp = Blueprint('phones', __name__)
 
+def _phones_state():
+    """Validator for list_phones: the catalog only changes with the phones table"""
+    versions, changed = reference_state('phones')
+    return versions, changed
+
 @phones_bp.route('', methods=['GET'])
 @login_required
+@conditional(_phones_state)
 def list_phones():
     """List all phones with filters"""
     brand_filter = request.args.get('brand', '')
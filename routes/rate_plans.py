@@ -1,11 +1,19 @@
 from flask import Blueprint, render_template
 from models import RatePlan
 from auth import login_required
+from conditional import conditional
+from versions import reference_state
 
 rate_plans_bp = Blueprint('rate_plans', __name__)
 
+def _rate_plans_state():
+    """Validator for list_rate_plans: the catalog only changes with the rate_plans table"""
+    versions, changed = reference_state('rate_plans')
+    return versions, changed
+
 @rate_plans_bp.route('', methods=['GET'])
 @login_required
+@conditional(_rate_plans_state)
 def list_rate_plans():
     """List all rate plans"""
     # TODO: Add filtering by segment (consumer/business) if needed
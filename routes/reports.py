@@ -0,0 +1,84 @@
+import csv
+import io
+from datetime import datetime
+from flask import Blueprint, render_template, request, Response
+from auth import role_required
+from analytics import (store_performance, status_intervals_refreshed_at, activation_funnel,
+                       time_in_status, stuck_orders, rep_leaderboard, rollup_months, month_start)
+
+reports_bp = Blueprint('reports', __name__)
+
+REPORT_DAYS = (7, 30, 90)
+STORE_SORTS = {
+    'orders': lambda s: s.orders_rank,
+    'activation': lambda s: s.activation_rank,
+    'speed': lambda s: (s.mean_hours_to_activate is None, s.mean_hours_to_activate),
+    'cancels': lambda s: -(s.cancel_rate or 0),
+    'returns': lambda s: -(s.return_rate or 0),
+}
+
+@reports_bp.route('/stores', methods=['GET'])
+@role_required('manager')
+def store_report():
+    """Cross-store performance ranking"""
+    days = request.args.get('days', 30, type=int)
+    if days not in REPORT_DAYS:
+        days = 30
+    sort = request.args.get('sort', 'orders')
+    if sort not in STORE_SORTS:
+        sort = 'orders'
+    
+    stores = sorted(store_performance(days), key=STORE_SORTS[sort])
+    
+    return render_template('reports/stores.html', stores=stores, days=days, sort=sort,
+                         report_days=REPORT_DAYS)
+
+@reports_bp.route('/funnel', methods=['GET'])
+@role_required('manager')
+def funnel_report():
+    """Activation funnel, time in each status, and orders stuck in an open status"""
+    days = request.args.get('days', 30, type=int)
+    if days not in REPORT_DAYS:
+        days = 30
+    
+    funnel = activation_funnel(days)
+    durations = time_in_status(days)
+    stuck = stuck_orders()
+    
+    return render_template('reports/funnel.html', funnel=funnel, durations=durations, stuck=stuck,
+                         days=days, report_days=REPORT_DAYS, intervals_at=status_intervals_refreshed_at())
+
+def _selected_month():
+    """?month=YYYY-MM, defaulting to the current month"""
+    try:
+        return month_start(datetime.strptime(request.args.get('month', ''), '%Y-%m'))
+    except ValueError:
+        return month_start(datetime.utcnow())
+
+@reports_bp.route('/leaderboard', methods=['GET'])
+@role_required('manager')
+def leaderboard():
+    """Per-rep monthly totals, read from the rollup table"""
+    month = _selected_month()
+    months = rollup_months()
+    if month not in months:
+        months = sorted([month, *months], reverse=True)
+    
+    return render_template('reports/leaderboard.html', reps=rep_leaderboard(month), month=month, months=months)
+
+@reports_bp.route('/leaderboard.csv', methods=['GET'])
+@role_required('manager')
+def leaderboard_csv():
+    """CSV export of the leaderboard for one month"""
+    month = _selected_month()
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['month', 'rank', 'rep', 'orders_created', 'orders_activated',
+                     'device_revenue', 'plan_revenue'])
+    for rep in rep_leaderboard(month):
+        writer.writerow([month.strftime('%Y-%m'), rep.rank, rep.name, rep.orders_created,
+                         rep.orders_activated, f'{rep.device_revenue:.2f}', f'{rep.plan_revenue:.2f}'])
+    
+    filename = f"rep-leaderboard-{month.strftime('%Y-%m')}.csv"
+    return Response(out.getvalue(), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
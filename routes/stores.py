@@ -1,15 +1,36 @@
-from flask import Blueprint, render_template, request
-from models import db, Store
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from models import db, Store, Order
 from auth import login_required
+from geo import nearest_stores as find_nearest_stores, parse_location, valid_coordinates
+from conditional import conditional, latest
+from versions import reference_state
 
 stores_bp = Blueprint('stores', __name__)
 
 @stores_bp.route('', methods=['GET'])
 @login_required
 def list_stores():
-    """List all stores"""
+    """List all stores, or the stores nearest a postal code / coordinates"""
     search = request.args.get('search', '').strip()
     province_filter = request.args.get('province', '')
+    near = request.args.get('near', '').strip()
+    
+    # Get unique provinces for filter
+    provinces = db.session.query(Store.province).distinct().order_by(Store.province).all()
+    provinces = [p[0] for p in provinces if p[0]]
+    
+    if near:
+        origin = parse_location(near)
+        if origin is None:
+            flash(f'Could not locate "{near}". Enter a postal code or "latitude, longitude".', 'error')
+            return redirect(url_for('stores.list_stores'))
+        results = find_nearest_stores(*origin, n=10)
+        stores = Store.query.filter(Store.id.in_([point.id for point, _ in results])).all()
+        by_id = {store.id: store for store in stores}
+        stores = [by_id[point.id] for point, _ in results]
+        distances = {point.id: distance for point, distance in results}
+        return render_template('stores/list.html', stores=stores, distances=distances, near=near,
+                               search=search, provinces=provinces, current_province=province_filter)
     
     query = Store.query.filter_by(is_active=True)
     
@@ -27,19 +48,58 @@ def list_stores():
     
     stores = query.order_by(Store.province, Store.city, Store.name).all()
     
-    # Get unique provinces for filter
-    provinces = db.session.query(Store.province).distinct().order_by(Store.province).all()
-    provinces = [p[0] for p in provinces if p[0]]
+    return render_template('stores/list.html', stores=stores, near=near, search=search, provinces=provinces, current_province=province_filter)
+
+@stores_bp.route('/nearest', methods=['GET'])
+@login_required
+def nearest_stores():
+    """JSON: the n active stores nearest ?lat=&lng= or ?postal_code="""
+    try:
+        n = min(max(int(request.args.get('n', 5)), 1), 50)
+        if request.args.get('lat') and request.args.get('lng'):
+            origin = (float(request.args['lat']), float(request.args['lng']))
+            if not valid_coordinates(*origin):
+                raise ValueError('coordinates out of range')
+        else:
+            origin = parse_location(request.args.get('postal_code', ''))
+    except ValueError:
+        return jsonify({'error': 'lat (-90 to 90), lng (-180 to 180) and n must be numbers'}), 400
+    
+    if origin is None:
+        return jsonify({'error': 'Provide lat and lng, or a known postal_code'}), 400
     
-    return render_template('stores/list.html', stores=stores, search=search, provinces=provinces, current_province=province_filter)
+    return jsonify({
+        'origin': {'lat': origin[0], 'lng': origin[1]},
+        'stores': [
+            {
+                'id': point.id,
+                'name': point.name,
+                'city': point.city,
+                'province': point.province,
+                'postal_code': point.postal_code,
+                'lat': point.latitude,
+                'lng': point.longitude,
+                'distance_km': round(distance, 2),
+            }
+            for point, distance in find_nearest_stores(*origin, n=n)
+        ],
+    })
+
+def _store_detail_state(store_id):
+    """Validator for store_detail: the store's order timestamps plus reference versions"""
+    last_update, order_count = db.session.query(
+        db.func.max(Order.updated_at), db.func.count(Order.id)
+    ).filter(Order.store_id == store_id).one()
+    versions, reference_changed = reference_state()
+    return (last_update, order_count, versions), latest(last_update, reference_changed)
 
 @stores_bp.route('/<int:store_id>', methods=['GET'])
 @login_required
+@conditional(_store_detail_state)
 def store_detail(store_id):
     """Show store details"""
     store = Store.query.get_or_404(store_id)
     # Get orders for this store
-    from models import Order
     orders = Order.query.filter_by(store_id=store_id).order_by(Order.created_at.desc()).limit(20).all()
     
     return render_template('stores/detail.html', store=store, orders=orders)
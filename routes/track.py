@@ -0,0 +1,48 @@
+from flask import Blueprint, render_template, request, jsonify, make_response
+from tracking import lookup, allow_client, order_locked, record_failure
+
+track_bp = Blueprint('track', __name__)
+
+NOT_FOUND = 'We could not find an order with that number and phone number.'
+TOO_MANY = 'Too many attempts. Please try again later or call your store.'
+
+@track_bp.route('', methods=['GET', 'POST'])
+def track_order():
+    """Public order status lookup: order number plus the last 4 digits of the phone number (no login)"""
+    if request.method == 'GET':
+        return render_template('track/status.html')
+
+    data = request.form
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
+    order_number = str(data.get('order_number') or '').strip()
+    digits = str(data.get('last4') or '').strip()
+
+    if not allow_client(request.remote_addr):
+        return _result(order_number, error=TOO_MANY, status=429, retry_after=60)
+    if not order_number or len(digits) != 4 or not digits.isdigit():
+        return _result(order_number, error='Enter your order number and the last 4 digits of your phone number.',
+                       status=400)
+    if order_locked(order_number):
+        return _result(order_number, error=TOO_MANY, status=429, retry_after=3600)
+
+    order, found = lookup(order_number, digits)
+    if order is None:
+        if found:
+            record_failure(order_number)
+        return _result(order_number, error=NOT_FOUND, status=404)
+    return _result(order_number, order=order)
+
+def _result(order_number, order=None, error=None, status=200, retry_after=None):
+    if request.is_json:
+        response = make_response(jsonify(order if error is None else {'error': error}), status)
+    else:
+        response = make_response(render_template('track/status.html', order=order, error=error,
+                                                 order_number=order_number), status)
+    # Results are personal; never let a shared cache keep them
+    response.headers['Cache-Control'] = 'no-store'
+    if retry_after:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
@@ -0,0 +1,109 @@
+"""
+Lightweight schema upgrades for existing databases.
+
+db.create_all() creates missing tables but never alters existing ones. This
+adds any columns and indexes declared in models.py that an older database
+is missing, then runs the registered backfills. New columns are always
+added as nullable so the ALTER works on tables that already hold rows;
+columns with a scalar default are filled with that default first.
+
+Usage:
+    python3 schema.py              # upgrade the configured database
+    python3 schema.py --backfill   # also rerun the backfills for rows still
+                                   # missing their value (e.g. after an import)
+"""
+import sys
+from sqlalchemy import bindparam, inspect, select, text, update
+from models import db, Customer, User, normalize_name, normalize_phone
+
+BACKFILL_BATCH = 1000
+
+
+def _backfill_user_names():
+    """Fill users.first_name_normalized for rows created before the column existed"""
+    for user in User.query.filter(User.first_name_normalized.is_(None)).all():
+        user.first_name_normalized = normalize_name(user.first_name)
+    db.session.commit()
+
+
+def _backfill_customer_phones(batch=BACKFILL_BATCH):
+    """Fill customers.phone_e164 in id order, one committed chunk at a time; return rows filled"""
+    filled = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Customer.id, Customer.phone_number)
+            .where(Customer.phone_e164.is_(None), Customer.id > last_id)
+            .order_by(Customer.id).limit(batch)
+        ).all()
+        if not rows:
+            return filled
+        last_id = rows[-1].id
+        # Numbers that don't parse stay NULL; the id cursor moves past them
+        values = [{'row_id': row.id, 'e164': normalize_phone(row.phone_number)} for row in rows]
+        values = [value for value in values if value['e164']]
+        if values:
+            db.session.execute(
+                update(Customer.__table__)
+                .where(Customer.__table__.c.id == bindparam('row_id'))
+                .values(phone_e164=bindparam('e164')),
+                values
+            )
+        db.session.commit()
+        filled += len(values)
+
+
+# (table, column) -> callable run once after the column is added
+BACKFILLS = {
+    ('users', 'first_name_normalized'): _backfill_user_names,
+    ('customers', 'phone_e164'): _backfill_customer_phones,
+}
+
+
+def upgrade_schema():
+    """Add missing columns and indexes, then backfill. Must run in an app context."""
+    engine = db.engine
+    inspector = inspect(engine)
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+            added.append((table.name, column.name))
+
+    for table_name, column_name in added:
+        column = db.metadata.tables[table_name].c[column_name]
+        if column.default is not None and column.default.is_scalar:
+            with engine.begin() as conn:
+                conn.execute(
+                    column.table.update().where(column.is_(None)).values({column: column.default.arg})
+                )
+        backfill = BACKFILLS.get((table_name, column_name))
+        if backfill:
+            backfill()
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    return added
+
+
+if __name__ == '__main__':
+    from app import create_app  # upgrades the schema
+
+    app = create_app()
+    with app.app_context():
+        if '--backfill' in sys.argv:
+            for (table_name, column_name), backfill in BACKFILLS.items():
+                result = backfill()
+                print(f"✓ {table_name}.{column_name}" + (f": {result} rows" if result is not None else ''))
+        else:
+            print("✓ Schema up to date")
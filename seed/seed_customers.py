@@ -23,16 +23,16 @@ def seed_customers():
             return None
         
         customers_data = [
-            {'first_name': 'John', 'last_name': 'Smith', 'phone_number': '514-555-0101', 'email': 'john.smith@email.com', 'preferred_store_id': get_store_id(montreal_stores, 0)},
-            {'first_name': 'Sarah', 'last_name': 'Johnson', 'phone_number': '514-555-0102', 'email': 'sarah.j@email.com', 'preferred_store_id': get_store_id(montreal_stores, 0)},
-            {'first_name': 'Michael', 'last_name': 'Chen', 'phone_number': '514-555-0103', 'email': 'mchen@email.com', 'preferred_store_id': get_store_id(laval_stores, 0)},
-            {'first_name': 'Emily', 'last_name': 'Martinez', 'phone_number': '514-555-0104', 'email': 'emily.m@email.com', 'preferred_store_id': get_store_id(montreal_stores, 1)},
-            {'first_name': 'David', 'last_name': 'Brown', 'phone_number': '514-555-0105', 'email': 'david.brown@email.com', 'preferred_store_id': get_store_id(all_stores, 5)},
-            {'first_name': 'Jessica', 'last_name': 'Davis', 'phone_number': '514-555-0106', 'email': 'j.davis@email.com', 'preferred_store_id': get_store_id(montreal_stores, 0)},
-            {'first_name': 'James', 'last_name': 'Wilson', 'phone_number': '514-555-0107', 'email': 'jwilson@email.com', 'preferred_store_id': get_store_id(all_stores, 3)},
-            {'first_name': 'Maria', 'last_name': 'Garcia', 'phone_number': '514-555-0108', 'email': 'maria.g@email.com', 'preferred_store_id': get_store_id(laval_stores, 0)},
-            {'first_name': 'Robert', 'last_name': 'Anderson', 'phone_number': '514-555-0109', 'email': 'robert.a@email.com', 'preferred_store_id': get_store_id(montreal_stores, 2)},
-            {'first_name': 'Lisa', 'last_name': 'Thompson', 'phone_number': '514-555-0110', 'email': 'lisa.t@email.com', 'preferred_store_id': get_store_id(all_stores, 8)},
+            {'first_name': 'John', 'last_name': 'Smith', 'phone_number': '514-555-0101', 'email': 'john.smith@email.com', 'postal_code': 'H3B 2Y5', 'preferred_store_id': get_store_id(montreal_stores, 0)},
+            {'first_name': 'Sarah', 'last_name': 'Johnson', 'phone_number': '514-555-0102', 'email': 'sarah.j@email.com', 'postal_code': 'H2X 1Y4', 'preferred_store_id': get_store_id(montreal_stores, 0)},
+            {'first_name': 'Michael', 'last_name': 'Chen', 'phone_number': '514-555-0103', 'email': 'mchen@email.com', 'postal_code': 'H7T 1C8', 'preferred_store_id': get_store_id(laval_stores, 0)},
+            {'first_name': 'Emily', 'last_name': 'Martinez', 'phone_number': '514-555-0104', 'email': 'emily.m@email.com', 'postal_code': 'H2J 2K9', 'preferred_store_id': get_store_id(montreal_stores, 1)},
+            {'first_name': 'David', 'last_name': 'Brown', 'phone_number': '514-555-0105', 'email': 'david.brown@email.com', 'postal_code': 'H4A 1T2', 'preferred_store_id': get_store_id(all_stores, 5)},
+            {'first_name': 'Jessica', 'last_name': 'Davis', 'phone_number': '514-555-0106', 'email': 'j.davis@email.com', 'postal_code': 'H1V 3M9', 'preferred_store_id': get_store_id(montreal_stores, 0)},
+            {'first_name': 'James', 'last_name': 'Wilson', 'phone_number': '514-555-0107', 'email': 'jwilson@email.com', 'postal_code': 'H3H 1P3', 'preferred_store_id': get_store_id(all_stores, 3)},
+            {'first_name': 'Maria', 'last_name': 'Garcia', 'phone_number': '514-555-0108', 'email': 'maria.g@email.com', 'postal_code': 'H7N 5H9', 'preferred_store_id': get_store_id(laval_stores, 0)},
+            {'first_name': 'Robert', 'last_name': 'Anderson', 'phone_number': '514-555-0109', 'email': 'robert.a@email.com', 'postal_code': 'H2G 2B3', 'preferred_store_id': get_store_id(montreal_stores, 2)},
+            {'first_name': 'Lisa', 'last_name': 'Thompson', 'phone_number': '514-555-0110', 'email': 'lisa.t@email.com', 'postal_code': 'H8N 1X1', 'preferred_store_id': get_store_id(all_stores, 8)},
         ]
         
         for customer_data in customers_data:
@@ -0,0 +1,79 @@
+"""
+Import Canadian FSA centroids into the postal_areas table
+
+The forward sortation area (FSA) is the first three characters of a postal
+code. Centroids let customer postal codes be compared with store locations
+without calling an external geocoding service (see geo.py).
+
+The input is a CSV with one row per FSA:
+
+    fsa,province,latitude,longitude
+    H2X,QC,45.5122,-73.5699
+
+Statistics Canada's FSA boundary file can be reduced to this format by
+taking each polygon's centroid (e.g. in QGIS or with ogr2ogr); its CFSAUID
+and PRUID column names are accepted as well. The default path is
+seed/fsa_centroids.csv.
+
+Usage:
+    python -m seed.seed_postal_areas [path/to/fsa_centroids.csv]
+"""
+import csv
+import os
+import sys
+from app import create_app
+from models import db, PostalArea
+
+DEFAULT_CSV = os.path.join(os.path.dirname(__file__), 'fsa_centroids.csv')
+
+# Accepted header names for each column, lowercased
+COLUMNS = {
+    'fsa': ('fsa', 'cfsauid'),
+    'province': ('province', 'prov', 'pruid'),
+    'latitude': ('latitude', 'lat'),
+    'longitude': ('longitude', 'lon', 'lng', 'long'),
+}
+
+
+def read_fsa_centroids(path):
+    """Yield (fsa, province, latitude, longitude) rows from a centroid CSV"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        headers = {name.strip().lower(): name for name in reader.fieldnames or []}
+        columns = {}
+        for column, aliases in COLUMNS.items():
+            columns[column] = next((headers[a] for a in aliases if a in headers), None)
+        missing = [c for c in ('fsa', 'latitude', 'longitude') if columns[c] is None]
+        if missing:
+            raise ValueError(f"{path} is missing column(s): {', '.join(missing)}")
+
+        for row in reader:
+            fsa = row[columns['fsa']].strip().upper()
+            if len(fsa) != 3:
+                continue
+            province = row[columns['province']].strip() if columns['province'] else None
+            yield fsa, province or None, float(row[columns['latitude']]), float(row[columns['longitude']])
+
+
+def seed_postal_areas(path=None):
+    """Replace postal_areas with the centroids in path (default: seed/fsa_centroids.csv)"""
+    path = path or DEFAULT_CSV
+    if not os.path.exists(path):
+        print(f"No {os.path.basename(path)} found. Skipping postal area import.")
+        return
+
+    app = create_app()
+    with app.app_context():
+        areas = {fsa: (province, lat, lon) for fsa, province, lat, lon in read_fsa_centroids(path)}
+        # A full replace in one transaction; ORM inserts bump the postal_areas version
+        PostalArea.query.delete()
+        db.session.add_all(
+            PostalArea(fsa=fsa, province=province, latitude=lat, longitude=lon)
+            for fsa, (province, lat, lon) in areas.items()
+        )
+        db.session.commit()
+        print(f"✓ Imported {len(areas)} postal areas from {path}")
+
+
+if __name__ == '__main__':
+    seed_postal_areas(sys.argv[1] if len(sys.argv) > 1 else None)
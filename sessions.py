@@ -0,0 +1,286 @@
+"""
+Server-side sessions.
+
+The cookie carries only a random session id. Session data lives in a store
+and is loaded together with the signed-in user's record in one round trip,
+so role changes and deactivation take effect on the user's next request and
+role checks need no extra query.
+
+Stores:
+    SqlSessionStore   - user_sessions table in the app database (default;
+                        a local SQLite file in development)
+    RedisSessionStore - shared store for multi-host deployments
+                        (SESSION_BACKEND=redis, needs the redis package)
+
+Revoking every session of a user is a single write (revoke_user_sessions).
+"""
+import json
+import secrets
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete, event, select, update
+from werkzeug.datastructures import CallbackDict
+from models import User, UserSession
+
+try:
+    import redis
+except ImportError:  # redis is optional
+    redis = None
+
+def _new_sid():
+    return secrets.token_urlsafe(32)
+
+
+def _user_record(row):
+    """Turn a (id, first_name, role, store_id, is_active, version) row into a dict"""
+    if row is None or row[0] is None:
+        return None
+    return {
+        'id': row[0],
+        'first_name': row[1],
+        'role': row[2],
+        'store_id': row[3],
+        'is_active': row[4] is not False,
+        'version': row[5],
+    }
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict whose contents live server-side under `sid`"""
+
+    def __init__(self, initial=None, sid=None, new=False, user=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.user = user
+        self.expires_at = expires_at
+        self.modified = False
+        self.rotate = False
+
+    def regenerate(self):
+        """Issue a new session id on save (call on login to prevent fixation)"""
+        self.rotate = True
+        self.modified = True
+
+
+class SqlSessionStore:
+    """Sessions in the user_sessions table, joined to users on load"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.sessions = UserSession.__table__
+        self.users = User.__table__
+
+    def load(self, sid):
+        """Return (data, user, expires_at) for a live session, or None"""
+        s, u = self.sessions, self.users
+        query = (
+            select(s.c.data, s.c.expires_at, u.c.id, u.c.first_name, u.c.role, u.c.store_id, u.c.is_active,
+                   u.c.version)
+            .select_from(s.outerjoin(u, s.c.user_id == u.c.id))
+            .where(s.c.sid == sid)
+        )
+        with self.engine.connect() as conn:
+            row = conn.execute(query).first()
+        if row is None or row.expires_at < datetime.utcnow():
+            return None
+        return row.data, _user_record(row[2:]), row.expires_at
+
+    def save(self, sid, data, user_id, expires_at):
+        values = {'data': data, 'user_id': user_id, 'expires_at': expires_at}
+        with self.engine.begin() as conn:
+            result = conn.execute(update(self.sessions).where(self.sessions.c.sid == sid).values(**values))
+            if result.rowcount == 0:
+                conn.execute(self.sessions.insert().values(sid=sid, created_at=datetime.utcnow(), **values))
+
+    def delete(self, sid):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.sessions).where(self.sessions.c.sid == sid))
+
+    def revoke_user(self, user_id, connection=None):
+        """Delete every session of a user in one statement"""
+        stmt = delete(self.sessions).where(self.sessions.c.user_id == user_id)
+        if connection is not None:
+            connection.execute(stmt)
+            return
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def user_changed(self, user):
+        """Nothing to do - user records are joined in on every load"""
+
+    def purge_expired(self):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.sessions).where(self.sessions.c.expires_at < datetime.utcnow()))
+
+
+class RedisSessionStore:
+    """
+    Sessions in Redis, with a per-user set of session ids and a cached user
+    record that is rewritten whenever the user row changes.
+    """
+
+    def __init__(self, url, engine, user_ttl=3600):
+        if redis is None:
+            raise RuntimeError('SESSION_BACKEND is redis but the redis package is not installed')
+        self.redis = redis.Redis.from_url(url)
+        self.engine = engine
+        self.user_ttl = user_ttl
+
+    def _user(self, user_id):
+        raw = self.redis.get(f'session_user:{user_id}')
+        if raw is not None:
+            return json.loads(raw)
+        u = User.__table__
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(u.c.id, u.c.first_name, u.c.role, u.c.store_id, u.c.is_active, u.c.version)
+                .where(u.c.id == user_id)
+            ).first()
+        record = _user_record(row)
+        if record is not None:
+            self.redis.set(f'session_user:{user_id}', json.dumps(record), ex=self.user_ttl)
+        return record
+
+    def load(self, sid):
+        pipe = self.redis.pipeline()
+        pipe.get(f'session:{sid}')
+        pipe.ttl(f'session:{sid}')
+        raw, ttl = pipe.execute()
+        if raw is None:
+            return None
+        payload = json.loads(raw)
+        user = self._user(payload['user_id']) if payload.get('user_id') else None
+        expires_at = datetime.utcnow() + timedelta(seconds=max(ttl, 0))
+        return payload['data'], user, expires_at
+
+    def save(self, sid, data, user_id, expires_at):
+        ttl = max(int((expires_at - datetime.utcnow()).total_seconds()), 1)
+        pipe = self.redis.pipeline()
+        pipe.set(f'session:{sid}', json.dumps({'data': data, 'user_id': user_id}), ex=ttl)
+        if user_id:
+            pipe.sadd(f'user_sessions:{user_id}', sid)
+            pipe.expire(f'user_sessions:{user_id}', ttl)
+        pipe.execute()
+
+    def delete(self, sid):
+        self.redis.delete(f'session:{sid}')
+
+    def revoke_user(self, user_id, connection=None):
+        """Delete every session of a user in one MULTI transaction"""
+        sids = self.redis.smembers(f'user_sessions:{user_id}')
+        pipe = self.redis.pipeline(transaction=True)
+        for sid in sids:
+            pipe.delete(f'session:{sid.decode()}')
+        pipe.delete(f'user_sessions:{user_id}', f'session_user:{user_id}')
+        pipe.execute()
+
+    def user_changed(self, user):
+        record = _user_record((user.id, user.first_name, user.role, user.store_id, user.is_active, user.version))
+        self.redis.set(f'session_user:{user.id}', json.dumps(record), ex=self.user_ttl)
+
+    def purge_expired(self):
+        """Redis expires keys on its own"""
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by a session store"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        record = self.store.load(sid) if sid else None
+        if record is None:
+            return ServerSession(sid=_new_sid(), new=True)
+
+        data, user, expires_at = record
+        session = ServerSession(self.serializer.loads(data), sid=sid, user=user, expires_at=expires_at)
+        if 'user_id' in session and (user is None or not user['is_active']):
+            # User deleted or deactivated since this session was created
+            dict.clear(session)
+            session.user = None
+            session.modified = True
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        response.vary.add('Cookie')
+        lifetime = app.permanent_session_lifetime
+        now = datetime.utcnow()
+        # Sliding expiry without a write per request: only extend past half-life
+        stale = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or stale):
+            return
+
+        if session.rotate and not session.new:
+            self.store.delete(session.sid)
+            session.sid = _new_sid()
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), session.get('user_id'), now + lifetime)
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_sessions(app, db):
+    """Install the configured server-side session store on the app"""
+    with app.app_context():
+        engine = db.engine
+    if app.config['SESSION_BACKEND'] == 'redis':
+        store = RedisSessionStore(app.config['SESSION_REDIS_URL'], engine,
+                                  user_ttl=int(app.permanent_session_lifetime.total_seconds()))
+    else:
+        store = SqlSessionStore(engine)
+    app.session_interface = ServerSideSessionInterface(store)
+
+
+def _current_store():
+    if not has_app_context():
+        return None
+    interface = current_app.session_interface
+    return interface.store if isinstance(interface, ServerSideSessionInterface) else None
+
+
+def revoke_user_sessions(user_id):
+    """Sign a user out everywhere"""
+    store = _current_store()
+    if store is not None:
+        store.revoke_user(user_id)
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    store = _current_store()
+    if store is not None:
+        store.user_changed(target)
+
+
+@event.listens_for(User, 'before_delete')
+def _user_deleted(mapper, connection, target):
+    store = _current_store()
+    if store is not None:
+        store.revoke_user(target.id, connection=connection)
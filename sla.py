@@ -0,0 +1,95 @@
+"""
+Order SLA monitoring.
+
+check_slas() runs as a background job (see jobs.py). For each status in
+ORDER_SLA_HOURS it raises an alert in order_alerts for every order whose
+updated_at has crossed the SLA since the previous run, then resolves
+alerts for orders that have moved on.
+
+Detection is a range read on the (status, updated_at) index between the
+previous and current cutoffs, capped at CHECK_BATCH rows, and resolution
+only looks at open alerts. A run costs the same whether orders holds a
+thousand rows or ten million; a backlog is worked off over several runs.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
+from models import db, Order, OrderAlert, AnalyticsState
+
+CHECK_BATCH = 1000
+
+
+def _detect(status, sla, now):
+    """Raise alerts for orders in `status` that crossed the SLA since the last run"""
+    state_name = f'sla:{status}'
+    state = db.session.get(AnalyticsState, state_name) or AnalyticsState(name=state_name, high_water=0)
+    cutoff = now - sla
+
+    query = select(Order.id, Order.order_number, Order.store_id, Order.user_id, Order.updated_at).where(
+        Order.status == status, Order.updated_at < cutoff
+    )
+    if state.refreshed_at is not None:
+        # Keyset on (updated_at, id): resume after the last order handled
+        query = query.where(
+            (Order.updated_at > state.refreshed_at)
+            | ((Order.updated_at == state.refreshed_at) & (Order.id > state.high_water))
+        )
+    rows = db.session.execute(query.order_by(Order.updated_at, Order.id).limit(CHECK_BATCH)).all()
+
+    raised = 0
+    if rows:
+        existing = set(db.session.execute(
+            select(OrderAlert.order_id, OrderAlert.status_since).where(
+                OrderAlert.status == status, OrderAlert.order_id.in_([row.id for row in rows])
+            )
+        ).all())
+        for row in rows:
+            if (row.id, row.updated_at) in existing:
+                continue
+            db.session.add(OrderAlert(
+                order_id=row.id, order_number=row.order_number, store_id=row.store_id,
+                user_id=row.user_id, status=status, status_since=row.updated_at,
+                due_at=row.updated_at + sla,
+            ))
+            raised += 1
+
+    # After a full batch, resume from its last row; otherwise everything up to cutoff is done
+    state = db.session.merge(state)
+    if len(rows) == CHECK_BATCH:
+        state.refreshed_at, state.high_water = rows[-1].updated_at, rows[-1].id
+    else:
+        state.refreshed_at, state.high_water = cutoff, 0
+    db.session.commit()
+    return raised
+
+
+def _resolve(now):
+    """Close open alerts whose order left the status or was updated since"""
+    stale = select(OrderAlert.id).join(Order, Order.id == OrderAlert.order_id).where(
+        OrderAlert.resolved_at.is_(None),
+        (Order.status != OrderAlert.status) | (Order.updated_at != OrderAlert.status_since),
+    )
+    ids = db.session.execute(stale).scalars().all()
+    if ids:
+        db.session.execute(update(OrderAlert).where(OrderAlert.id.in_(ids)).values(resolved_at=now))
+    db.session.commit()
+    return len(ids)
+
+
+def check_slas():
+    """Raise and resolve SLA alerts; return (raised, resolved)"""
+    now = datetime.utcnow()
+    raised = 0
+    for status, hours in current_app.config['ORDER_SLA_HOURS'].items():
+        raised += _detect(status, timedelta(hours=hours), now)
+    return raised, _resolve(now)
+
+
+def open_alerts(store_id=None, user_id=None, limit=200):
+    """Unresolved alerts, longest overdue first"""
+    query = select(OrderAlert).where(OrderAlert.resolved_at.is_(None))
+    if store_id:
+        query = query.where(OrderAlert.store_id == store_id)
+    if user_id:
+        query = query.where(OrderAlert.user_id == user_id)
+    return db.session.execute(query.order_by(OrderAlert.due_at).limit(limit)).scalars().all()
@@ -13,6 +13,120 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 5000);
     });
     
+    // New order: preselect the customer, and follow the customer's default store
+    const customerSelect = document.getElementById('customer_id');
+    const storeSelect = document.getElementById('store_id');
+    if (customerSelect && storeSelect) {
+        if (customerSelect.dataset.selected) {
+            customerSelect.value = customerSelect.dataset.selected;
+        }
+        customerSelect.addEventListener('change', function() {
+            const option = customerSelect.options[customerSelect.selectedIndex];
+            if (option && option.dataset.store) {
+                storeSelect.value = option.dataset.store;
+            }
+        });
+        
+        // Find by phone: an exact lookup, whatever the formatting
+        const phoneInput = document.getElementById('customer_phone');
+        const phoneResult = document.getElementById('customer_phone_result');
+        if (phoneInput) {
+            phoneInput.addEventListener('change', function() {
+                const phone = phoneInput.value.trim();
+                if (!phone) return;
+                fetch(phoneInput.dataset.lookup + '?phone=' + encodeURIComponent(phone), {credentials: 'same-origin'})
+                    .then(function(response) { return response.json(); })
+                    .then(function(data) {
+                        const match = data.customers[0];
+                        if (!match) {
+                            phoneResult.textContent = 'No customer with this phone number';
+                            return;
+                        }
+                        customerSelect.value = match.id;
+                        customerSelect.dispatchEvent(new Event('change'));
+                        phoneResult.textContent = data.customers.length > 1
+                            ? data.customers.length + ' customers share this number; selected ' + match.name
+                            : 'Selected ' + match.name;
+                    });
+            });
+        }
+    }
+    
+    // Orders list: apply live row updates from /orders/stream
+    const liveBody = document.querySelector('tbody[data-stream]');
+    if (liveBody && window.EventSource) {
+        const source = new EventSource(liveBody.dataset.stream);
+        source.addEventListener('order', function(e) {
+            const change = JSON.parse(e.data);
+            const existing = liveBody.querySelector('tr[data-order-id="' + change.id + '"]');
+            const wanted = !liveBody.dataset.status || liveBody.dataset.status === change.status;
+            if (!wanted) {
+                if (existing) existing.remove();
+                return;
+            }
+            const template = document.createElement('template');
+            template.innerHTML = change.html;
+            const row = template.content.firstElementChild;
+            row.classList.add('row-updated');
+            if (existing) {
+                existing.replaceWith(row);
+                return;
+            }
+            // New to this list (created, or now matching the status filter): keep newest-first order
+            const empty = liveBody.querySelector('.empty-row');
+            if (empty) empty.remove();
+            const next = Array.from(liveBody.querySelectorAll('tr[data-order-id]')).find(function(tr) {
+                return Number(tr.dataset.orderId) < change.id;
+            });
+            liveBody.insertBefore(row, next || null);
+        });
+        // The server fell too far behind this page; start over from a fresh list
+        source.addEventListener('reset', function() {
+            source.close();
+            window.location.reload();
+        });
+    }
+    
+    // Write forms carry an idempotency key, so a double submit or a resubmit
+    // after a lost response is applied only once (see idempotency.py)
+    document.querySelectorAll('form[data-idempotent]').forEach(function(form) {
+        const input = form.querySelector('input[name="idempotency_key"]');
+        form.addEventListener('submit', function() {
+            if (!input.value) {
+                input.value = newIdempotencyKey();
+            }
+        });
+        // Restored from the back/forward cache: the next submit is a new request
+        window.addEventListener('pageshow', function(e) {
+            if (e.persisted) input.value = '';
+        });
+    });
+    
+    // "Load more" buttons: append the next page of rows to the target table;
+    // the server names the page after it in X-Next-Page (empty when done)
+    document.querySelectorAll('[data-load-more]').forEach(function(button) {
+        const target = document.querySelector(button.dataset.target);
+        button.addEventListener('click', function() {
+            button.disabled = true;
+            fetch(button.dataset.loadMore, {credentials: 'same-origin'})
+                .then(function(response) {
+                    if (!response.ok) throw new Error(response.status);
+                    const next = response.headers.get('X-Next-Page');
+                    return response.text().then(function(html) {
+                        target.insertAdjacentHTML('beforeend', html);
+                        if (!next) {
+                            button.remove();
+                            return;
+                        }
+                        button.dataset.loadMore = next;
+                        button.textContent = button.dataset.moreLabel || button.textContent;
+                        button.disabled = false;
+                    });
+                })
+                .catch(function() { button.disabled = false; });
+        });
+    });
+
     // Form validation enhancements
     const forms = document.querySelectorAll('form');
     forms.forEach(function(form) {
@@ -23,3 +137,11 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    const bytes = new Uint8Array(16);
+    crypto.getRandomValues(bytes);
+    return Array.from(bytes, function(b) { return b.toString(16).padStart(2, '0'); }).join('');
+}
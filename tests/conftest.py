@@ -0,0 +1,92 @@
+"""
+Shared fixtures for the test suite:
+
+    python3 -m pytest tests
+
+Each test gets a fresh SQLite file. Tests that take `any_database_url` also
+run against PostgreSQL when TEST_POSTGRES_URL points at an empty scratch
+database (its tables are dropped afterwards), and are skipped there
+otherwise.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Never let config.py fall back to the development database
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+import cache
+from benchmarks import seed_catalog
+from config import config
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    return f'sqlite:///{tmp_path / "test.db"}'
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def any_database_url(request, sqlite_url):
+    if request.param == 'sqlite':
+        return sqlite_url
+    url = os.environ.get('TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip('TEST_POSTGRES_URL is not set')
+    return url
+
+
+def _make_app(database_url, monkeypatch):
+    from app import create_app
+
+    class TestConfig(config['default']):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = database_url
+
+    monkeypatch.setitem(config, 'test', TestConfig)
+    # In-process caches outlive an app; start every test from empty ones
+    for value in vars(cache).values():
+        if isinstance(value, cache.TTLCache):
+            value.clear()
+    return create_app('test')
+
+
+def _dispose(app):
+    from models import db
+
+    with app.app_context():
+        db.session.remove()
+        if db.engine.dialect.name != 'sqlite':
+            db.drop_all()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def app(sqlite_url, monkeypatch):
+    app = _make_app(sqlite_url, monkeypatch)
+    yield app
+    _dispose(app)
+
+
+@pytest.fixture
+def any_app(any_database_url, monkeypatch):
+    """The app on SQLite, and again on PostgreSQL when TEST_POSTGRES_URL is set"""
+    app = _make_app(any_database_url, monkeypatch)
+    yield app
+    _dispose(app)
+
+
+@pytest.fixture
+def catalog(app):
+    """Store, phone, plan and an admin who logs in as ('Tester', 'test'); see benchmarks.seed_catalog"""
+    with app.app_context():
+        return seed_catalog('Tester', password='test')
+
+
+def login(app):
+    """A test client signed in as the catalog's admin"""
+    client = app.test_client()
+    response = client.post('/login', data={'first_name': 'Tester', 'password': 'test'})
+    assert response.status_code == 302
+    return client
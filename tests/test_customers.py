@@ -0,0 +1,24 @@
+"""Customer search"""
+from sqlalchemy import event
+
+from models import db, Customer
+from conftest import login
+
+
+def test_full_number_search_is_answered_by_the_phone_index(app, catalog):
+    with app.app_context():
+        db.session.add(Customer(first_name='Ana', last_name='Silva', phone_number='514-555-0101'))
+        db.session.commit()
+        engine = db.engine
+    statements = []
+    capture = lambda conn, cursor, statement, *rest: statements.append(statement)
+    client = login(app)
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        found = client.get('/customers?search=(514) 555-0101').get_data(as_text=True)
+        missing = client.get('/customers?search=514-555-0199').get_data(as_text=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    assert 'Silva' in found
+    assert 'Silva' not in missing
+    assert not any('LIKE' in statement.upper() for statement in statements)
@@ -0,0 +1,37 @@
+"""Customer merges"""
+from benchmarks import order_row
+from changefeed import changes_after
+from dedup import load_records, merge_customers
+from models import db, Customer, Order
+
+
+def test_merge_moves_orders_and_feeds_the_live_list(app, catalog):
+    with app.app_context():
+        keep = Customer(first_name='Ana', last_name='Silva', phone_number='514-555-0101')
+        duplicate = Customer(first_name='Anna', last_name='Silva', phone_number='(514) 555-0101')
+        db.session.add_all([keep, duplicate])
+        db.session.flush()
+        db.session.execute(Order.__table__.insert(), [
+            order_row(catalog, f'CEL-MERGE-{i}', duplicate.id) for i in range(3)
+        ])
+        db.session.commit()
+        keep_id, duplicate_id = keep.id, duplicate.id
+        moved_ids = {order.id for order in Order.query.filter_by(customer_id=duplicate_id)}
+
+        assert merge_customers(keep_id, [duplicate_id]) == 3
+        assert {order.id for order in Order.query.filter_by(customer_id=keep_id)} == moved_ids
+        assert db.session.get(Customer, duplicate_id) is None
+        changes = [change for change in changes_after(0)[0] if change.kind == 'customer']
+        assert {change.order_id for change in changes} == moved_ids
+
+
+def test_phone_block_uses_the_search_normal_form(app, catalog):
+    with app.app_context():
+        db.session.add_all([
+            Customer(first_name='Ana', last_name='Silva', phone_number='+1 (514) 555-0101 ext. 12'),
+            Customer(first_name='Ana', last_name='Silva', phone_number='514.555.0101'),
+            Customer(first_name='Bo', last_name='Li', phone_number='555-0101'),
+        ])
+        db.session.commit()
+        phones = [record.phone for record in load_records().values()]
+        assert phones == ['+15145550101', '+15145550101', None]
@@ -0,0 +1,81 @@
+"""Idempotency keys under concurrency: many threads send the same write with the same key at once"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import login
+from models import db, Customer, Order, OrderStatusHistory, Store
+
+THREADS = 16
+
+
+def fire(clients, send):
+    """Release every thread at once; return the responses"""
+    barrier = threading.Barrier(len(clients))
+
+    def run(client):
+        barrier.wait()
+        return send(client)
+
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        return list(pool.map(run, clients))
+
+
+def counts(app):
+    with app.app_context():
+        return Order.query.count(), OrderStatusHistory.query.count()
+
+
+@pytest.fixture
+def order_fields(app, catalog):
+    with app.app_context():
+        customer = Customer(first_name='Race', last_name='Customer', phone_number='514-555-0100')
+        db.session.add(customer)
+        db.session.commit()
+        return dict(customer_id=customer.id, phone_id=catalog.phone_id, rate_plan_id=catalog.plan_id,
+                    store_id=catalog.store_id)
+
+
+@pytest.fixture
+def order_id(app, catalog, order_fields):
+    with app.app_context():
+        order = Order.create(store=db.session.get(Store, catalog.store_id), user_id=catalog.user_id,
+                             **{k: v for k, v in order_fields.items() if k != 'store_id'})
+        db.session.commit()
+        return order.id
+
+
+def _create_api(fields, order_id, key):
+    return lambda c: c.post('/api/v1/orders', json=fields, headers={'Idempotency-Key': key})
+
+
+def _create_form(fields, order_id, key):
+    return lambda c: c.post('/orders/new', data={**fields, 'idempotency_key': key})
+
+
+def _status_api(fields, order_id, key):
+    return lambda c: c.post(f'/api/v1/orders/{order_id}/status', json={'status': 'Activated'},
+                            headers={'Idempotency-Key': key})
+
+
+def _status_form(fields, order_id, key):
+    return lambda c: c.post(f'/orders/{order_id}/status', data={'status': 'Cancelled', 'idempotency_key': key})
+
+
+@pytest.mark.parametrize('make_send, expected', [
+    (_create_api, (1, 1)),
+    (_create_form, (1, 1)),
+    (_status_api, (0, 1)),
+    (_status_form, (0, 1)),
+], ids=['api-create', 'form-create', 'api-status', 'form-status'])
+def test_same_key_does_the_work_once(app, order_fields, order_id, make_send, expected):
+    clients = [login(app) for _ in range(THREADS)]
+    before = counts(app)
+    responses = fire(clients, make_send(order_fields, order_id, uuid.uuid4().hex))
+    after = counts(app)
+
+    assert (after[0] - before[0], after[1] - before[1]) == expected
+    assert len({(r.status_code, r.headers.get('Location')) for r in responses}) == 1
+    assert sum(r.headers.get('Idempotent-Replayed') == 'true' for r in responses) >= 1
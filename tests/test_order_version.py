@@ -0,0 +1,96 @@
+"""
+Optimistic locking on orders: many threads read the same order version,
+then all change its status at once. Exactly one may win; the rest get
+OrderConflict and leave no history behind.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event
+
+from benchmarks import seed_catalog
+from models import db, Customer, Order, OrderConflict, OrderStatusHistory, Store
+
+THREADS = 16
+
+
+@pytest.fixture
+def order(any_app):
+    """(order id, user id) of a New order"""
+    with any_app.app_context():
+        catalog = seed_catalog('Racer')
+        customer = Customer(first_name='Race', last_name='Customer', phone_number='514-555-0100')
+        db.session.add(customer)
+        db.session.flush()
+        order = Order.create(customer_id=customer.id, phone_id=catalog.phone_id, rate_plan_id=catalog.plan_id,
+                             store=db.session.get(Store, catalog.store_id), user_id=catalog.user_id)
+        db.session.commit()
+        return order.id, catalog.user_id
+
+
+def state(app, order_id):
+    with app.app_context():
+        return db.session.get(Order, order_id).version, OrderStatusHistory.query.filter_by(order_id=order_id).count()
+
+
+def race(app, order_id, user_id, new_status):
+    """Every thread reads the order, then all update it at once; returns the outcomes"""
+    barrier = threading.Barrier(THREADS)
+
+    def run(_):
+        with app.app_context():
+            order = db.session.get(Order, order_id)
+            seen = order.version
+            db.session.commit()  # end the read transaction, as a request that rendered the form would
+            barrier.wait()
+            try:
+                order.update_status(new_status, user_id, 'race', expected_version=seen)
+                return 'won'
+            except OrderConflict as conflict:
+                assert conflict.order.version > seen
+                return 'conflict'
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(run, range(THREADS)))
+
+
+def test_one_writer_wins(any_app, order):
+    order_id, user_id = order
+    for status in ('Pending Activation', 'Activated', 'Returned', 'Cancelled', 'New'):
+        before = state(any_app, order_id)
+        outcomes = race(any_app, order_id, user_id, status)
+        assert outcomes.count('won') == 1
+        assert state(any_app, order_id) == (before[0] + 1, before[1] + 1)
+
+
+def test_update_checks_the_version_it_read(any_app, order):
+    """The UPDATE the ORM actually sends sets the status and matches on the version read"""
+    order_id, user_id = order
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('UPDATE ORDERS'):
+            statements.append(' '.join(statement.split()))
+
+    with any_app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            db.session.get(Order, order_id).update_status('Pending Activation', user_id, 'sql')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+    assert len(statements) == 1
+    set_clause, where_clause = statements[0].split(' WHERE ')
+    assert 'status=' in set_clause.replace(' ', '') and 'version=' in set_clause.replace(' ', '')
+    assert 'orders.version' in where_clause
+
+
+def test_stale_version_is_refused(any_app, order):
+    order_id, user_id = order
+    with any_app.app_context():
+        stale = db.session.get(Order, order_id).version
+        db.session.get(Order, order_id).update_status('Pending Activation', user_id)
+        with pytest.raises(OrderConflict):
+            db.session.get(Order, order_id).update_status('Cancelled', user_id, expected_version=stale)
+    assert state(any_app, order_id) == (stale + 1, 2)
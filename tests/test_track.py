@@ -0,0 +1,49 @@
+"""Public order status lookup (/track)"""
+import pytest
+
+from benchmarks import order_row
+from cache import status_lookup_clients
+from models import db, Customer, Order
+from tracking import rebuild_status_lookup
+
+
+@pytest.fixture
+def order_number(app, catalog):
+    with app.app_context():
+        customer = Customer(first_name='Track', last_name='Customer', phone_number='(514) 555-0101 ext. 12')
+        db.session.add(customer)
+        db.session.flush()
+        db.session.execute(Order.__table__.insert(), [order_row(catalog, 'CEL-TRACK-0001', customer.id)])
+        db.session.commit()
+        rebuild_status_lookup()
+    return 'CEL-TRACK-0001'
+
+
+def track(client, order_number, digits, address='10.0.0.1'):
+    return client.post('/track', json={'order_number': order_number, 'last4': digits},
+                       environ_base={'REMOTE_ADDR': address})
+
+
+def test_extension_is_not_part_of_the_last_four_digits(app, order_number):
+    response = track(app.test_client(), order_number, '0101')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'New'
+
+
+def test_unknown_order_numbers_do_not_count_toward_the_lockout(app, order_number):
+    app.config['STATUS_LOOKUP_FAILURES_PER_HOUR'] = 2
+    client = app.test_client()
+    for _ in range(3):
+        assert track(client, 'CEL-NOT-YET', '0101').status_code == 404
+    assert track(client, order_number, '0101').status_code == 200
+
+
+def test_lockout_survives_address_rotation(app, order_number):
+    app.config['STATUS_LOOKUP_FAILURES_PER_HOUR'] = 2
+    client = app.test_client()
+    for i in range(2):
+        assert track(client, order_number, '9999', address=f'10.0.1.{i}').status_code == 404
+    # A guesser filling the per-address counters must not evict the order's failure count
+    for i in range(status_lookup_clients.maxsize + 1):
+        status_lookup_clients.incr(('client', f'10.9.{i}', 0), ttl=60)
+    assert track(client, order_number, '0101', address='10.0.2.1').status_code == 429
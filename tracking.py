@@ -0,0 +1,170 @@
+"""
+Public order status lookup.
+
+Customers check an order by its number and the last four digits of the
+phone number on file, without signing in (/track). Lookups read
+order_status_lookup, one narrow row per order holding only what the page
+shows, so a lookup is a single indexed read that never joins orders.
+The outbox worker rewrites an order's row when it is created or changes
+status (and a customer's rows when duplicates are merged into it), and the
+jobs process rebuilds the table to pick up changes made outside the app
+(imports, customer phone numbers, store names).
+
+Lookup rows are cached by order number for STATUS_LOOKUP_CACHE_SECONDS, so
+a burst of refreshes after an SMS campaign costs one query per order per
+TTL, wrong digits included. An order number with no row yet (the outbox
+writes it just after the order commits) is only cached for
+MISS_CACHE_SECONDS. Each client address gets STATUS_LOOKUP_PER_MINUTE
+lookups and each order number STATUS_LOOKUP_FAILURES_PER_HOUR wrong
+digits. Counters are kept per worker (see cache.py); nginx's limit_req
+covers the whole host.
+"""
+import re
+import time
+from flask import current_app
+from sqlalchemy import delete, func, select
+from models import db, Order, Customer, Store, OrderStatusLookup, normalize_phone
+from outbox import handler
+from cache import status_lookups, status_lookup_clients, status_lookup_failures
+
+REBUILD_BATCH = 1000
+MISS_CACHE_SECONDS = 3
+
+# What the customer sees for each status
+STATUS_MESSAGES = {
+    'New': 'We have received your order and are preparing it.',
+    'Pending Activation': 'Your phone is being activated with the carrier.',
+    'Activated': 'Your phone is activated and ready to use.',
+    'Cancelled': 'This order was cancelled. Contact your store with any questions.',
+    'Returned': 'This order was returned.',
+}
+
+
+def last4(phone_number):
+    """The last four digits of a stored phone number, extension dropped (raw digits if it doesn't parse)"""
+    return (normalize_phone(phone_number) or re.sub(r'\D', '', phone_number or ''))[-4:]
+
+
+def normalize_order_number(order_number):
+    return (order_number or '').strip().upper()
+
+
+def _write_lookup(condition):
+    """Insert lookup rows for the orders matching `condition` (delete their old rows first); return how many"""
+    rows = db.session.execute(
+        select(Order.id, Order.order_number, Order.status, Order.updated_at,
+               Customer.phone_number, Store.name)
+        .join(Customer, Customer.id == Order.customer_id)
+        .outerjoin(Store, Store.id == Order.store_id)
+        .where(condition)
+    ).all()
+    if rows:
+        db.session.execute(OrderStatusLookup.__table__.insert(), [
+            {'order_id': row.id, 'order_number': row.order_number, 'phone_last4': last4(row.phone_number),
+             'status': row.status, 'store_name': row.name, 'updated_at': row.updated_at}
+            for row in rows
+        ])
+    return len(rows)
+
+
+@handler('order.created', 'order.status_changed')
+def refresh_order_lookup(payload):
+    """Outbox handler: rewrite one order's row right after it changes"""
+    db.session.execute(delete(OrderStatusLookup).where(OrderStatusLookup.order_id == payload['order_id']))
+    _write_lookup(Order.id == payload['order_id'])
+
+
+@handler('customer.merged')
+def refresh_customer_lookup(payload):
+    """Outbox handler: orders moved by a customer merge now check the kept customer's phone"""
+    order_ids = select(Order.id).where(Order.customer_id == payload['customer_id'])
+    db.session.execute(delete(OrderStatusLookup).where(OrderStatusLookup.order_id.in_(order_ids)))
+    _write_lookup(Order.customer_id == payload['customer_id'])
+
+
+def rebuild_status_lookup():
+    """Rebuild every row from orders in id batches; return the number written"""
+    written = 0
+    last_id = 0
+    max_id = db.session.execute(select(func.max(Order.id))).scalar() or 0
+    while last_id < max_id:
+        upper = last_id + REBUILD_BATCH
+        db.session.execute(delete(OrderStatusLookup).where(
+            OrderStatusLookup.order_id > last_id, OrderStatusLookup.order_id <= upper
+        ))
+        written += _write_lookup(Order.id.between(last_id + 1, upper))
+        db.session.commit()
+        last_id = upper
+    db.session.execute(delete(OrderStatusLookup).where(OrderStatusLookup.order_id > max_id))
+    db.session.commit()
+    return written
+
+
+def _window(scope, subject, seconds):
+    """Counter key for the fixed window of `seconds` we are in"""
+    return (scope, subject, int(time.time() // seconds))
+
+
+def allow_client(address):
+    """Count a lookup from this address; False once it is over STATUS_LOOKUP_PER_MINUTE"""
+    limit = current_app.config['STATUS_LOOKUP_PER_MINUTE']
+    return limit <= 0 or status_lookup_clients.incr(_window('client', address, 60), ttl=60) <= limit
+
+
+def order_locked(order_number):
+    """True once an order number has had STATUS_LOOKUP_FAILURES_PER_HOUR wrong answers this hour"""
+    limit = current_app.config['STATUS_LOOKUP_FAILURES_PER_HOUR']
+    key = _window('order', normalize_order_number(order_number), 3600)
+    return limit > 0 and status_lookup_failures.get(key, 0) >= limit
+
+
+def record_failure(order_number):
+    """Count a lookup with the wrong digits for an order number that exists"""
+    status_lookup_failures.incr(_window('order', normalize_order_number(order_number), 3600), ttl=3600)
+
+
+def _lookup_row(order_number):
+    """An order's lookup row as a dict, or None if no order has this number (yet); cached"""
+    row = status_lookups.get(order_number, False)
+    if row is not False:
+        return row
+    row = db.session.execute(
+        select(OrderStatusLookup).where(OrderStatusLookup.order_number == order_number)
+    ).scalar()
+    if row is None:
+        # A brand-new order's row may be moments away; don't hide it for long
+        status_lookups.set(order_number, None, ttl=MISS_CACHE_SECONDS)
+        return None
+    row = {
+        'order_number': row.order_number,
+        'phone_last4': row.phone_last4,
+        'status': row.status,
+        'message': STATUS_MESSAGES.get(row.status, ''),
+        'store': row.store_name,
+        'updated_at': row.updated_at.isoformat() + 'Z' if row.updated_at else None,
+    }
+    status_lookups.set(order_number, row, ttl=current_app.config['STATUS_LOOKUP_CACHE_SECONDS'])
+    return row
+
+
+def lookup(order_number, digits):
+    """
+    (status, found): the customer-facing status of an order as a dict, or
+    None if the digits don't match or no order has this number; found says
+    whether the order number exists, so only wrong digits count as failures
+    """
+    row = _lookup_row(normalize_order_number(order_number))
+    if row is None:
+        return None, False
+    if len(digits) != 4 or row['phone_last4'] != digits:
+        return None, True
+    return {key: value for key, value in row.items() if key != 'phone_last4'}, True
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        written = rebuild_status_lookup()
+    print(f"✓ Rebuilt {written} order status lookup rows")
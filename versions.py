@@ -0,0 +1,62 @@
+"""
+Reference-data version counters.
+
+Every flush that inserts, updates or deletes rows in a tracked table bumps
+that table's counter in data_versions, in the same transaction. Pages built
+from reference data can then be validated (ETags, fragment cache keys) by
+reading a handful of integers instead of the data itself.
+
+Orders are deliberately not tracked: they change constantly and a single
+counter row would serialize every order write. Use Order.updated_at instead.
+"""
+from datetime import datetime
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from models import db, DataVersion
+
+TRACKED_TABLES = ('customers', 'phones', 'postal_areas', 'rate_plans', 'stores', 'users')
+
+
+def ensure_versions():
+    """Create a counter row for every tracked table. Must run in an app context."""
+    existing = {name for (name,) in db.session.query(DataVersion.name).all()}
+    for name in TRACKED_TABLES:
+        if name not in existing:
+            db.session.add(DataVersion(name=name, version=1))
+    db.session.commit()
+
+
+def get_versions(*names):
+    """Return {table name: version} for the given tables in one query"""
+    names = names or TRACKED_TABLES
+    rows = db.session.execute(
+        select(DataVersion.name, DataVersion.version).where(DataVersion.name.in_(names))
+    ).all()
+    return dict(rows)
+
+
+def reference_state(*names):
+    """Return (sorted (name, version) pairs, latest change time) for the given tables"""
+    names = names or TRACKED_TABLES
+    rows = db.session.execute(
+        select(DataVersion.name, DataVersion.version, DataVersion.updated_at)
+        .where(DataVersion.name.in_(names))
+        .order_by(DataVersion.name)
+    ).all()
+    latest = max((row.updated_at for row in rows if row.updated_at), default=None)
+    return tuple((row.name, row.version) for row in rows), latest
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions(session, flush_context):
+    changed = {
+        obj.__table__.name
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if getattr(obj, '__table__', None) is not None and obj.__table__.name in TRACKED_TABLES
+    }
+    if changed:
+        session.connection().execute(
+            update(DataVersion.__table__)
+            .where(DataVersion.__table__.c.name.in_(sorted(changed)))
+            .values(version=DataVersion.__table__.c.version + 1, updated_at=datetime.utcnow())
+        )
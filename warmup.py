@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Template precompilation and worker warm-up
+
+precompile_templates() compiles every template into the shared filesystem
+bytecode cache, so workers load compiled code instead of parsing templates
+on their first requests. Files compiled under other Jinja settings (see
+app.compile_fingerprint) are deleted first. It needs no database and can
+run at build time:
+
+    python3 warmup.py
+
+warm_up() runs in each gunicorn worker before it takes traffic (see
+gunicorn.conf.py). It renders every major page once as a fixture admin
+user, which compiles/loads templates, configures SQLAlchemy mappers and
+fills the compiled-SQL and fragment caches.
+"""
+import glob
+import os
+import time
+from flask import Flask, g
+from sqlalchemy.orm import configure_mappers
+from auth import CurrentUser
+
+# (endpoint, model whose first id fills the <id> URL argument, argument name)
+WARM_PAGES = [
+    ('orders.list_orders', None, None),
+    ('orders.order_detail', 'Order', 'order_id'),
+    ('orders.new_order', None, None),
+    ('orders.watchlist', None, None),
+    ('customers.list_customers', None, None),
+    ('customers.customer_detail', 'Customer', 'customer_id'),
+    ('phones.list_phones', None, None),
+    ('rate_plans.list_rate_plans', None, None),
+    ('stores.list_stores', None, None),
+    ('stores.store_detail', 'Store', 'store_id'),
+    ('reports.store_report', None, None),
+    ('reports.leaderboard', None, None),
+    ('about.about', None, None),
+]
+
+# Stand-in user for warm-up renders; never stored anywhere
+FIXTURE_USER = CurrentUser(id=0, first_name='Warmup', role='admin', store_id=None, version=0)
+
+
+def precompile_templates(app):
+    """Compile every template into the app's bytecode cache; return how many"""
+    prune_bytecode(app)
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def prune_bytecode(app):
+    """Delete compiled templates left by other Jinja settings (an earlier deploy); return how many"""
+    cache = app.jinja_env.bytecode_cache
+    current = cache.pattern.split('%s')[0]
+    removed = 0
+    for path in glob.glob(os.path.join(cache.directory, '__jinja2_*.cache')):
+        if not os.path.basename(path).startswith(current):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:  # another worker got there first
+                pass
+    return removed
+
+
+def warm_up(app):
+    """Render each major page once so the worker's caches are hot"""
+    import models
+
+    start = time.perf_counter()
+    precompile_templates(app)
+    warmed = []
+    with app.app_context():
+        configure_mappers()
+        for endpoint, model_name, arg in WARM_PAGES:
+            view_args = {}
+            if model_name:
+                model = getattr(models, model_name)
+                first_id = models.db.session.query(model.id).order_by(model.id).limit(1).scalar()
+                if first_id is None:
+                    continue
+                view_args[arg] = first_id
+            # Call the view directly: no session cookie is issued and nothing is written
+            with app.test_request_context():
+                g.current_user = FIXTURE_USER
+                try:
+                    app.view_functions[endpoint](**view_args)
+                    warmed.append(endpoint)
+                except Exception as e:
+                    app.logger.warning('Warm-up of %s failed: %s', endpoint, e)
+                finally:
+                    models.db.session.rollback()
+        models.db.session.remove()
+    app.logger.info('Warmed %d pages in %.0f ms', len(warmed), (time.perf_counter() - start) * 1000)
+    return warmed
+
+
+if __name__ == '__main__':
+    from app import configure_templates
+    from config import config
+
+    # A bare app with the same Jinja setup as create_app(), but no database
+    app = Flask('app')
+    app.config.from_object(config[os.environ.get('FLASK_ENV', 'production')])
+    configure_templates(app)
+    count = precompile_templates(app)
+    print(f"✓ Precompiled {count} templates into {app.jinja_env.bytecode_cache.directory}")